@@ -5,24 +5,16 @@ warnings.filterwarnings(
     message="X does not have valid feature names, but StandardScaler was fitted with feature names"
 )
 
+import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import KFold
-from sklearn.model_selection import RepeatedKFold
-from sklearn.metrics import mean_squared_error
-
-from pytabkit import CatBoost_TD_Regressor,XGB_TD_Regressor
-
-from scipy.stats import wilcoxon, ttest_rel            # NEW
-
-from model_config import model_feature_sets   # make sure G1a/G1sw/G1c are in this dict
-from model_utils  import load_and_preprocess_data
 
-import torch
-torch.set_float32_matmul_precision('high')
+# `--replot` redraws the figure from stageA_results.csv on Agg without
+# importing pytabkit / torch / sklearn (imported in __main__ otherwise)
+from fig_render import FigureJob, render_figures, replot_requested, use_agg
+if replot_requested():
+    use_agg()
+import matplotlib.pyplot as plt
 
 # ------------------------------------------------------------------
 # Cross-validated nRMSE (explicit KFold loop)
@@ -43,12 +35,14 @@ torch.set_float32_matmul_precision('high')
 
 #     return np.mean(nrmse_folds), np.std(nrmse_folds)
     
-def cv_nrmse_catboost(X, y, cv, device="cpu"):
+def cv_nrmse_catboost(X, y, cv, device="cpu", params=None):
+    from sklearn.metrics import mean_squared_error
+    from pytabkit import XGB_TD_Regressor
     # nrmse_vals = []
     fold_vals = []                                      # keep fold metrics
     for train_idx, test_idx in cv.split(X):
         # model = CatBoost_TD_Regressor(device=device)
-        model = XGB_TD_Regressor(device=device)
+        model = XGB_TD_Regressor(device=device, **(params or {}))
         model.fit(X.iloc[train_idx], y.iloc[train_idx])
         preds  = model.predict(X.iloc[test_idx])
         rmse   = np.sqrt(mean_squared_error(y.iloc[test_idx], preds))
@@ -58,122 +52,25 @@ def cv_nrmse_catboost(X, y, cv, device="cpu"):
     return np.mean(fold_vals), np.std(fold_vals), fold_vals   #
 
 # ------------------------------------------------------------------
-# 2. define a wilcoxon test function
+# 2. paired tests for every comparison in one batch
 # ------------------------------------------------------------------
-def paired_tests(x, y, name_x, name_y, alpha=0.05):
-    stat_w, p_w = wilcoxon(x, y, alternative="greater")   # “greater” = x > y → y better
-    stat_t, p_t = ttest_rel(x, y, alternative="greater")
-
-    print(f"\n--- {name_x} vs {name_y} ---")
-    print(f"Wilcoxon p = {p_w:.4g}")
-    print(f"Paired-t p = {p_t:.4g}")
-
-    return p_w   # return wilcoxon p for correction
+def paired_tests(results_folds, pairs, n_splits, alpha=0.05):
+    from stat_tests import compare_pairs
+    # "greater" = a > b -> b better; Bonferroni over all pairs on the Wilcoxon p
+    df = compare_pairs(results_folds, pairs, alternative="greater", n_splits=n_splits,
+                       correction="bonferroni", primary="wilcoxon", alpha=alpha)
+    for r in df.itertuples():
+        print(f"\n--- {r.a} vs {r.b} ---")
+        print(f"Wilcoxon p = {r.p_wilcoxon:.4g}")
+        print(f"Paired-t p = {r.p_ttest:.4g}")
+        print(f"Corrected resampled t p = {r.p_corrected_t:.4g}")
+        print(f"Sign-flip permutation p = {r.p_permutation:.4g}")
+    return df
 
 # ------------------------------------------------------------------
-# MAIN
+# Figure 1 bar chart with the preset significance brackets
 # ------------------------------------------------------------------
-if __name__ == "__main__":
-
-    # ----- paths ---------------------------------------------------
-    output_dir = "/work/users/w/a/wayne128/Biomass_ML/Dataset/OutBiomassRaster"
-    file_name  = "unc_chao_fia_data.xlsx"
-    na_vals    = ['1.#QNB', '1.#INF', '-1.#INF', 'nan', 'NaN', 'inf', '-inf']
-
-    # ----- load tabular data --------------------------------------
-    cleaned_df, short_tag = load_and_preprocess_data(file_name, na_vals)
-
-    # ----- # Prepare features and targets variable ----------------------------------------
-    exclude_cols = ['ID', 'PLT_CN', 'MEASYEAR', 'hrdwdDRYBIO_AGac_live', 'sftwdDRYBIO_AGac_live',
-                    'hrdwd_biomass_tons_ha', 'sftwd_biomass_tons_ha', 'total_biomass_tons_ha',
-                    'hrdwd_proportion', 'sftwd_proportion']
-    X = cleaned_df.drop(columns=exclude_cols)
-    # target
-    y_total = cleaned_df["total_biomass_tons_ha"]
-
-    # ----- three Sentinel-2 stacks --------------------------------
-    stageA_ids = ["G1a", "G1sw", "G1c"]
-    desc_map   = {"G1a": "S2_SUM", "G1sw": "SUM+WIN", "G1c": "S2_ALL"}
-
-    # results = {}
-    results_mean_sd = {}
-    results_folds   = {}                                 # store all folds
-    
-    # 10 × 10-fold repeated CV provides the best balance of bias, variance, and runtime 
-    # while still giving each plot ten independent out-of-fold evaluations.
-    rkf = RepeatedKFold(n_splits=10, n_repeats=10, random_state=42)
-
-    for gid in stageA_ids:
-        print(f"\n=== Stage A model {gid} ===")
-        feats = model_feature_sets[gid]
-
-        # drop NaNs in predictors + target
-        X = cleaned_df[feats].dropna()
-        y = y_total.loc[X.index].dropna()
-        X = X.loc[y.index]  
-        
-        print(f"Size after dropping NaNs in predictors & targets: {len(X)}")
-        
-        # scale predictors (CatBoost is fine w/o scaling, but scaling makes metrics comparable)
-        scaler = StandardScaler()
-        X_scaled = pd.DataFrame(
-            scaler.fit_transform(X),
-            index=X.index,
-            columns=X.columns,
-        )
-
-        # mean_nrmse, sd_nrmse = cv_nrmse_catboost(
-        #     X_scaled, y, n_splits=10, device="cpu"  # change to "cuda:0" if GPU
-        # )
-        
-        # mean_nrmse, sd_nrmse = cv_nrmse_catboost(X_scaled, y, rkf, device="cpu")
-        
-        # print(f"nRMSE = {mean_nrmse:.4f} ± {sd_nrmse:.4f}")
-        # results[gid] = (mean_nrmse, sd_nrmse)
-        
-        mean_, sd_, folds = cv_nrmse_catboost(X_scaled, y, rkf, device="cpu")
-        results_mean_sd[gid] = (mean_, sd_)
-        results_folds[gid]   = folds                    
-        print(f"\n=== {gid}  nRMSE = {mean_:.4f} ± {sd_:.4f}")
-
-
-    # ----------------------------------------------------------------
-    # significant test：G1sw vs G1c vs G1a
-    # ----------------------------------------------------------------
-    # prepare per-folder nRMSE（the collected data in previous steps）
-    a  = np.array(results_folds["G1a"])   # length = fold × repeats
-    sw = np.array(results_folds["G1sw"])
-    c  = np.array(results_folds["G1c"])
-
-    # ------------------------------------------------------------------
-    # 3. compare three pairs
-    # ------------------------------------------------------------------
-    p_vals = []
-    p_vals.append( paired_tests(a,  sw, "G1a",  "G1sw") )  # add winter
-    p_vals.append( paired_tests(sw, c, "G1sw", "G1c") )    # add spring and winter
-    p_vals.append( paired_tests(a,  c, "G1a",  "G1c") )    # end to end
-
-
-    # ------------------------------------------------------------------
-    # 4. Bonferroni correction
-    # ------------------------------------------------------------------
-    alpha_raw = 0.05
-    alpha_bon = alpha_raw / len(p_vals)       # = 0.05 / 3 ≈ 0.017
-    
-    print(f"\nBonferroni threshold α_B = {alpha_bon:.3f}")
-    
-    labels = ["G1a→G1sw", "G1sw→G1c", "G1a→G1c"]
-    for lab, p in zip(labels, p_vals):
-        mark = "✓ sig" if p < alpha_bon else "✗ non-sign"
-        print(f"{lab:10s}: p = {p:.4g}  {mark} (α_B)")
-
-
-    ## ----- Figure 1 bar chart -------------------------------------
-    labels = [f"{g}\n({desc_map[g]})" for g in stageA_ids]
-    means  = [results_mean_sd[g][0] for g in stageA_ids]
-    sds    = [results_mean_sd[g][1] for g in stageA_ids]
-    colors  = ['#3E7CB1', '#66A182', '#F5A623']
-
+def plot_seasonal_bars(labels, means, sds, colors):
     x = np.arange(len(labels))
     
     # ─── Draw the bars ─────────────────────────────────────────────
@@ -230,8 +127,198 @@ if __name__ == "__main__":
     ax.plot([x1, x1, x2, x2], [y, y+dh, y+dh, y], lw=1.2, color='blue',linestyle='--')
     ax.text((x1+x2)/2, y+dh*1.0, '***', ha='center', va='bottom', fontsize=12, color='blue')
 
-    plt.tight_layout()
+    fig.tight_layout()
+    return fig
+
+# ------------------------------------------------------------------
+# MAIN
+# ------------------------------------------------------------------
+if __name__ == "__main__":
+
+    # ----- paths ---------------------------------------------------
+    output_dir = "/work/users/w/a/wayne128/Biomass_ML/Dataset/OutBiomassRaster"
+    file_name  = "unc_chao_fia_data.xlsx"
+    na_vals    = ['1.#QNB', '1.#INF', '-1.#INF', 'nan', 'NaN', 'inf', '-inf']
+
+    # ----- three Sentinel-2 stacks --------------------------------
+    stageA_ids = ["G1a", "G1sw", "G1c"]
+    desc_map   = {"G1a": "S2_SUM", "G1sw": "SUM+WIN", "G1c": "S2_ALL"}
+
+    # True: total, hardwood and softwood biomass in one FoldScheduler pass
+    # (same fold plan and scaled matrices); the figure and tests stay on total
+    multi_target = False
+
+    # mean / SD nRMSE per stack (+ workbook tag) for `--replot`
+    results_file = f"{output_dir}/stageA_results.csv"
+    replot = replot_requested()
+    if replot and not os.path.exists(results_file):
+        raise SystemExit(f"--replot: no saved results at {results_file}")
+
+    if replot:
+        saved = pd.read_csv(results_file).set_index("group")
+        results_mean_sd = {g: (saved.loc[g, "mean_nrmse"], saved.loc[g, "sd_nrmse"])
+                           for g in stageA_ids}
+        short_tag = saved["short_tag"].iloc[0]
+    else:
+        from sklearn.preprocessing import StandardScaler
+        from sklearn.model_selection import KFold
+        from sklearn.model_selection import RepeatedKFold
+        from sklearn.metrics import mean_squared_error
+
+        from pytabkit import CatBoost_TD_Regressor,XGB_TD_Regressor
+
+        from stat_tests import compare_pairs
+
+        from model_config import model_feature_sets   # make sure G1a/G1sw/G1c are in this dict
+        from data_cache   import WorkbookCache
+        from fold_plan    import FoldPlan, common_plot_index, quantile_strata
+        from hparam_search import load_best_params, tuned_kwargs
+        from cv_engine     import FoldScheduler
+        from multi_target  import TARGETS, TOTAL, additivity_check, summarize_additivity, target_summary
+
+        import torch
+        torch.set_float32_matmul_precision('high')
+
+        # ----- load tabular data --------------------------------------
+        cleaned_df, short_tag = WorkbookCache(file_name, na_vals).cleaned_frame()
+
+        # ----- # Prepare features and targets variable ----------------------------------------
+        exclude_cols = ['ID', 'PLT_CN', 'MEASYEAR', 'hrdwdDRYBIO_AGac_live', 'sftwdDRYBIO_AGac_live',
+                        'hrdwd_biomass_tons_ha', 'sftwd_biomass_tons_ha', 'total_biomass_tons_ha',
+                        'hrdwd_proportion', 'sftwd_proportion']
+        X = cleaned_df.drop(columns=exclude_cols)
+        # target
+        y_total = cleaned_df["total_biomass_tons_ha"]
+
+        # results = {}
+        results_mean_sd = {}
+        results_folds   = {}                                 # store all folds
+    
+        # 10 × 10-fold repeated CV provides the best balance of bias, variance, and runtime 
+        # while still giving each plot ten independent out-of-fold evaluations.
+        # rkf = RepeatedKFold(n_splits=10, n_repeats=10, random_state=42)
+        # -> one shared, biomass-stratified FoldPlan on the plots complete for all
+        #    three stacks, so the paired tests below compare matched folds
+        plot_index = common_plot_index(
+            cleaned_df, [model_feature_sets[gid] for gid in stageA_ids],
+            cleaned_df[list(TARGETS)] if multi_target else y_total)
+        rkf = FoldPlan.load_or_build(
+            f"{output_dir}/fold_plans", plot_index,
+            n_splits=10, n_repeats=10, random_state=42,
+            strata=quantile_strata(y_total.loc[plot_index], n_bins=10).values)
+        print(f"Fold plan: {len(plot_index)} plots common to all stacks, {rkf}")
+
+        # XGB settings per stack from hparam_search.py, if searched (on its own
+        # fold plan, never on the folds reported here)
+        tuned = load_best_params(f"{output_dir}/hpo/best_params.json", benchmark_plan=rkf)
+        scheduler = FoldScheduler() if multi_target else None
+
+        for gid in stageA_ids:
+            print(f"\n=== Stage A model {gid} ===")
+            feats = model_feature_sets[gid]
+
+            # same plots for every stack (NaNs in predictors + target already excluded)
+            X = cleaned_df.loc[plot_index, feats]
+            y = y_total.loc[plot_index]
+        
+            print(f"Size after dropping NaNs in predictors & targets: {len(X)}")
+        
+            # scale predictors (CatBoost is fine w/o scaling, but scaling makes metrics comparable)
+            scaler = StandardScaler()
+            X_scaled = pd.DataFrame(
+                scaler.fit_transform(X),
+                index=X.index,
+                columns=X.columns,
+            )
+
+            # mean_nrmse, sd_nrmse = cv_nrmse_catboost(
+            #     X_scaled, y, n_splits=10, device="cpu"  # change to "cuda:0" if GPU
+            # )
+        
+            # mean_nrmse, sd_nrmse = cv_nrmse_catboost(X_scaled, y, rkf, device="cpu")
+        
+            # print(f"nRMSE = {mean_nrmse:.4f} ± {sd_nrmse:.4f}")
+            # results[gid] = (mean_nrmse, sd_nrmse)
+        
+            if multi_target:
+                scheduler.add_cv("XGB", gid, XGB_TD_Regressor, X_scaled,
+                                 cleaned_df.loc[plot_index, list(TARGETS)], rkf, scaler=scaler,
+                                 device="cpu", **tuned_kwargs(tuned, "XGB", gid))
+                continue
+
+            mean_, sd_, folds = cv_nrmse_catboost(X_scaled, y, rkf, device="cpu",
+                                                  params=tuned_kwargs(tuned, "XGB", gid))
+            results_mean_sd[gid] = (mean_, sd_)
+            results_folds[gid]   = folds                    
+            print(f"\n=== {gid}  nRMSE = {mean_:.4f} ± {sd_:.4f}")
+
+        if multi_target:
+            scheduler.run()
+            scheduler.report()
+            fold_vals, oof = scheduler.per_target()
+            for gid in stageA_ids:
+                folds = list(fold_vals[("XGB", gid, TOTAL)])
+                results_mean_sd[gid] = (np.mean(folds), np.std(folds))
+                results_folds[gid]   = folds
+
+            per_target = target_summary(fold_vals)
+            print("\nPer-target nRMSE:")
+            print(per_target.to_string(index=False))
+            per_target.to_csv(f"{output_dir}/stageA_multitarget_nrmse.csv", index=False)
+
+            # do hardwood + softwood predictions add up to the total prediction?
+            Y = cleaned_df.loc[plot_index, list(TARGETS)]
+            checks = {gid: additivity_check(Y, scheduler.oof[("XGB", gid)], rkf.assignment, rkf.n_splits)
+                      for gid in stageA_ids}
+            additivity = pd.DataFrame({gid: summarize_additivity(df) for gid, df in checks.items()}).T
+            print("\nAdditivity (|total - Σ components| / mean total):")
+            print(additivity.to_string())
+            pd.concat(checks, names=["group"]).reset_index(level=0).to_csv(
+                f"{output_dir}/stageA_additivity.csv", index=False)
+
+
+        # ----------------------------------------------------------------
+        # significant test：G1sw vs G1c vs G1a
+        # ----------------------------------------------------------------
+        # ------------------------------------------------------------------
+        # 3. compare three pairs
+        # ------------------------------------------------------------------
+        pairs = [("G1a", "G1sw"),    # add winter
+                 ("G1sw", "G1c"),    # add spring and winter
+                 ("G1a", "G1c")]     # end to end
+        tests = paired_tests(results_folds, pairs, n_splits=rkf.n_splits)
+
+        # ------------------------------------------------------------------
+        # 4. Bonferroni correction
+        # ------------------------------------------------------------------
+        alpha_raw = 0.05
+        alpha_bon = alpha_raw / len(pairs)       # = 0.05 / 3 ≈ 0.017
+    
+        print(f"\nBonferroni threshold α_B = {alpha_bon:.3f}")
+    
+        labels = ["G1a→G1sw", "G1sw→G1c", "G1a→G1c"]
+        for lab, r in zip(labels, tests.itertuples()):
+            mark = "✓ sig" if r.significant else "✗ non-sign"
+            print(f"{lab:10s}: p = {r.p_wilcoxon:.4g}  {mark} (α_B)")
+        tests.to_csv(f"{output_dir}/stageA_paired_tests.csv", index=False)
+        pd.DataFrame({"group": stageA_ids,
+                      "mean_nrmse": [results_mean_sd[g][0] for g in stageA_ids],
+                      "sd_nrmse": [results_mean_sd[g][1] for g in stageA_ids],
+                      "short_tag": short_tag}).to_csv(results_file, index=False)
+
+
+    ## ----- Figure 1 bar chart -------------------------------------
+    labels = [f"{g}\n({desc_map[g]})" for g in stageA_ids]
+    means  = [results_mean_sd[g][0] for g in stageA_ids]
+    sds    = [results_mean_sd[g][1] for g in stageA_ids]
+    colors  = ['#3E7CB1', '#66A182', '#F5A623']
+
     fig_out = f"{output_dir}/FigStageA_S2_Seasonal_XGB__{short_tag}.jpg"
-    plt.savefig(fig_out, dpi=550, format="jpeg")
-    plt.show()
+    if replot:
+        render_figures([FigureJob(fig_out, plot_seasonal_bars, (labels, means, sds, colors),
+                                  savefig={"dpi": 550, "format": "jpeg"})])
+    else:
+        fig = plot_seasonal_bars(labels, means, sds, colors)
+        fig.savefig(fig_out, dpi=550, format="jpeg")
+        plt.show()
     print(f"\nFigure saved to: {fig_out}")
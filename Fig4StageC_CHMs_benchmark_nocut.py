@@ -7,28 +7,27 @@ warnings.filterwarnings(
 import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from scipy.stats import ttest_rel
 
-from sklearn.preprocessing import StandardScaler
-from sklearn.preprocessing import KBinsDiscretizer
-from sklearn.model_selection import KFold, RepeatedKFold, RepeatedStratifiedKFold
-from sklearn.metrics import mean_squared_error
-from joblib import Parallel, delayed
+# `--replot` redraws the figures from stageC_results_nocut.csv on Agg; the
+# model stack (pytabkit, sklearn, ...) is imported in __main__ only when
+# the analysis actually runs
+from fig_render   import FigureJob, render_figures, replot_requested, use_agg
+if replot_requested():
+    use_agg()
+import matplotlib.pyplot as plt
 
-from pytabkit import XGB_TD_Regressor, CatBoost_TD_Regressor,\
-    LGBM_TD_Regressor, RealMLP_TD_Regressor
-from model_utils  import load_and_preprocess_data
-from model_config import model_feature_sets
+from bootstrap_ci import bootstrap_ci, ci_error_bars
 
 # ─────────────────────────────────────────────────────────────────────────────
-# Compute mean nRMSE, sd, and percent-change for one feature-group & one estimator
+# Select, align, and scale the predictors of one feature group
 # ─────────────────────────────────────────────────────────────────────────────
-def pct_for_group(gid, Est, baseline_mean, baseline_nrmse_vals, cleaned_df, y, y_binned, cv):
-    # select, align, and scale features for this group
-    Xg = cleaned_df[model_feature_sets[gid]].dropna()
-    yg = y.loc[Xg.index]
-    Xg = Xg.loc[yg.index]
+def prepare_group(gid, cleaned_df, y, y_binned, plot_index):
+    from sklearn.preprocessing import StandardScaler
+    from model_config import model_feature_sets
+
+    # every group uses the same plots (the fold plan's common index)
+    Xg = cleaned_df.loc[plot_index, model_feature_sets[gid]]
+    yg = y.loc[plot_index]
 
     scaler_g = StandardScaler().fit(Xg)
     Xg_scaled = pd.DataFrame(
@@ -38,39 +37,16 @@ def pct_for_group(gid, Est, baseline_mean, baseline_nrmse_vals, cleaned_df, y, y
     
     # Align y_binned to this group's index
     y_stratify_g = y_binned.loc[Xg_scaled.index].values
+    return Xg_scaled, yg, y_stratify_g, scaler_g
 
-    mean_nrmse, sd_nrmse, nrmse_vals = cv_nrmse(Est, Xg_scaled, yg, cv, y_stratify=y_stratify_g, cv_n_jobs=-1, device="cpu")
+# ─────────────────────────────────────────────────────────────────────────────
+# Compute mean nRMSE, sd, and percent-change for one feature-group & one estimator
+# ─────────────────────────────────────────────────────────────────────────────
+def pct_for_group(gid, nrmse_vals, baseline_mean, p_val):
+    mean_nrmse, sd_nrmse = np.mean(nrmse_vals), np.std(nrmse_vals)
     pct = (mean_nrmse - baseline_mean) / baseline_mean * 100
-    
-    # Paired t-test on fold-level nRMSE values
-    t_stat, p_val = ttest_rel(nrmse_vals, baseline_nrmse_vals)
-    
     return gid, pct, mean_nrmse, sd_nrmse, p_val
     
-# ─────────────────────────────────────────────────────────────────────────────
-# Compute nRMSE on one fold
-# ─────────────────────────────────────────────────────────────────────────────
-def compute_fold_nrmse(train_idx, test_idx, X, y, model_cls, model_kwargs):
-    model = model_cls(**model_kwargs)
-    model.fit(X.iloc[train_idx], y.iloc[train_idx])
-    preds = model.predict(X.iloc[test_idx])
-    rmse = np.sqrt(mean_squared_error(y.iloc[test_idx], preds))
-    return rmse / y.iloc[test_idx].mean()
-
-# ─────────────────────────────────────────────────────────────────────────────
-# Cross-validated nRMSE (with parallelization)
-# ─────────────────────────────────────────────────────────────────────────────
-def cv_nrmse(model_cls, X, y, cv, y_stratify=None, cv_n_jobs=-1, **model_kwargs):
-    if y_stratify is not None:
-        splits = cv.split(X, y_stratify)
-    else:
-        splits = cv.split(X)
-        
-    tasks = (delayed(compute_fold_nrmse)(train_idx, test_idx, X, y, model_cls, model_kwargs)
-             for train_idx, test_idx in splits)
-    nrmse_vals = Parallel(n_jobs=cv_n_jobs)(tasks)
-    return np.mean(nrmse_vals), np.std(nrmse_vals), nrmse_vals
-
 # ─────────────────────────────────────────────────────────────────────────────
 # Plot function
 # ─────────────────────────────────────────────────────────────────────────────
@@ -193,6 +169,19 @@ def plot_pct_changes_without_title(lab, labName, groups, pct_changes, pct_sds, l
     return fig, ax
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# Combined 2x2 figure, one panel per estimator (in combined_data order)
+# ─────────────────────────────────────────────────────────────────────────────
+def plot_combined(groups, combined_data, labels):
+    fig, axes = plt.subplots(2, 2, figsize=(12, 8), sharey=True)
+    axes = axes.flatten()
+    for i, (labname, (pct_changes, pct_sds, p_values)) in enumerate(combined_data.items()):
+        lab = chr(ord('a') + i)  # Convert number 0, 1, 2, 3 to A, B, C, D
+        plot_pct_changes_without_title(lab, labname, groups, pct_changes, pct_sds, labels, p_values, ax=axes[i])
+    fig.tight_layout()
+    return fig
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # MAIN: compute and plot percent change in nRMSE for Stage C
 # ─────────────────────────────────────────────────────────────────────────────
@@ -202,32 +191,6 @@ if __name__ == "__main__":
     output_dir = "/work/users/w/a/wayne128/Biomass_ML/Dataset/OutBiomassRaster/Fig4StageC_CHM_nocut"
     os.makedirs(output_dir, exist_ok=True)
 
-    # --- load data ---
-    cleaned_df, _ = load_and_preprocess_data(FILE_NAME, na_values=NA_VALUES)
-
-    # --- Exclude cut plots (TRTCD = 10 in any condition) ---
-    fia_cond  = pd.read_excel(FILE_NAME, sheet_name="fia_cond", na_values=NA_VALUES)
-    trt_cols  = [c for c in ['TRTCD1', 'TRTCD2', 'TRTCD3'] if c in fia_cond.columns]
-    cut_plt_cn = set(fia_cond.loc[fia_cond[trt_cols].isin([10]).any(axis=1), 'PLT_CN'])
-    n_before  = len(cleaned_df)
-    cleaned_df = cleaned_df[~cleaned_df['PLT_CN'].isin(cut_plt_cn)].copy()
-    print(f"Cut-plot filter: removed {n_before - len(cleaned_df)} plots "
-          f"(TRTCD=10). Remaining: {len(cleaned_df)}")
-
-    y = cleaned_df["total_biomass_tons_ha"]
-
-    # --- Bin y for stratification ---
-    n_bins = 10  # Recommended starting point; adjust as needed
-    binner = KBinsDiscretizer(n_bins=n_bins, encode='ordinal', strategy='quantile')
-    y_binned_array = binner.fit_transform(y.values.reshape(-1, 1)).flatten()
-    y_binned = pd.Series(y_binned_array, index=y.index)
-    
-    # --- CV scheme ---
-    # cv = KFold(n_splits=5, shuffle=True, random_state=42)
-    # cv = RepeatedKFold(n_splits=5, n_repeats=10, random_state=42)
-    cv = RepeatedStratifiedKFold(n_splits=5, n_repeats=10, random_state=42)
-    
-
     # --- feature groups for Stage C ---
     groups = ["G12",
         "G17",
@@ -255,27 +218,10 @@ if __name__ == "__main__":
     # baseline = BASE_RS = G16
     base_id = "G16"
 
-    # --- scale BASE_RS predictors once ---
-    X_base = cleaned_df[model_feature_sets[base_id]].dropna()
-    y_base = pd.Series(y.loc[X_base.index])
-    X_base = X_base.loc[y_base.index]
-    scaler = StandardScaler().fit(X_base)
-    Xb_scaled = pd.DataFrame(
-        scaler.transform(X_base),
-        index=X_base.index,
-        columns=X_base.columns
-    )
-    
+    # error bars of the percent change: 95% bootstrap CI over plots resampled
+    # within MEASYEAR from the OOF predictions ("ci"), or fold SD ("sd")
+    error_bars = "ci"
 
-    ###############################################
-    # --- define your four regressors in a dict ---
-    estimators = {
-        "XGB"     : XGB_TD_Regressor,
-        "CatBoost": CatBoost_TD_Regressor,
-        "LGBM"    : LGBM_TD_Regressor,
-        "RealMLP" : RealMLP_TD_Regressor
-    }
-    
     # collect all results
     all_results = []
     combined_data = {}  # To store per-estimator data for combined plot
@@ -283,34 +229,209 @@ if __name__ == "__main__":
     # Check if results file already exists
     results_file = f"{output_dir}/stageC_results_nocut.csv"
     run_analysis = not os.path.exists(results_file)  # or use your preferred condition
+    if replot_requested():
+        if run_analysis:
+            raise SystemExit(f"--replot: no saved results at {results_file}")
+        run_analysis = False
 
     if run_analysis:
         print("Running analysis and saving results...")
+        from sklearn.preprocessing import StandardScaler
+        from sklearn.model_selection import KFold, RepeatedKFold, RepeatedStratifiedKFold
+
+        from pytabkit import XGB_TD_Regressor, CatBoost_TD_Regressor,\
+            LGBM_TD_Regressor, RealMLP_TD_Regressor
+        from model_config import model_feature_sets
+        from fold_store   import FoldResultStore
+        from oof_store    import OOFStore
+        from model_registry import ModelRegistry
+        from cv_engine    import FoldScheduler
+        from adaptive_cv  import AdaptiveRule, run_adaptive
+        from fold_profiler import print_profile_summary
+        from fold_plan    import FoldPlan, common_plot_index, quantile_strata
+        from stat_tests   import compare_pairs
+        from data_cache   import WorkbookCache
+        from hparam_search import load_best_params, tuned_kwargs
+        from task_queue   import FileQueueBackend
+        from block_search import DEFAULT_BLOCKS, resolve_blocks
+        from fold_attribution import FoldAttribution, summarize_attribution
+        from binned_cache import BinnedCache, quantizes
+
+        # --- load data (columnar cache, rebuilt only when the workbook changes) ---
+        workbook = WorkbookCache(FILE_NAME, na_values=NA_VALUES)
+        cleaned_df, _ = workbook.cleaned_frame()
+
+        # --- Exclude cut plots (TRTCD = 10 in any condition) ---
+        cut_plt_cn = workbook.cut_plot_cn()
+        n_before  = len(cleaned_df)
+        cleaned_df = cleaned_df[~cleaned_df['PLT_CN'].isin(cut_plt_cn)].copy()
+        print(f"Cut-plot filter: removed {n_before - len(cleaned_df)} plots "
+              f"(TRTCD=10). Remaining: {len(cleaned_df)}")
+
+        y = cleaned_df["total_biomass_tons_ha"]
+
+        # --- CV scheme ---
+        # cv = KFold(n_splits=5, shuffle=True, random_state=42)
+        # cv = RepeatedKFold(n_splits=5, n_repeats=10, random_state=42)
+        # cv = RepeatedStratifiedKFold(n_splits=5, n_repeats=10, random_state=42)
+        # -> replaced by one shared FoldPlan (same scheme) built below on the
+        #    plots that are complete for the baseline and every group
     
+
+        # --- one fold plan for every estimator and group (matched folds) ---
+        plot_index = common_plot_index(
+            cleaned_df, [model_feature_sets[gid] for gid in [base_id] + groups], y)
+        # --- Bin y for stratification: quantiles of the plan's plots, as in
+        #     Stage A, run_experiments.py and hparam_search.py (same plan) ---
+        n_bins = 10  # Recommended starting point; adjust as needed
+        y_binned = quantile_strata(y.loc[plot_index], n_bins=n_bins)
+        cv = FoldPlan.load_or_build(
+            f"{output_dir}/fold_plans", plot_index,
+            n_splits=5, n_repeats=10, random_state=42,
+            strata=y_binned.values)
+        print(f"Fold plan: {len(plot_index)} plots common to all groups, {cv}")
+
+        ###############################################
+        # --- define your four regressors in a dict ---
+        estimators = {
+            "XGB"     : XGB_TD_Regressor,
+            "CatBoost": CatBoost_TD_Regressor,
+            "LGBM"    : LGBM_TD_Regressor,
+            "RealMLP" : RealMLP_TD_Regressor
+        }
+    
+        # per-fold results survive preemption; a rerun only fits missing folds
+        fold_store = FoldResultStore(f"{output_dir}/fold_cache")
+
+        # None = all 10 repeats of the fold plan for every run; an AdaptiveRule
+        # adds repeats in batches until the CI of the percent change vs BASE_RS
+        # is narrow enough, e.g. AdaptiveRule(rel_tol=None, diff_tol=1.0)
+        adaptive = None
+
+        # per-fold fit/predict times, CPU, peak RSS, queue wait -> JSON lines
+        profile_log = f"{output_dir}/fold_profile.jsonl"   # None to switch off
+
+        # None = fold models are discarded after scoring; a ModelRegistry keeps
+        # every fitted fold model (+ scaler), e.g. ModelRegistry(f"{output_dir}/models").
+        # refit_full (needs the registry) also fits each (estimator, group) once
+        # on all plots for mapping (python raster_predict.py predict <models>/<key>.joblib ...)
+        model_registry = None
+        refit_full = False
+
+        # separate opt-in pass over the registry's fold models: permutation
+        # importance + tree SHAP per predictor and per block (CHM25, PROFILE,
+        # ...), cached per fold model. Needs model_registry; once the models
+        # exist, a rerun with run_attribution = True only adds this pass
+        run_attribution = False
+        if run_attribution and model_registry is None:
+            raise SystemExit("run_attribution needs a model_registry to read the fold models from")
+
+        # searched settings per (estimator, group) from hparam_search.py, if any
+        # (none: the pytabkit tuned defaults); same file as Stage A and the
+        # "tuned_params" of experiments.json
+        tuned = load_best_params(f"{os.path.dirname(output_dir)}/hpo/best_params.json",
+                                 benchmark_plan=cv)
+
+        # None = local process pool; a FileQueueBackend on /work sends the folds
+        # to workers on other nodes (python task_queue.py worker <queue> --procs N)
+        backend = None   # FileQueueBackend(f"{output_dir}/queue")
+
+        # True: the four estimators of a fold share one task (rows sliced once,
+        # fitted in turn); "threads": fitted side by side in the summed budget
+        fuse_estimators = False
+
+        # e.g. 255: XGB / CatBoost / LGBM are fitted on per-group bin codes
+        # computed once and cached (python binned_cache.py checks the
+        # accuracy against the float path); None = float predictors
+        quantize_gbdt = None
+        binned = BinnedCache(f"{output_dir}/binned_cache")
+
+        # 1) one flat task queue over every (estimator × group × fold),
+        #    baseline BASE_RS included; each worker gets an estimator-specific
+        #    thread budget instead of nesting Parallel(n_jobs=-1) per group
+        design = {gid: prepare_group(gid, cleaned_df, y, y_binned, plot_index)
+                  for gid in [base_id] + groups}
+        scheduler = FoldScheduler(n_cores=-1, store=fold_store, profile_log=profile_log,
+                                  registry=model_registry, backend=backend,
+                                  fuse=fuse_estimators, quantize=quantize_gbdt,
+                                  binned_cache=binned)
+        if refit_full:
+            for name, Est in estimators.items():
+                for gid, (Xg_scaled, yg, y_stratify_g, scaler_g) in design.items():
+                    scheduler.add_full(name, gid, Est, Xg_scaled, yg, y_stratify=y_stratify_g,
+                                       scaler=scaler_g, device="cpu",
+                                       **tuned_kwargs(tuned, name, gid))
+        if adaptive is None:
+            for name, Est in estimators.items():
+                for gid, (Xg_scaled, yg, y_stratify_g, scaler_g) in design.items():
+                    scheduler.add_cv(name, gid, Est, Xg_scaled, yg, cv, y_stratify=y_stratify_g,
+                                     scaler=scaler_g, device="cpu",
+                                     **tuned_kwargs(tuned, name, gid))
+            fold_nrmse = scheduler.run()
+            n_repeats_used = {run: cv.n_repeats for run in fold_nrmse}
+        else:
+            specs = [{"run": (name, gid), "model_cls": Est,
+                      "X": Xg_scaled, "y": yg, "y_stratify": y_stratify_g,
+                      "scaler": scaler_g,
+                      "model_kwargs": dict(device="cpu", **tuned_kwargs(tuned, name, gid)),
+                      "baseline": (name, base_id) if gid != base_id else None}
+                     for name, Est in estimators.items()
+                     for gid, (Xg_scaled, yg, y_stratify_g, scaler_g) in design.items()]
+            fold_nrmse, adaptive_info = run_adaptive(scheduler, specs, cv, adaptive)
+            n_repeats_used = {run: meta["n_repeats"] for run, meta in adaptive_info.items()}
+            print(f"Adaptive CV {adaptive}: repeats used "
+                  + ", ".join(f"{n}/{g}={r}" for (n, g), r in n_repeats_used.items()))
+        scheduler.report()
+        if profile_log and os.path.exists(profile_log):
+            print_profile_summary(profile_log)
+
+        # out-of-fold predictions (repeats × plots) for re-scoring without
+        # refits: python oof_metrics.py <output_dir>/oof --by MEASYEAR
+        extra = {"PLT_CN": cleaned_df.loc[plot_index, 'PLT_CN'].values}
+        if 'MEASYEAR' in cleaned_df.columns:
+            extra["MEASYEAR"] = cleaned_df.loc[plot_index, 'MEASYEAR'].values
+        OOFStore(f"{output_dir}/oof").save_runs(cv, y.loc[plot_index], scheduler.oof, extra)
+
+        if run_attribution:
+            attr = FoldAttribution(model_registry, cache=f"{output_dir}/attribution_cache")
+            blocks = resolve_blocks(DEFAULT_BLOCKS, model_feature_sets)
+            for name, Est in estimators.items():
+                for gid, (Xg_scaled, yg, y_stratify_g, _) in design.items():
+                    Xa = (binned.get(Xg_scaled, quantize_gbdt)[0] if quantizes(Est, quantize_gbdt)
+                          else Xg_scaled)
+                    attr.add(name, gid, Xa, yg, cv, y_stratify=y_stratify_g, blocks=blocks)
+            attribution = attr.run()
+            attribution.to_csv(f"{output_dir}/stageC_attribution_folds.csv", index=False)
+            attribution = summarize_attribution(attribution)
+            attribution.to_csv(f"{output_dir}/stageC_attribution.csv", index=False)
+            with pd.option_context("display.width", 160, "display.max_rows", 200):
+                print(attribution[attribution["unit_type"] == "block"].to_string(index=False))
+
+        # paired tests of every group against BASE_RS for all estimators in
+        # one batch (adaptive CV: matched leading folds); p_value stays the
+        # paired t, the other tests go to the CSV
+        tests = compare_pairs(
+            fold_nrmse, [((name, gid), (name, base_id)) for name in estimators for gid in groups],
+            n_splits=cv.n_splits, correction="holm", family=[n for n in estimators for _ in groups])
+        tests = {a: r for a, r in zip(tests["a"], tests.to_dict("records"))}
+
+        # paired bootstrap CIs of nRMSE and of the percent change vs BASE_RS
+        ci = bootstrap_ci(y.loc[plot_index], scheduler.oof, cv.assignment, cv.n_splits,
+                          baseline=base_id, strata=extra.get("MEASYEAR"))
+        ci = {r: row for r, row in zip(ci["run"], ci.to_dict("records"))}
+
         for name, Est in estimators.items():
-            # 1) compute baseline for this model
-            # baseline_nrmse = cv_nrmse(Est, Xb_scaled, y_base, cv, device="cpu")
-            
-            # correct: pull out only the mean (and optionally sd if you need it)
-            # Align y_binned for baseline
-            y_stratify_base = y_binned.loc[Xb_scaled.index].values
-            baseline_mean, baseline_sd, baseline_nrmse_vals = cv_nrmse(
-                Est, Xb_scaled, y_base, cv,
-                y_stratify=y_stratify_base,
-                cv_n_jobs=-1, device="cpu"
-            )
+            baseline_nrmse_vals = fold_nrmse[(name, base_id)]
+            baseline_mean = np.mean(baseline_nrmse_vals)
+            baseline_sd   = np.std(baseline_nrmse_vals)
             print(f"{name} baseline nRMSE = {baseline_mean:.4f} ± {baseline_sd:.4f}")
     
-            
-            # 2) compute pct_changes in parallel over groups
-            #    here n_jobs controls # of concurrent group‐jobs
-            results = Parallel(n_jobs=len(groups))(
-                delayed(pct_for_group)(
-                    gid, Est, baseline_mean, baseline_nrmse_vals,
-                    cleaned_df, y, y_binned, cv
-                )
+            # 2) compute pct_changes over groups against the baseline folds
+            results = [
+                pct_for_group(gid, fold_nrmse[(name, gid)],
+                              baseline_mean, tests[(name, gid)]["p_ttest"])
                 for gid in groups
-            )
+            ]
             
             #save the result and export to csv
             # all_results.extend(results)
@@ -322,7 +443,16 @@ if __name__ == "__main__":
                   "pct_change": pct,
                   "mean_nrmse": mean_nrmse,
                   "sd_nrmse": sd_nrmse,
-                  "p_value": p_val
+                  "p_value": p_val,
+                  "p_wilcoxon": tests[(name, gid)]["p_wilcoxon"],
+                  "p_corrected_t": tests[(name, gid)]["p_corrected_t"],
+                  "p_permutation": tests[(name, gid)]["p_permutation"],
+                  "p_value_holm": tests[(name, gid)]["p_ttest_adj"],
+                  "nrmse_ci_lo": ci[(name, gid)]["nrmse_ci_lo"],
+                  "nrmse_ci_hi": ci[(name, gid)]["nrmse_ci_hi"],
+                  "pct_ci_lo": ci[(name, gid)]["pct_ci_lo"],
+                  "pct_ci_hi": ci[(name, gid)]["pct_ci_hi"],
+                  "n_repeats": n_repeats_used[(name, gid)]
                 })
             
             
@@ -335,16 +465,12 @@ if __name__ == "__main__":
             p_values        = [results_dict[gid][3] for gid in groups]
             
             pct_sds = [sd / baseline_mean * 100 for sd in raw_nrmse_sds]
+            if error_bars == "ci":
+                pct_sds = ci_error_bars(pct_changes,
+                                        [ci[(name, gid)]["pct_ci_lo"] for gid in groups],
+                                        [ci[(name, gid)]["pct_ci_hi"] for gid in groups])
     
-            # 3) plot individual
-            fig, ax = plot_pct_changes(name, groups, pct_changes, pct_sds, labels, p_values)
-            fig_out = f"{output_dir}/Fig4StageC_{name}_5cv_benchmark_nocut.png"
-            fig.savefig(fig_out, dpi=400)
-            plt.close(fig)
-            print(f"Saved Figure to: {fig_out}\n")
-            
-            
-            # Store for combined plot
+            # 3) individual + combined figures are rendered at the end
             combined_data[name] = (pct_changes, pct_sds, p_values)
             
         # 4) turn saved result into DataFrame 
@@ -378,25 +504,20 @@ if __name__ == "__main__":
             pct_changes = [results_dict[gid][0] for gid in groups]
             pct_sds = [results_dict[gid][1] for gid in groups]
             p_values = [results_dict[gid][2] for gid in groups]
+            if error_bars == "ci" and "pct_ci_lo" in estimator_data:
+                by_gid = estimator_data.set_index('group')
+                pct_sds = ci_error_bars(pct_changes, by_gid.loc[groups, 'pct_ci_lo'],
+                                        by_gid.loc[groups, 'pct_ci_hi'])
             
             combined_data[estimator] = (pct_changes, pct_sds, p_values)
 
     
-    # 5) Combined 2x2 subplot figure at the end
-    fig, axes = plt.subplots(2, 2, figsize=(12, 8), sharey=True)
-    axes = axes.flatten()
-    estimator_names = list(estimators.keys())
-    colors = ['#3E7CB1', '#66A182', '#F5A623', '#D65A31', '#8C564B']  # Shared colors
-
-    # Re-use data from all_results
-    for i, labname in enumerate(estimator_names):
-        pct_changes, pct_sds, p_values = combined_data[labname]
-        lab = chr(ord('a') + i)  # Convert number 0, 1, 2, 3 to A, B, C, D
-        plot_pct_changes_without_title(lab, labname, groups, pct_changes, pct_sds, labels, p_values, ax=axes[i])
-
-    plt.tight_layout()
+    # 5) individual figures and the combined 2x2 figure, rendered in parallel
+    jobs = [FigureJob(f"{output_dir}/Fig4StageC_{name}_5cv_benchmark_nocut.png", plot_pct_changes,
+                      (name, groups, pct_changes, pct_sds, labels, p_values))
+            for name, (pct_changes, pct_sds, p_values) in combined_data.items()]
     combined_fig_out = f"{output_dir}/Fig4StageC_combined_2x2_nocut.png"
-    plt.savefig(combined_fig_out, dpi=400)
-    plt.close()
+    jobs.append(FigureJob(combined_fig_out, plot_combined, (groups, combined_data, labels)))
+    for fig_out in render_figures(jobs)[:-1]:
+        print(f"Saved Figure to: {fig_out}")
     print(f"Saved Combined Figure to: {combined_fig_out}")
-        
\ No newline at end of file
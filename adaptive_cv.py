@@ -0,0 +1,111 @@
+import numpy as np
+from scipy.stats import t as student_t
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Adaptive repeated CV
+#
+# Instead of always fitting all n_repeats × n_splits folds of the fold plan,
+# repeats are added in batches (in plan order, so the folds used are fully
+# determined by the number of repeats) until the confidence interval is
+# tight enough:
+#   rel_tol  – CI half-width of the mean nRMSE, relative to the mean
+#   diff_tol – CI half-width of the paired percent change against the
+#              baseline run, in percentage points
+# The repeat means are the independent units of the CI. A run also stops
+# once max_repeats is reached; the number of repeats used is reported per run.
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def repeat_means(fold_vals, n_splits):
+    fold_vals = np.asarray(fold_vals, dtype=float)
+    n_rep = len(fold_vals) // n_splits
+    return fold_vals[:n_rep * n_splits].reshape(n_rep, n_splits).mean(axis=1)
+
+
+class AdaptiveRule:
+    def __init__(self, rel_tol=0.01, diff_tol=None, batch_repeats=2, min_repeats=3,
+                 max_repeats=None, confidence=0.95):
+        self.rel_tol = rel_tol
+        self.diff_tol = diff_tol
+        self.batch_repeats = int(batch_repeats)
+        self.min_repeats = int(min_repeats)
+        self.max_repeats = max_repeats
+        self.confidence = confidence
+
+    def __repr__(self):
+        return (f"AdaptiveRule(rel_tol={self.rel_tol}, diff_tol={self.diff_tol}, "
+                f"batch_repeats={self.batch_repeats}, min_repeats={self.min_repeats}, "
+                f"max_repeats={self.max_repeats}, confidence={self.confidence})")
+
+    def halfwidth(self, x):
+        n = len(x)
+        if n < 2:
+            return np.inf
+        q = student_t.ppf(0.5 + self.confidence / 2, n - 1)
+        return q * np.std(x, ddof=1) / np.sqrt(n)
+
+    def status(self, fold_vals, n_splits, baseline_vals=None):
+        reps = repeat_means(fold_vals, n_splits)
+        mean = reps.mean()
+        rel_hw = self.halfwidth(reps) / mean
+        info = {"n_repeats": len(reps), "rel_halfwidth": rel_hw}
+        ok = self.rel_tol is None or rel_hw <= self.rel_tol
+
+        if self.diff_tol is not None and baseline_vals is not None:
+            m = min(len(fold_vals), len(baseline_vals))
+            base = repeat_means(baseline_vals[:m], n_splits)
+            pct_diff = (reps[:len(base)] - base) / base.mean() * 100
+            diff_hw = self.halfwidth(pct_diff)
+            info["diff_halfwidth_pct"] = diff_hw
+            ok = ok and diff_hw <= self.diff_tol
+        return ok, info
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Drive a FoldScheduler batch by batch
+#
+# specs: list of dicts with run, model_cls, X, y, y_stratify, model_kwargs and
+# optionally baseline (run key of another spec) or baseline_vals (array).
+# All runs still active share each scheduler round, so the grid stays flat.
+# ─────────────────────────────────────────────────────────────────────────────
+def run_adaptive(scheduler, specs, plan, rule):
+    if not hasattr(plan, "n_splits") or not hasattr(plan, "n_repeats"):
+        raise ValueError("adaptive CV needs a repeat-structured fold plan (FoldPlan)")
+    n_splits = plan.n_splits
+    max_rep = min(rule.max_repeats or plan.n_repeats, plan.n_repeats)
+
+    by_run = {s["run"]: s for s in specs}
+    n_rep = {run: 0 for run in by_run}
+    info = {}
+    active = set(by_run)
+
+    while active:
+        for run in active:
+            s = by_run[run]
+            target = min(max(n_rep[run] + rule.batch_repeats, rule.min_repeats), max_rep)
+            scheduler.add_cv(*run, s["model_cls"], s["X"], s["y"], plan,
+                             y_stratify=s.get("y_stratify"), scaler=s.get("scaler"),
+                             folds=range(n_rep[run] * n_splits, target * n_splits),
+                             **s.get("model_kwargs", {}))
+            n_rep[run] = target
+
+        results = scheduler.run()
+        vals = {run: results[run][:n_rep[run] * n_splits] for run in by_run}
+
+        for run in list(active):
+            s = by_run[run]
+            base = vals[s["baseline"]] if s.get("baseline") else s.get("baseline_vals")
+            ok, info[run] = rule.status(vals[run], n_splits, base)
+            if ok or n_rep[run] >= max_rep:
+                active.discard(run)
+
+        # a baseline keeps adding repeats while any run compared to it does,
+        # so the paired differences always cover matched folds
+        for run in list(active):
+            base = by_run[run].get("baseline")
+            if base and n_rep[base] < max_rep:
+                active.add(base)
+
+    for run, meta in info.items():
+        meta["n_repeats"] = n_rep[run]
+    return vals, info
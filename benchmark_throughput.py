@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+import contextlib
+
+from synthetic_fia   import make_synthetic_fia
+from fold_plan       import FoldPlan, common_plot_index, quantile_strata
+from cv_engine       import FoldScheduler
+from run_experiments import run as run_experiments, design_matrix, resolve_estimator
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Throughput benchmark on synthetic FIA-like data
+#
+# For each data size the suite times
+#   * per-estimator CV on the G16 (BASE_RS) design matrix, and
+#   * the full Stage A + Stage C pipeline from experiments.json (fold plans,
+#     scaling, one scheduler over every unique job, statistics, figures),
+# each with a reduced number of repeats. It reports plots/second (training
+# rows pushed through fit per second) and folds/hour, and compares against a
+# stored baseline: any case slower than baseline by more than --tolerance is
+# flagged and the script exits non-zero.
+#
+#   python benchmark_throughput.py --sizes 1e2 1e3 1e4 --save-baseline
+#   python benchmark_throughput.py --sizes 1e2 1e3 1e4          # check
+# ─────────────────────────────────────────────────────────────────────────────
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+
+
+def _throughput(case, n_plots, n_folds, n_train_rows, wall_s):
+    return {
+        "case"          : case,
+        "n_plots"       : int(n_plots),
+        "n_folds"       : int(n_folds),
+        "wall_s"        : wall_s,
+        "plots_per_s"   : n_train_rows / wall_s if wall_s > 0 else float("nan"),
+        "folds_per_hour": n_folds / wall_s * 3600 if wall_s > 0 else float("nan"),
+    }
+
+
+def bench_estimators(df, config, n_splits, n_repeats, n_cores, base_id="G16"):
+    from model_config import model_feature_sets
+    y = df[config.get("target", "total_biomass_tons_ha")]
+    plot_index = common_plot_index(df, [model_feature_sets[base_id]], y)
+    plan = FoldPlan.build(plot_index, n_splits, n_repeats, 42,
+                          strata=quantile_strata(y.loc[plot_index]).values)
+    X = design_matrix(df, plot_index, base_id)
+    n_train_rows = sum(len(tr) for tr, _ in plan.split())
+
+    rows = []
+    for name, cls_name in config["estimators"].items():
+        scheduler = FoldScheduler(n_cores=n_cores)
+        scheduler.add_cv(name, base_id, resolve_estimator(cls_name), X, y.loc[plot_index], plan,
+                         **config.get("model_kwargs", {}))
+        t0 = time.perf_counter()
+        scheduler.run()
+        rows.append(_throughput(f"cv/{name}/{base_id}", len(plot_index), len(plan),
+                                n_train_rows, time.perf_counter() - t0))
+    return rows
+
+
+def bench_pipeline(df, cut_plt_cn, config, n_repeats, n_cores):
+    config = json.loads(json.dumps(config))
+    config["n_cores"] = n_cores
+    config["profile"] = False
+    for stage in config["stages"]:
+        stage.setdefault("cv", {})["n_repeats"] = n_repeats
+    n_folds = sum(s["cv"].get("n_splits", 5) * n_repeats * len(s["estimators"])
+                  * (len(s["groups"]) + bool(s.get("baseline"))) for s in config["stages"])
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        config["output_dir"] = out_dir
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            run_experiments(config, population=(df, cut_plt_cn))
+        wall = time.perf_counter() - t0
+    # training rows per fold ~ (k-1)/k of the population
+    k = config["stages"][-1]["cv"].get("n_splits", 5)
+    return [_throughput("pipeline/stageA+C", len(df), n_folds, n_folds * len(df) * (k - 1) / k, wall)]
+
+
+def compare_to_baseline(rows, baseline, tolerance):
+    ref = {(r["case"], r["n_plots"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for r in rows:
+        b = ref.get((r["case"], r["n_plots"]))
+        if b is None:
+            r["vs_baseline"] = None
+            continue
+        r["vs_baseline"] = r["folds_per_hour"] / b["folds_per_hour"]
+        if r["vs_baseline"] < 1 - tolerance:
+            regressions.append(r)
+    return regressions
+
+
+def print_table(rows):
+    print(f"{'case':32s} {'plots':>9s} {'folds':>6s} {'wall_s':>9s} {'plots/s':>12s} "
+          f"{'folds/h':>11s} {'vs base':>8s}")
+    for r in rows:
+        vs = "" if r.get("vs_baseline") is None else f"{r['vs_baseline']:.2f}x"
+        print(f"{r['case']:32s} {r['n_plots']:9d} {r['n_folds']:6d} {r['wall_s']:9.2f} "
+              f"{r['plots_per_s']:12.0f} {r['folds_per_hour']:11.0f} {vs:>8s}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput benchmark on synthetic FIA data")
+    parser.add_argument("--config", default="experiments.json")
+    parser.add_argument("--sizes", nargs="+", type=float, default=[1e2, 1e3, 1e4])
+    parser.add_argument("--n-splits", type=int, default=5)
+    parser.add_argument("--n-repeats", type=int, default=1)
+    parser.add_argument("--n-cores", type=int, default=-1)
+    parser.add_argument("--skip-pipeline", action="store_true")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown vs baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+
+    rows = []
+    for size in args.sizes:
+        t0 = time.perf_counter()
+        df, cut_plt_cn = make_synthetic_fia(int(size), seed=0)
+        print(f"n_plots={int(size):,}: generated in {time.perf_counter() - t0:.2f} s")
+        rows += bench_estimators(df, config, args.n_splits, args.n_repeats, args.n_cores)
+        if not args.skip_pipeline:
+            rows += bench_pipeline(df, cut_plt_cn, config, args.n_repeats, args.n_cores)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(rows, json.load(f), args.tolerance)
+    print_table(rows)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                       "host": platform.node(), "n_cores": args.n_cores,
+                       "python": sys.version.split()[0], "results": rows}, f, indent=2)
+        print(f"Saved baseline to: {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} case(s) slower than baseline by more than {args.tolerance:.0%}:")
+        for r in regressions:
+            print(f"  {r['case']} @ {r['n_plots']} plots: {r['vs_baseline']:.2f}x")
+        sys.exit(1)
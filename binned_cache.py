@@ -0,0 +1,298 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Pre-binned (quantized) design matrices for the GBDT estimators
+#
+# A feature group's scaled design matrix is quantized once: per feature, up
+# to max_bins - 1 quantile edges of its values; a value's bin code is the
+# number of edges <= it (uint8 for max_bins <= 255, uint16 otherwise; the
+# dtype's largest value marks a missing value). Trees only compare a feature
+# with thresholds, so XGB / LGBM / CatBoost fitted on the codes see at most
+# max_bins distinct values per feature: their own histogram / border
+# construction becomes exact and cheap, and it is the same for every fold
+# and every GBDT estimator. Edges depend on the predictors only, never on y.
+#
+# Limitation: the codes reach the estimators as float32 frames, because
+# pytabkit's *_TD_Regressor fit(X, y) takes arrays, not a QuantileDMatrix,
+# lightgbm Dataset or quantized catboost Pool. Each library therefore still
+# runs its own sketch / border pass on every fold; it only gets cheaper (few
+# distinct values per feature), it is not removed. validate_quantization
+# reports how much time that pass actually takes on float vs binned input.
+#
+# Codes and edges are cached on disk per (design matrix, max_bins):
+#     <root>/<hash>_b<max_bins>.npz      codes, edges, features, index
+# so the binning pass runs once per group across folds, estimators and
+# reruns. FoldScheduler(quantize=max_bins, binned_cache=...) feeds the codes
+# to the GBDT estimators only; the binner goes to the model registry next to
+# the scaler, so registry models and raster_predict.py bin new data the
+# same way.
+#
+# Accuracy against the float path, fold for fold on the same plan:
+#   python binned_cache.py experiments.json --stage stageC --max-bins 255 63
+# -> nRMSE change, paired tests, and the seconds spent in binning: the
+#    one-off pass here, the library's own pass per fold (float vs binned;
+#    NaN where xgboost / lightgbm / catboost is not installed) and the fit
+#    time per fold from the scheduler's profile log.
+# ─────────────────────────────────────────────────────────────────────────────
+
+MAX_BINS = 255
+GBDT_ESTIMATORS = ("XGB_TD_Regressor", "LGBM_TD_Regressor", "CatBoost_TD_Regressor")
+
+
+class FeatureBinner:
+    def __init__(self, features, edges, max_bins=MAX_BINS):
+        self.features = list(features)
+        self.edges = [np.asarray(e, dtype=np.float64) for e in edges]
+        self.max_bins = int(max_bins)
+
+    def __repr__(self):
+        n = [len(e) + 1 for e in self.edges]
+        return f"FeatureBinner({len(self.features)} features, max_bins={self.max_bins}, bins {min(n)}-{max(n)})"
+
+    @property
+    def dtype(self):
+        return np.uint8 if self.max_bins <= 255 else np.uint16
+
+    @property
+    def missing(self):
+        return np.iinfo(self.dtype).max
+
+    @classmethod
+    def fit(cls, X, max_bins=MAX_BINS):
+        if not 2 <= max_bins <= 65535:
+            raise ValueError(f"max_bins must be in 2..65535, got {max_bins}")
+        A = np.asarray(X, dtype=np.float64)
+        q = np.arange(1, max_bins) / max_bins
+        edges = []
+        for j in range(A.shape[1]):
+            v = A[:, j][np.isfinite(A[:, j])]
+            u = np.unique(v)
+            if len(u) <= max_bins:
+                # few distinct values: one bin each, edges half-way between them
+                e = (u[1:] + u[:-1]) / 2
+            else:
+                e = np.unique(np.quantile(v, q))
+            edges.append(e)
+        return cls(getattr(X, "columns", range(A.shape[1])), edges, max_bins)
+
+    def codes(self, X):
+        """(n, p) bin codes in self.dtype."""
+        A = np.asarray(X[self.features] if hasattr(X, "columns") else X, dtype=np.float64)
+        out = np.empty(A.shape, dtype=self.dtype)
+        for j, e in enumerate(self.edges):
+            col = A[:, j]
+            out[:, j] = np.searchsorted(e, col, side="right")
+            out[~np.isfinite(col), j] = self.missing
+        return out
+
+    def frame(self, codes, index=None):
+        """Model input: float32 codes, NaN where missing."""
+        C = np.asarray(codes)
+        F = C.astype(np.float32)
+        F[C == self.missing] = np.nan
+        return pd.DataFrame(F, index=index, columns=self.features)
+
+    def transform(self, X):
+        return self.frame(self.codes(X), getattr(X, "index", None))
+
+    @property
+    def signature(self):
+        h = hashlib.sha1(json.dumps([self.features, self.max_bins]).encode())
+        for e in self.edges:
+            h.update(e.tobytes())
+        return h.hexdigest()
+
+
+def design_key(X, max_bins):
+    h = hashlib.sha1(json.dumps([str(c) for c in X.columns]).encode())
+    h.update(pd.util.hash_pandas_object(X, index=True).values.tobytes())
+    return f"{h.hexdigest()[:20]}_b{int(max_bins)}"
+
+
+class BinnedCache:
+    """Binner + codes per (design matrix, max_bins); disk and in-process."""
+
+    def __init__(self, root=None):
+        self.root = root
+        self._mem = {}
+        if root:
+            os.makedirs(root, exist_ok=True)
+
+    def _load(self, path):
+        with np.load(path, allow_pickle=False) as z:
+            bounds = z["bounds"]
+            edges = [z["edges"][a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+            binner = FeatureBinner(z["features"].tolist(), edges, int(z["max_bins"]))
+            return binner, z["codes"]
+
+    def _save(self, path, binner, codes):
+        bounds = np.cumsum([0] + [len(e) for e in binner.edges])
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".npz.tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, codes=codes, edges=np.concatenate(binner.edges) if binner.edges else np.empty(0),
+                     bounds=bounds, features=np.array(binner.features), max_bins=binner.max_bins)
+        os.replace(tmp, path)
+
+    def get(self, X, max_bins=MAX_BINS):
+        """(binned model input DataFrame, binner) for a design matrix."""
+        key = design_key(X, max_bins)
+        if key not in self._mem:
+            path = os.path.join(self.root, f"{key}.npz") if self.root else None
+            binner = codes = None
+            if path and os.path.exists(path):
+                try:
+                    binner, codes = self._load(path)
+                except (OSError, ValueError, KeyError):
+                    binner = None                      # corrupt file -> rebuild
+            if binner is None:
+                binner = FeatureBinner.fit(X, max_bins)
+                codes = binner.codes(X)
+                if path:
+                    self._save(path, binner, codes)
+            self._mem[key] = (binner.frame(codes, X.index), binner)
+        return self._mem[key]
+
+
+def quantizes(model_cls, quantize):
+    return bool(quantize) and model_cls.__name__ in GBDT_ESTIMATORS
+
+
+def library_binning_seconds(cls_name, X, max_bins=MAX_BINS):
+    """Seconds of the GBDT library's own histogram / border pass on X (NaN without the library)."""
+    A = np.ascontiguousarray(np.asarray(X, dtype=np.float32))
+    try:
+        if cls_name.startswith("XGB"):
+            import xgboost
+            t0 = time.perf_counter()
+            xgboost.QuantileDMatrix(A, max_bin=max_bins)
+        elif cls_name.startswith("LGBM"):
+            import lightgbm
+            t0 = time.perf_counter()
+            lightgbm.Dataset(A, params={"max_bin": max_bins, "verbose": -1}).construct()
+        else:
+            import catboost
+            t0 = time.perf_counter()
+            catboost.Pool(A).quantize(border_count=max_bins)
+    except ImportError:
+        return np.nan
+    return time.perf_counter() - t0
+
+
+def _fit_seconds(profile_log):
+    # mean fit_s per (estimator class, group) of the folds fitted in this round
+    from fold_profiler import load_profile
+    if not os.path.exists(profile_log):
+        return {}
+    df = load_profile(profile_log)
+    return df.groupby(["estimator", "group"])["fit_s"].mean().to_dict() if len(df) else {}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Float vs binned on the fold plan of an experiment stage
+# ─────────────────────────────────────────────────────────────────────────────
+def validate_quantization(config, stage_name, max_bins=(255, 63), estimators=None, population=None):
+    from cv_engine       import FoldScheduler
+    from fold_store      import FoldResultStore
+    from stat_tests      import compare_pairs
+    from run_experiments import (build_dag, build_plans, design_matrix, resolve_estimator,
+                                 plan_key)
+
+    stage = next(s for s in config["stages"] if s["name"] == stage_name)
+    jobs, _ = build_dag({**config, "stages": [stage]})
+    plans = build_plans(config, jobs, population)
+    plan, df, y = plans[plan_key(stage)]
+    store = FoldResultStore(f"{config['output_dir']}/fold_cache")
+    cache = BinnedCache(f"{config['output_dir']}/binned_cache")
+    labels = [e for e in (estimators or stage["estimators"])
+              if config["estimators"][e] in GBDT_ESTIMATORS]
+    designs = {spec["group"]: design_matrix(df, plan.index, spec["group"]) for spec in jobs.values()}
+
+    # one-off binning pass per group, and the library's own pass on one
+    # fold's training rows, float vs binned input
+    train_rows = next(iter(plan.split()))[0]
+    once_s, lib_s = {}, {}
+    for group, X in designs.items():
+        for bins in max_bins:
+            t0 = time.perf_counter()
+            binner = FeatureBinner.fit(X, bins)
+            codes = binner.codes(X)
+            once_s[(group, bins)] = time.perf_counter() - t0
+            for label in labels:
+                cls_name = config["estimators"][label]
+                lib_s[(label, group, None, bins)] = library_binning_seconds(
+                    cls_name, X.iloc[train_rows], bins)
+                lib_s[(label, group, bins)] = library_binning_seconds(
+                    cls_name, binner.frame(codes[train_rows]), bins)
+
+    fold_vals, cost, fit_s = {}, {}, {}
+    log_dir = tempfile.mkdtemp(prefix="quantization_check_")
+    for bins in (None,) + tuple(max_bins):
+        profile_log = os.path.join(log_dir, f"profile_{bins}.jsonl")
+        scheduler = FoldScheduler(n_cores=config.get("n_cores", -1), store=store, keep_oof=False,
+                                  quantize=bins, binned_cache=cache, profile_log=profile_log)
+        for spec in jobs.values():
+            if spec["estimator"] in labels:
+                scheduler.add_cv((spec["estimator"], bins), spec["group"],
+                                 resolve_estimator(config["estimators"][spec["estimator"]]),
+                                 designs[spec["group"]], y, plan, **spec["model_kwargs"])
+        for ((label, _), group), vals in scheduler.run().items():
+            fold_vals[(label, group, bins)] = vals
+        # core-seconds per newly fitted fold (folds from the store cost nothing)
+        st = scheduler.stats
+        cost[bins] = st["busy_core_s"] / st["n_tasks"] if st and st["n_tasks"] else np.nan
+        fit_s[bins] = _fit_seconds(profile_log)
+
+    shutil.rmtree(log_dir, ignore_errors=True)
+
+    runs = [k for k in fold_vals if k[2] is not None]
+    tests = compare_pairs(fold_vals, [(k, (k[0], k[1], None)) for k in runs], n_splits=plan.n_splits,
+                          correction="holm", family=[k[2] for k in runs])
+    rows = []
+    for r in tests.itertuples():
+        label, group, bins = r.a
+        cls_name = config["estimators"][label]
+        lib_float, lib_binned = lib_s[(label, group, None, bins)], lib_s[(label, group, bins)]
+        rows.append({"estimator": label, "group": group, "max_bins": bins,
+                     "float_nrmse": r.mean_b, "binned_nrmse": r.mean_a,
+                     "pct_change": (r.mean_a - r.mean_b) / r.mean_b * 100,
+                     "max_abs_fold_diff": np.max(np.abs(np.subtract(fold_vals[r.a], fold_vals[r.b]))),
+                     "p_wilcoxon": r.p_wilcoxon, "p_corrected_t": r.p_corrected_t,
+                     "p_wilcoxon_adj": r.p_wilcoxon_adj,
+                     "float_core_s_per_fold": cost[None], "binned_core_s_per_fold": cost[bins],
+                     "float_fit_s_per_fold": fit_s[None].get((cls_name, group), np.nan),
+                     "binned_fit_s_per_fold": fit_s[bins].get((cls_name, group), np.nan),
+                     # the binning work: once per group here vs the library's
+                     # own pass, which still runs on every fold
+                     "binning_once_s": once_s[(group, bins)],
+                     "library_binning_float_s": lib_float,
+                     "library_binning_binned_s": lib_binned,
+                     "library_binning_saved_s": (lib_float - lib_binned) * len(fold_vals[r.a])})
+    table = pd.DataFrame(rows)
+    out = f"{config['output_dir']}/quantization_check_{stage_name}.csv"
+    table.to_csv(out, index=False)
+    with pd.option_context("display.width", 160):
+        print(table.to_string(index=False))
+    print(f"Saved: {out}")
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check binned GBDT inputs against the float path")
+    parser.add_argument("config", nargs="?", default="experiments.json")
+    parser.add_argument("--stage", default="stageC")
+    parser.add_argument("--max-bins", type=int, nargs="+", default=[255, 63])
+    parser.add_argument("--estimator", action="append", help="only these estimators (repeatable)")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    validate_quantization(config, args.stage, args.max_bins, args.estimator)
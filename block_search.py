@@ -0,0 +1,255 @@
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from cv_engine  import FoldScheduler
+from stat_tests import compare_pairs
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Feature-block search
+#
+# Instead of hand-curated groups, candidate predictor sets are unions of
+# blocks (Sentinel-2 seasons, the remaining BASE_RS predictors, CHM25,
+# NAIP-DAP profiles). Blocks are built from model_feature_sets: a group id,
+# or "GA-GB" for the features of GA not in GB; a feature already taken by an
+# earlier block is dropped from later ones, so blocks are disjoint.
+#
+# Search strategies (per estimator, all estimators side by side):
+#   forward   start empty, add the block that lowers mean nRMSE most
+#   backward  start with all blocks, drop the block whose removal helps most
+#   beam      forward, keeping the best `beam_width` sets at every size
+# A step stops once the best candidate does not improve the best set so far
+# by at least min_improve (relative). All candidates of a step, for every
+# estimator, go into one FoldScheduler round.
+#
+# Every candidate is fitted on one fold plan (plots complete for all blocks
+# and for the baseline group) and keyed by its block set, so a (block set,
+# estimator, fold) result is fitted once: within a search from the in-memory
+# memo, across searches and reruns from the fold store. The ranked table
+# compares every evaluated set with the baseline (G16) on matched folds.
+#
+#   python block_search.py experiments.json --stage stageC --strategy beam --beam-width 3
+# ─────────────────────────────────────────────────────────────────────────────
+
+DEFAULT_BLOCKS = {
+    "S2_SUM" : "G1a",
+    "S2_WIN" : "G1sw-G1a",
+    "S2_SPR" : "G1c-G1sw",
+    "BASE_RS": "G16",             # BASE_RS predictors not in the S2 blocks above
+    "CHM25"  : "G12",
+    "PROFILE": "G14",
+}
+STRATEGIES = ("forward", "backward", "beam")
+
+
+def resolve_blocks(block_defs, feature_sets):
+    """{block: [features]} from group expressions; disjoint, in definition order."""
+    blocks, taken = {}, set()
+    for name, expr in block_defs.items():
+        if isinstance(expr, (list, tuple)):
+            feats = list(expr)
+        else:
+            gid, *minus = expr.split("-")
+            drop = {f for g in minus for f in feature_sets[g]}
+            feats = [f for f in feature_sets[gid] if f not in drop]
+        feats = [f for f in feats if f not in taken]
+        if feats:
+            blocks[name] = feats
+            taken.update(feats)
+    return blocks
+
+
+class BlockSearch:
+    def __init__(self, scheduler, df, y, plan, blocks, estimators, baseline_features,
+                 baseline="G16", model_kwargs=None):
+        self.scheduler = scheduler
+        self.df, self.y, self.plan = df, y, plan
+        self.blocks = blocks
+        self.order = {b: i for i, b in enumerate(blocks)}
+        self.estimators = estimators               # {label: model class}
+        self.baseline = baseline
+        self.baseline_features = list(baseline_features)
+        self.model_kwargs = dict(model_kwargs or {})
+        self.fold_vals = {}                        # (label, set name) -> fold nRMSE
+        self.steps = []                            # (label, step, set name, score, chosen)
+
+    def set_name(self, block_set):
+        return "+".join(sorted(block_set, key=self.order.get))
+
+    def features(self, block_set):
+        return [f for b in sorted(block_set, key=self.order.get) for f in self.blocks[b]]
+
+    def _design(self, features):
+        X = self.df.loc[self.plan.index, features]
+        return pd.DataFrame(StandardScaler().fit_transform(X), index=X.index, columns=X.columns)
+
+    def evaluate(self, candidates):
+        """Fit the (label, block set) candidates not fitted yet; {(label, set): mean nRMSE}."""
+        queued = set()
+        for label, block_set in candidates:
+            name = self.set_name(block_set)
+            if (label, name) in self.fold_vals or (label, name) in queued:
+                continue
+            queued.add((label, name))
+            self.scheduler.add_cv(label, f"blocks:{name}", self.estimators[label],
+                                  self._design(self.features(block_set)), self.y, self.plan,
+                                  **self.model_kwargs)
+        if queued:
+            results = self.scheduler.run()
+            for label, name in queued:
+                self.fold_vals[(label, name)] = results[(label, f"blocks:{name}")]
+        return {(label, s): float(np.mean(self.fold_vals[(label, self.set_name(s))]))
+                for label, s in candidates}
+
+    def evaluate_baseline(self):
+        missing = [label for label in self.estimators if (label, self.baseline) not in self.fold_vals]
+        for label in missing:
+            self.scheduler.add_cv(label, self.baseline, self.estimators[label],
+                                  self._design(self.baseline_features), self.y, self.plan,
+                                  **self.model_kwargs)
+        if missing:
+            results = self.scheduler.run()
+            for label in missing:
+                self.fold_vals[(label, self.baseline)] = results[(label, self.baseline)]
+
+    def _neighbours(self, block_set, direction):
+        if direction == "backward":
+            return [block_set - {b} for b in block_set if len(block_set) > 1]
+        return [block_set | {b} for b in self.blocks if b not in block_set]
+
+    def search(self, strategy="forward", beam_width=3, min_improve=0.0):
+        """Run the search for every estimator; returns {label: best block set}."""
+        if strategy not in STRATEGIES:
+            raise ValueError(f"unknown strategy {strategy!r}; expected one of {STRATEGIES}")
+        direction = "backward" if strategy == "backward" else "forward"
+        width = beam_width if strategy == "beam" else 1
+        self.evaluate_baseline()
+
+        start = frozenset(self.blocks) if direction == "backward" else frozenset()
+        frontier = {label: [start] for label in self.estimators}
+        best = {label: (np.inf, start) for label in self.estimators}
+        if start:
+            scores = self.evaluate([(label, start) for label in self.estimators])
+            best = {label: (scores[(label, start)], start) for label in self.estimators}
+            self.steps += [(label, 0, self.set_name(start), scores[(label, start)], True)
+                           for label in self.estimators]
+        step = 0
+        while any(frontier.values()):
+            step += 1
+            cands = {label: list(dict.fromkeys(n for s in sets for n in self._neighbours(s, direction)))
+                     for label, sets in frontier.items() if sets}
+            scores = self.evaluate([(label, s) for label, sets in cands.items() for s in sets])
+            for label, sets in cands.items():
+                ranked = sorted(sets, key=lambda s: scores[(label, s)])
+                top = ranked[:width]
+                improved = top and scores[(label, top[0])] < best[label][0] * (1 - min_improve)
+                for s in ranked:
+                    self.steps.append((label, step, self.set_name(s), scores[(label, s)],
+                                       improved and s == top[0]))
+                if improved:
+                    best[label] = (scores[(label, top[0])], top[0])
+                    frontier[label] = top
+                else:
+                    frontier[label] = []
+        return {label: s for label, (_, s) in best.items()}
+
+    def ranked_table(self, correction="holm", n_perm=10000):
+        """Every evaluated set per estimator, ranked by mean nRMSE, tested against the baseline."""
+        runs = [(label, name) for label, name in self.fold_vals if name != self.baseline]
+        tests = compare_pairs(self.fold_vals, [(r, (r[0], self.baseline)) for r in runs],
+                              n_splits=self.plan.n_splits, n_perm=n_perm, correction=correction,
+                              family=[r[0] for r in runs])
+        chosen = {(label, name) for label, _, name, _, ok in self.steps if ok}
+        first_step = {}
+        for label, step, name, _, _ in self.steps:
+            first_step.setdefault((label, name), step)
+        rows = []
+        for r in tests.itertuples():
+            label, name = r.a
+            blocks = name.split("+")
+            rows.append({
+                "estimator": label, "blocks": name, "n_blocks": len(blocks),
+                "n_features": len(self.features(blocks)),
+                "mean_nrmse": r.mean_a, "sd_nrmse": np.std(self.fold_vals[r.a]),
+                "baseline_mean": r.mean_b, "pct_change": (r.mean_a - r.mean_b) / r.mean_b * 100,
+                "p_ttest": r.p_ttest, "p_wilcoxon": r.p_wilcoxon,
+                "p_corrected_t": r.p_corrected_t, "p_permutation": r.p_permutation,
+                "p_wilcoxon_adj": r.p_wilcoxon_adj, "significant": r.significant,
+                "step": first_step.get(r.a, 0), "selected": r.a in chosen,
+            })
+        df = pd.DataFrame(rows).sort_values(["estimator", "mean_nrmse"])
+        df.insert(1, "rank", df.groupby("estimator").cumcount() + 1)
+        return df.reset_index(drop=True)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# MAIN: search on the population and CV scheme of an experiment stage
+# ─────────────────────────────────────────────────────────────────────────────
+def run_block_search(config, stage_name, strategy="forward", beam_width=3, min_improve=0.0,
+                     estimators=None, block_defs=None, population=None):
+    from model_config    import model_feature_sets
+    from fold_plan       import FoldPlan, common_plot_index, quantile_strata
+    from fold_store      import FoldResultStore
+    from run_experiments import load_population, resolve_estimator
+
+    stage = next(s for s in config["stages"] if s["name"] == stage_name)
+    cv = stage.get("cv", {})
+    baseline = stage.get("baseline", "G16")
+    blocks = resolve_blocks(block_defs or config.get("blocks", DEFAULT_BLOCKS), model_feature_sets)
+
+    df = load_population(config, stage.get("exclude_cut_plots", False), population)
+    y = df[config.get("target", "total_biomass_tons_ha")]
+    plot_index = common_plot_index(df, list(blocks.values()) + [model_feature_sets[baseline]], y)
+    plan = FoldPlan.load_or_build(
+        f"{config['output_dir']}/fold_plans", plot_index,
+        n_splits=cv.get("n_splits", 5), n_repeats=cv.get("n_repeats", 10),
+        random_state=cv.get("random_state", 42),
+        strata=(quantile_strata(y.loc[plot_index], n_bins=10).values
+                if cv.get("stratified", True) else None))
+    print("Blocks: " + ", ".join(f"{b} ({len(f)})" for b, f in blocks.items()))
+    print(f"Fold plan: {len(plot_index)} plots complete for every block and {baseline}, {plan}")
+
+    labels = estimators or stage["estimators"]
+    scheduler = FoldScheduler(n_cores=config.get("n_cores", -1), keep_oof=False,
+                              store=FoldResultStore(f"{config['output_dir']}/fold_cache"))
+    search = BlockSearch(scheduler, df, y.loc[plot_index], plan, blocks,
+                         {label: resolve_estimator(config["estimators"][label]) for label in labels},
+                         model_feature_sets[baseline], baseline,
+                         config.get("model_kwargs", {"device": "cpu"}))
+    best = search.search(strategy, beam_width, min_improve)
+    table = search.ranked_table(correction=stage.get("correction", "holm"),
+                                n_perm=stage.get("n_perm", 10000))
+
+    out_dir = f"{config['output_dir']}/block_search"
+    os.makedirs(out_dir, exist_ok=True)
+    out = f"{out_dir}/{stage_name}_{strategy}.csv"
+    table.to_csv(out, index=False)
+    for label, s in best.items():
+        row = table[(table["estimator"] == label) & (table["blocks"] == search.set_name(s))]
+        if len(row):
+            r = row.iloc[0]
+            print(f"{label:>9s}: {r['blocks']}  nRMSE {r['mean_nrmse']:.4f} "
+                  f"({r['pct_change']:+.1f}% vs {baseline}, p_wilcoxon_adj={r['p_wilcoxon_adj']:.3g})")
+    print(f"Saved: {out}")
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forward / backward / beam search over feature blocks")
+    parser.add_argument("config", nargs="?", default="experiments.json")
+    parser.add_argument("--stage", default="stageC", help="population, CV scheme and baseline")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="forward")
+    parser.add_argument("--beam-width", type=int, default=3)
+    parser.add_argument("--min-improve", type=float, default=0.0,
+                        help="relative nRMSE gain needed to take a step")
+    parser.add_argument("--estimator", action="append", help="only these estimators (repeatable)")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    run_block_search(config, args.stage, args.strategy, args.beam_width, args.min_improve,
+                     args.estimator)
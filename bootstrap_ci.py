@@ -0,0 +1,157 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from oof_store import OOFStore
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Bootstrap confidence intervals from out-of-fold predictions
+#
+# Plots are resampled with replacement (within MEASYEAR or any other strata
+# if given), and each replicate re-scores the stored OOF predictions — no
+# model is refitted. A replicate is a vector of per-plot counts w (n_plots,),
+# so for all cells (run × repeat × fold) at once
+#     Σ w e²  = W @ S_e2,   Σ w y = W @ S_y,   Σ w = W @ S_1
+# where W is (replicates × plots) and S_* are sparse (plots × cells) matrices
+# holding each plot's squared error / target / 1 in the cell of its test fold.
+# Replicates are processed in chunks of dense matmuls, with no Python loop
+# over replicates.
+#
+# level="fold"   : nRMSE = mean over folds of RMSE / mean(y_test), the
+#                  statistic reported by Stage C (cv_engine.fold_nrmse)
+# level="repeat" : nRMSE pooled over all plots of a repeat, mean over repeats
+#
+#   python bootstrap_ci.py <output_dir>/oof --baseline G16 --by MEASYEAR
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def bootstrap_weights(n, n_boot, rng, strata=None):
+    """(n_boot × n) resampling counts; with strata each stratum keeps its size
+    (plots with a missing stratum, e.g. no MEASYEAR, form one more stratum)."""
+    if strata is None:
+        members = [np.arange(n)]
+    else:
+        codes = pd.factorize(np.asarray(strata), use_na_sentinel=False)[0]
+        members = [np.flatnonzero(codes == s) for s in range(codes.max() + 1)]
+    offset = (np.arange(n_boot, dtype=np.int64) * n)[:, None]
+    W = np.zeros(n_boot * n)
+    for idx in members:
+        draw = idx[rng.integers(0, len(idx), size=(n_boot, len(idx)))]
+        W += np.bincount((offset + draw).ravel(), minlength=n_boot * n)
+    return W.reshape(n_boot, n)
+
+
+def _cell_matrices(y, P, assignment, n_splits, level):
+    # P: (G, R, N) predictions -> sparse (N × G·R·K) e², y and indicator
+    G, R, N = P.shape
+    K = n_splits if level == "fold" else 1
+    fold = np.asarray(assignment, dtype=np.int64)[:R] if level == "fold" else np.zeros((R, N), np.int64)
+    cell = (np.arange(G)[:, None, None] * R + np.arange(R)[None, :, None]) * K + fold[None]
+    plot = np.broadcast_to(np.arange(N), P.shape)
+    ok = np.isfinite(P)
+    rows, cols = plot[ok], cell[ok]
+    e2 = ((P - y) ** 2)[ok]
+    yy = np.broadcast_to(y, P.shape)[ok]
+    shape = (N, G * R * K)
+    mk = lambda v: sparse.csr_matrix((v, (rows, cols)), shape=shape)
+    return mk(e2), mk(yy), mk(np.ones_like(e2)), (G, R * K)
+
+
+def _nrmse_from_sums(se, sy, n, grid):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cell_nrmse = np.sqrt(se / n) / (sy / n)
+    B = cell_nrmse.shape[0]
+    return np.nanmean(cell_nrmse.reshape(B, *grid), axis=2)             # (B, G)
+
+
+def bootstrap_nrmse(y, oofs, assignment, n_splits, n_boot=2000, strata=None, level="fold",
+                    seed=0, chunk=250):
+    """Return (runs, point (G,), replicates (n_boot × G)) of nRMSE per run."""
+    runs = list(oofs)
+    y = np.asarray(y, dtype=np.float64)
+    P = np.stack([np.asarray(oofs[r], dtype=np.float64) for r in runs])
+    S_e2, S_y, S_1, grid = _cell_matrices(y, P, assignment, n_splits, level)
+
+    ones = np.ones((1, len(y)))
+    point = _nrmse_from_sums((S_e2.T @ ones.T).T, (S_y.T @ ones.T).T, (S_1.T @ ones.T).T, grid)[0]
+
+    rng = np.random.default_rng(seed)
+    reps = np.empty((n_boot, len(runs)))
+    for start in range(0, n_boot, chunk):
+        m = min(chunk, n_boot - start)
+        W = bootstrap_weights(len(y), m, rng, strata)
+        # sparse.T @ dense.T keeps the product in sparse-dense form
+        reps[start:start + m] = _nrmse_from_sums((S_e2.T @ W.T).T, (S_y.T @ W.T).T,
+                                                 (S_1.T @ W.T).T, grid)
+    return runs, point, reps
+
+
+def _baseline_run(run, baseline):
+    # runs are (estimator, group); the baseline is the same estimator on `baseline`
+    return (run[0], baseline) if isinstance(run, tuple) else baseline
+
+
+def bootstrap_ci(y, oofs, assignment, n_splits, baseline=None, n_boot=2000, strata=None,
+                 level="fold", confidence=0.95, seed=0):
+    """
+    Percentile CIs of nRMSE per run and, with a baseline group, of the
+    percent change vs that group's run for the same estimator. Both come
+    from the same replicates, so the percent change CI is paired.
+    """
+    runs, point, reps = bootstrap_nrmse(y, oofs, assignment, n_splits, n_boot, strata, level, seed)
+    q = [(1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100]
+    lo, hi = np.nanpercentile(reps, q, axis=0)
+    out = pd.DataFrame({"run": pd.Series(runs, dtype=object), "nrmse": point,
+                        "nrmse_ci_lo": lo, "nrmse_ci_hi": hi})
+    if baseline is not None:
+        col = {r: i for i, r in enumerate(runs)}
+        pct = np.full(len(runs), np.nan)
+        pct_lo, pct_hi = np.full(len(runs), np.nan), np.full(len(runs), np.nan)
+        for i, r in enumerate(runs):
+            b = col.get(_baseline_run(r, baseline))
+            if b is None or b == i:
+                continue
+            pct[i] = (point[i] - point[b]) / point[b] * 100
+            rep_pct = (reps[:, i] - reps[:, b]) / reps[:, b] * 100
+            pct_lo[i], pct_hi[i] = np.nanpercentile(rep_pct, q)
+        out["pct_change"], out["pct_ci_lo"], out["pct_ci_hi"] = pct, pct_lo, pct_hi
+    out.attrs.update(n_boot=n_boot, level=level, confidence=confidence)
+    return out
+
+
+def ci_error_bars(center, lo, hi):
+    """Asymmetric matplotlib yerr (2 × n) around center from CI bounds."""
+    center, lo, hi = (np.asarray(v, dtype=float) for v in (center, lo, hi))
+    return np.vstack([np.clip(center - lo, 0, None), np.clip(hi - center, 0, None)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bootstrap CIs from stored OOF predictions")
+    parser.add_argument("oof_dir")
+    parser.add_argument("--baseline", default="G16")
+    parser.add_argument("--by", default=None, help="resample within this plan column, e.g. MEASYEAR")
+    parser.add_argument("--n-boot", type=int, default=2000)
+    parser.add_argument("--level", choices=["fold", "repeat"], default="fold")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    args = parser.parse_args()
+
+    store = OOFStore(args.oof_dir)
+    frames = []
+    for pid in store.plan_ids():
+        plan, oofs = store.load_all(pid)
+        strata = plan["columns"][args.by] if args.by else None
+        df = bootstrap_ci(plan["y"], oofs, plan["assignment"], plan["n_splits"], args.baseline,
+                          args.n_boot, strata, args.level, args.confidence)
+        df.insert(0, "plan", pid)
+        frames.append(df)
+    df = pd.concat(frames, ignore_index=True)
+    df.insert(1, "estimator", [r[0] for r in df["run"]])
+    df.insert(2, "group", [r[1] for r in df["run"]])
+    df = df.drop(columns="run")
+    with pd.option_context("display.width", 160, "display.max_rows", 200):
+        print(df.to_string(index=False))
+    out = f"{args.oof_dir}/bootstrap_ci_{args.level}{'_' + args.by if args.by else ''}.csv"
+    df.to_csv(out, index=False)
+    print(f"Saved: {out}")
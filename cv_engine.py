@@ -0,0 +1,668 @@
+import os
+import sys
+import time
+import inspect
+from collections import OrderedDict
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+from sklearn.metrics import mean_squared_error
+from threadpoolctl import threadpool_limits
+
+from fold_store import data_hash, task_key
+from shared_matrix import SharedMatrix, default_share_root, remove_share_root
+from adaptive_cv import run_adaptive
+from fold_profiler import ProfileLog, RSSSampler, peak_rss_mb
+from model_registry import FULL
+from binned_cache import BinnedCache, quantizes
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Thread budget per estimator type
+# GBDTs scale reasonably to a few threads per fit on ~300 plots; the torch MLP
+# gains little past two. Anything unknown runs single-threaded.
+# ─────────────────────────────────────────────────────────────────────────────
+THREAD_BUDGET = {
+    "XGB_TD_Regressor"     : 4,
+    "LGBM_TD_Regressor"    : 4,
+    "CatBoost_TD_Regressor": 4,
+    "RealMLP_TD_Regressor" : 2,
+}
+DEFAULT_THREADS = 1
+
+# estimators that fit several targets in one model (2-D y); the others get
+# one model per target on the same fold slices (PerTargetModel)
+MULTI_OUTPUT = {"RealMLP_TD_Regressor"}
+
+# rough relative cost of one fold, used to start the longest tasks first
+TASK_COST = {
+    "XGB_TD_Regressor"     : 1.0,
+    "LGBM_TD_Regressor"    : 1.0,
+    "CatBoost_TD_Regressor": 2.0,
+    "RealMLP_TD_Regressor" : 4.0,
+}
+
+
+def _limit_threads(n_threads):
+    os.environ["OMP_NUM_THREADS"] = str(n_threads)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(n_threads)
+    return threadpool_limits(limits=n_threads)
+
+
+def _splits_per_repeat(cv, n_total):
+    """Folds per repeat of a (repeated) CV scheme, so fold i belongs to repeat i // k."""
+    if hasattr(cv, "n_splits"):
+        return int(cv.n_splits)
+    if hasattr(cv, "cvargs"):
+        return int(cv.cvargs["n_splits"])
+    return n_total
+
+
+def _rows(A, idx):
+    return A.iloc[idx] if hasattr(A, "iloc") else A[idx]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Several targets (total / hardwood / softwood biomass, ...) on one fold
+# y with one column per target is fitted natively by MULTI_OUTPUT estimators
+# and by one estimator per column otherwise; either way the fold's rows are
+# sliced once and predictions come back as (n_test, n_targets).
+# ─────────────────────────────────────────────────────────────────────────────
+class PerTargetModel:
+    def __init__(self, model_cls, model_kwargs):
+        self.model_cls = model_cls
+        self.model_kwargs = model_kwargs
+        self.models_ = []
+
+    def fit(self, X, Y):
+        Y = np.asarray(Y)
+        self.models_ = []
+        for j in range(Y.shape[1]):
+            model = self.model_cls(**self.model_kwargs)
+            model.fit(X, Y[:, j])
+            self.models_.append(model)
+        return self
+
+    def predict(self, X):
+        return np.column_stack([np.asarray(m.predict(X)).ravel() for m in self.models_])
+
+
+def _make_model(model_cls, model_kwargs, y_train):
+    if np.ndim(y_train) == 2 and model_cls.__name__ not in MULTI_OUTPUT:
+        return PerTargetModel(model_cls, model_kwargs)
+    return model_cls(**model_kwargs)
+
+
+def _predict(model, X_test, y_test):
+    if not len(y_test):
+        return np.empty(np.shape(y_test))
+    preds = np.asarray(model.predict(X_test))
+    return preds.reshape(len(y_test), -1) if np.ndim(y_test) == 2 else preds.ravel()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Fit on one fold and predict its test plots
+# X / y may be pandas objects or (memory-mapped) NumPy arrays
+# pass a dict as `profile` to get slice / fit / predict wall times back;
+# return_model=True also returns the fitted estimator
+# ─────────────────────────────────────────────────────────────────────────────
+def fit_predict_fold(train_idx, test_idx, X, y, model_cls, model_kwargs, profile=None,
+                     return_model=False):
+    t0 = time.perf_counter()
+    X_train, y_train = _rows(X, train_idx), _rows(y, train_idx)
+    X_test, y_test = _rows(X, test_idx), _rows(y, test_idx)
+    t1 = time.perf_counter()
+    model = _make_model(model_cls, model_kwargs, y_train)
+    model.fit(X_train, y_train)
+    t2 = time.perf_counter()
+    preds = _predict(model, X_test, y_test)
+    t3 = time.perf_counter()
+    if profile is not None:
+        profile.update(slice_s=t1 - t0, fit_s=t2 - t1, predict_s=t3 - t2,
+                       n_train=len(train_idx), n_test=len(test_idx))
+    if return_model:
+        return preds, np.asarray(y_test), model
+    return preds, np.asarray(y_test)
+
+
+def fold_nrmse(y_test, preds):
+    if np.ndim(y_test) == 2:
+        # one value per target column
+        y_test = np.asarray(y_test)
+        return np.sqrt(np.mean((y_test - preds) ** 2, axis=0)) / np.mean(y_test, axis=0)
+    rmse = np.sqrt(mean_squared_error(y_test, preds))
+    return rmse / np.mean(y_test)
+
+
+def _store_fold(store, key, nrmse, preds):
+    # persist this fold right away so a preempted job resumes from here
+    if store is not None:
+        store.put_array(key, np.asarray(preds, dtype=np.float32))
+        store.put(key, {"nrmse": np.asarray(nrmse, dtype=float).tolist()})
+
+
+def _finish_fold(model, preds, y_test, n_train, store, key, registry, model_meta):
+    if registry is not None:
+        registry.put(key, model, dict(model_meta, n_train=n_train, created=time.time()))
+    # a full-data refit has no test plots
+    if not len(y_test):
+        return float("nan")
+    nrmse = fold_nrmse(y_test, preds)
+    _store_fold(store, key, nrmse, preds)
+    return nrmse
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Compute nRMSE on one fold
+# ─────────────────────────────────────────────────────────────────────────────
+def compute_fold_nrmse(train_idx, test_idx, X, y, model_cls, model_kwargs, store=None, key=None,
+                       profile=None):
+    preds, y_test = fit_predict_fold(train_idx, test_idx, X, y, model_cls, model_kwargs, profile)
+    nrmse = fold_nrmse(y_test, preds)
+    _store_fold(store, key, nrmse, preds)
+    return nrmse
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Worker side of the scheduler: each worker gets the SharedMatrix handles once
+# (pool initializer) and memory-maps a group's matrix on first use; tasks only
+# carry a data id + fold indices. Backend workers outlive a scheduler run, so
+# at most WORKER_DATA_MAX matrices stay mapped (least recently used dropped
+# first) and a matrix whose files were removed by its coordinator is unmapped
+# before the next task
+# ─────────────────────────────────────────────────────────────────────────────
+WORKER_DATA_MAX = 4
+_WORKER_HANDLES = {}
+_WORKER_DATA = OrderedDict()
+
+
+def _init_worker(handles):
+    _WORKER_HANDLES.clear()
+    _WORKER_HANDLES.update(handles)
+    _WORKER_DATA.clear()
+
+
+def _worker_data(data_id):
+    if data_id in _WORKER_DATA:
+        _WORKER_DATA.move_to_end(data_id)
+    else:
+        _WORKER_DATA[data_id] = _WORKER_HANDLES[data_id].open()
+        while len(_WORKER_DATA) > WORKER_DATA_MAX:
+            _WORKER_DATA.popitem(last=False)
+    return _WORKER_DATA[data_id]
+
+
+def _evict(data_id):
+    _WORKER_DATA.pop(data_id, None)
+    _WORKER_HANDLES.pop(data_id, None)
+
+
+def run_payload(payload):
+    """Entry point for execution backends: a task that carries its own data handle."""
+    data_id, handle = payload["args"][0], payload["handle"]
+    for d, h in list(_WORKER_HANDLES.items()):
+        if d != data_id and not os.path.exists(h.x_path):
+            _evict(d)                                  # coordinator finished with it
+    old = _WORKER_HANDLES.get(data_id)
+    if old is not None and old.x_path != handle.x_path:
+        _evict(data_id)                                # same group, another share root
+    _WORKER_HANDLES[data_id] = handle
+    return (_run_fused if payload.get("fused") else _run_task)(*payload["args"])
+
+
+def _accepts_n_threads(model_cls):
+    return "n_threads" in inspect.signature(model_cls.__init__).parameters
+
+
+def _run_task(data_id, train_idx, test_idx, model_cls, model_kwargs, n_threads, store, key,
+              submitted_at, registry=None, model_meta=None):
+    prof = {"worker_pid": os.getpid(), "n_threads": n_threads,
+            "queue_wait_s": time.time() - submitted_at}
+    t_start = time.perf_counter()
+    c_start = time.process_time()
+    with RSSSampler() as rss:
+        X, y = _worker_data(data_id)
+        # the thread budget is not part of the store key: it changes speed, not results
+        if _accepts_n_threads(model_cls) and "n_threads" not in model_kwargs:
+            model_kwargs = dict(model_kwargs, n_threads=n_threads)
+        with _limit_threads(n_threads):
+            preds, y_test, model = fit_predict_fold(train_idx, test_idx, X, y, model_cls,
+                                                    model_kwargs, profile=prof, return_model=True)
+        nrmse = _finish_fold(model, preds, y_test, len(train_idx), store, key, registry, model_meta)
+    prof["wall_s"] = time.perf_counter() - t_start
+    prof["cpu_s"] = time.process_time() - c_start
+    prof["peak_rss_mb"] = rss.peak_mb
+    prof["rss_growth_mb"] = rss.growth_mb
+    prof["worker_peak_rss_mb"] = peak_rss_mb()
+    return nrmse, np.asarray(preds, dtype=np.float32), prof
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Estimator-fused task: several estimators on the same fold of the same data.
+# The train / test rows are copied out of the shared matrix once and every
+# estimator is fitted on those arrays, one after another (each with its own
+# thread budget) or, with parallel=True, in threads that share the task's
+# core budget. Returns one (nrmse, preds, profile) per member.
+# ─────────────────────────────────────────────────────────────────────────────
+def _run_fused(data_id, train_idx, test_idx, members, n_threads, store, submitted_at,
+               registry=None, parallel=False):
+    queue_wait = time.time() - submitted_at
+    t_start = time.perf_counter()
+    c_start = time.process_time()
+    X, y = _worker_data(data_id)
+    X_train, y_train = np.ascontiguousarray(_rows(X, train_idx)), np.asarray(_rows(y, train_idx))
+    X_test, y_test = np.ascontiguousarray(_rows(X, test_idx)), np.asarray(_rows(y, test_idx))
+    slice_s = (time.perf_counter() - t_start) / len(members)
+
+    def fit_one(m):
+        # with parallel=True the members overlap, and so do their RSS peaks
+        t0 = time.perf_counter()
+        model_kwargs = m["model_kwargs"]
+        if _accepts_n_threads(m["model_cls"]) and "n_threads" not in model_kwargs:
+            model_kwargs = dict(model_kwargs, n_threads=m["n_threads"])
+        with RSSSampler() as rss:
+            with (nullcontext() if parallel else _limit_threads(m["n_threads"])):
+                model = _make_model(m["model_cls"], model_kwargs, y_train)
+                model.fit(X_train, y_train)
+                t1 = time.perf_counter()
+                preds = _predict(model, X_test, y_test)
+            t2 = time.perf_counter()
+            nrmse = _finish_fold(model, preds, y_test, len(train_idx), store, m["key"], registry,
+                                 m["model_meta"])
+        prof = {"worker_pid": os.getpid(), "n_threads": m["n_threads"], "queue_wait_s": queue_wait,
+                "slice_s": slice_s, "fit_s": t1 - t0, "predict_s": t2 - t1,
+                "n_train": len(train_idx), "n_test": len(test_idx), "fused": len(members),
+                "wall_s": time.perf_counter() - t0 + slice_s,
+                "peak_rss_mb": rss.peak_mb, "rss_growth_mb": rss.growth_mb}
+        return nrmse, np.asarray(preds, dtype=np.float32), prof
+
+    if parallel and len(members) > 1:
+        with _limit_threads(n_threads), ThreadPoolExecutor(len(members)) as pool:
+            out = list(pool.map(fit_one, members))
+    else:
+        out = [fit_one(m) for m in members]
+
+    # CPU time of the whole task, shared out by wall time
+    cpu_s = time.process_time() - c_start
+    total_wall = sum(prof["wall_s"] for _, _, prof in out) or 1.0
+    worker_peak = peak_rss_mb()
+    for _, _, prof in out:
+        prof.update(cpu_s=cpu_s * prof["wall_s"] / total_wall, worker_peak_rss_mb=worker_peak)
+    return out
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Flat scheduler over the whole (estimator × group × fold) grid
+#
+# All folds of all CV runs go into one queue. A task is started as soon as
+# enough cores are free for its estimator's thread budget, longest tasks
+# first, so the machine stays busy until the last fold without a barrier
+# between estimators or groups.
+#
+# fuse=True merges the tasks of different estimators on the same fold of the
+# same data into one task (slice once, fit each estimator in turn);
+# fuse="threads" fits them concurrently within the summed thread budget.
+#
+# quantize=max_bins gives the GBDT estimators the pre-binned codes of each
+# design matrix (binned_cache.py) instead of its float values.
+#
+# A y with one column per target (DataFrame) makes a multi-target run: every
+# fold fits all targets on one slice of the shared matrix, results / OOF get
+# a trailing target axis and per_target() splits them per target.
+#
+# backend=... (see task_queue.py) hands the same tasks to other workers,
+# e.g. on several nodes through a shared-filesystem queue; results are
+# written into their (run, fold) slots, so they do not depend on the order
+# in which tasks finish.
+# ─────────────────────────────────────────────────────────────────────────────
+class FoldScheduler:
+    def __init__(self, n_cores=-1, thread_budget=None, store=None, share_root=None,
+                 profile_log=None, keep_oof=True, registry=None, backend=None, fuse=False,
+                 quantize=None, binned_cache=None):
+        self.n_cores = os.cpu_count() if n_cores in (None, -1) else int(n_cores)
+        self.backend = backend
+        self.fuse = fuse
+        self.thread_budget = dict(THREAD_BUDGET, **(thread_budget or {}))
+        self.store = store
+        # optional JSON-lines log with one timing / memory record per fitted fold
+        self.profile_log = ProfileLog(profile_log) if profile_log else None
+        # float32 feature matrices shared by all workers; a temporary root is
+        # removed again after run(). Remote workers need the matrices on a
+        # filesystem they can see, i.e. the backend's share root (e.g.
+        # <queue>/data): that directory stays, the matrices written to it by
+        # this scheduler are removed after run()
+        backend_root = getattr(backend, "share_root", None) if share_root is None else None
+        self._own_share_root = share_root is None and backend_root is None
+        self._own_matrices = backend_root is not None
+        share_root = share_root or backend_root
+        self.share_root = default_share_root() if share_root is None else share_root
+        os.makedirs(self.share_root, exist_ok=True)
+        self.datasets = {}
+        self.tasks = []
+        self.results = {}
+        self.stats = None
+        # out-of-fold predictions per run: float32 (n_repeats × n_plots), NaN
+        # until the fold covering that plot in that repeat has been fitted
+        self.keep_oof = keep_oof
+        self.oof = {}
+        self._fold_rows = {}
+        # target names of the multi-target runs
+        self.targets = {}
+        # optional ModelRegistry: every fitted fold / full-data model is kept
+        self.registry = registry
+        self.quantize = quantize
+        self.binned_cache = binned_cache if binned_cache is not None else BinnedCache()
+
+    def threads_for(self, model_cls):
+        n = self.thread_budget.get(model_cls.__name__, DEFAULT_THREADS)
+        return max(1, min(n, self.n_cores))
+
+    def _share(self, group, X, y, y_stratify=None):
+        # hash what the models actually see: the float32 copy of X
+        dhash = data_hash(X.astype(np.float32), y, y_stratify)
+        data_id = f"{group}_{dhash[:16]}"
+        if data_id not in self.datasets:
+            self.datasets[data_id] = SharedMatrix.create(self.share_root, data_id, X, y)
+        return dhash, data_id
+
+    def _binned(self, model_cls, X):
+        # (model input, binner): the cached bin codes of X for GBDTs when quantizing
+        if quantizes(model_cls, self.quantize):
+            return self.binned_cache.get(X, self.quantize)
+        return X, None
+
+    def _model_meta(self, name, group, model_cls, X, y, cv, dhash, model_kwargs, scaler, fold,
+                    binner=None):
+        return {"estimator": model_cls.__name__, "label": name if isinstance(name, str) else str(name),
+                "group": group, "fold": fold, "data_hash": dhash, "cv": repr(cv),
+                "model_kwargs": model_kwargs, "features": [str(c) for c in getattr(X, "columns", [])],
+                "target": list(y.columns) if hasattr(y, "columns") else getattr(y, "name", None),
+                "scaler": self.registry.put_scaler(dhash, scaler),
+                "binning": self.registry.put_binning(binner)}
+
+    def add_cv(self, name, group, model_cls, X, y, cv, y_stratify=None, folds=None, scaler=None,
+               **model_kwargs):
+        """Queue the folds of one CV run (all, or the fold indices in `folds`);
+        folds already in the store are filled in directly. `scaler` (the
+        StandardScaler behind X) is kept with the models in the registry.
+        A DataFrame y with several target columns makes a multi-target run."""
+        X, binner = self._binned(model_cls, X)
+        n_targets = y.shape[1] if np.ndim(y) == 2 else None
+        if y_stratify is not None:
+            splits = list(cv.split(X, y_stratify))
+        else:
+            splits = list(cv.split(X))
+
+        dhash, data_id = self._share(group, X, y, y_stratify)
+        run = self.results.setdefault((name, group), [None] * len(splits))
+        queued = {t["fold"] for t in self.tasks if t["run"] == (name, group)}
+        k = _splits_per_repeat(cv, len(splits))
+        if self.keep_oof and (name, group) not in self.oof:
+            shape = (len(splits) // k, len(X)) + ((n_targets,) if n_targets else ())
+            self.oof[(name, group)] = np.full(shape, np.nan, dtype=np.float32)
+        self._fold_rows[(name, group)] = k
+        if n_targets:
+            self.targets[(name, group)] = [str(c) for c in getattr(y, "columns", range(n_targets))]
+
+        n_threads = self.threads_for(model_cls)
+        for i in (range(len(splits)) if folds is None else folds):
+            if run[i] is not None or i in queued:
+                continue
+            train_idx, test_idx = splits[i]
+            key = None
+            if self.store is not None or self.registry is not None:
+                key = task_key(model_cls.__name__, group, i, cv, model_kwargs, dhash)
+            if self.store is not None:
+                rec = self.store.get(key)
+                preds = self.store.get_array(key) if (rec is not None and self.keep_oof) else None
+                have_model = self.registry is None or key in self.registry
+                if rec is not None and (preds is not None or not self.keep_oof) and have_model:
+                    run[i] = np.asarray(rec["nrmse"]) if n_targets else rec["nrmse"]
+                    if preds is not None:
+                        self.oof[(name, group)][i // k, test_idx] = preds
+                    continue
+            self.tasks.append({
+                "run"         : (name, group),
+                "fold"        : i,
+                "data_id"     : data_id,
+                "train_idx"   : train_idx,
+                "test_idx"    : test_idx,
+                "model_cls"   : model_cls,
+                "model_kwargs": model_kwargs,
+                "n_threads"   : n_threads,
+                "key"         : key,
+                "cost"        : TASK_COST.get(model_cls.__name__, 1.0) * len(train_idx),
+                "model_meta"  : (self._model_meta(name, group, model_cls, X, y, cv, dhash,
+                                                  model_kwargs, scaler, i, binner)
+                                 if self.registry is not None else None),
+            })
+
+    def add_full(self, name, group, model_cls, X, y, y_stratify=None, scaler=None, **model_kwargs):
+        """Queue a refit on all plots of X (fold = FULL), saved to the registry only;
+        y_stratify only makes it share data and data hash with the CV runs."""
+        if self.registry is None:
+            raise ValueError("add_full needs a FoldScheduler(registry=...)")
+        X, binner = self._binned(model_cls, X)
+        dhash, data_id = self._share(group, X, y, y_stratify)
+        key = task_key(model_cls.__name__, group, FULL, None, model_kwargs, dhash)
+        if key in self.registry or any(t["key"] == key for t in self.tasks):
+            return
+        self.tasks.append({
+            "run"         : (name, group),
+            "fold"        : FULL,
+            "data_id"     : data_id,
+            "train_idx"   : np.arange(len(X)),
+            "test_idx"    : np.arange(0),
+            "model_cls"   : model_cls,
+            "model_kwargs": model_kwargs,
+            "n_threads"   : self.threads_for(model_cls),
+            "key"         : key,
+            "cost"        : TASK_COST.get(model_cls.__name__, 1.0) * len(X),
+            "model_meta"  : self._model_meta(name, group, model_cls, X, y, None, dhash,
+                                             model_kwargs, scaler, FULL, binner),
+        })
+
+    def run(self):
+        n_cached = sum(v is not None for vals in self.results.values() for v in vals)
+        print(f"Scheduler: {len(self.tasks)} folds to fit, {n_cached} done or cached, "
+              f"{self.n_cores} cores")
+
+        pending = self._fused(self.tasks) if self.fuse else self.tasks
+        pending = sorted(pending, key=lambda t: -t["cost"])
+        busy_core_s, cpu_s = 0.0, 0.0
+        t0 = time.perf_counter()
+
+        try:
+            if pending:
+                drain = self._drain if self.backend is None else self._drain_backend
+                busy_core_s, cpu_s = drain(pending)
+        finally:
+            if self._own_share_root:
+                remove_share_root(self.share_root)
+                self.datasets = {}
+            elif self._own_matrices:
+                for handle in self.datasets.values():
+                    handle.remove()
+                self.datasets = {}
+        makespan = time.perf_counter() - t0
+
+        # totals accumulate over repeated run() calls (e.g. adaptive rounds)
+        prev = self.stats or {"n_tasks": 0, "makespan_s": 0.0, "busy_core_s": 0.0, "cpu_s": 0.0}
+        n_tasks     = prev["n_tasks"] + len(self.tasks)
+        makespan    = prev["makespan_s"] + makespan
+        busy_core_s = prev["busy_core_s"] + busy_core_s
+        cpu_s       = prev["cpu_s"] + cpu_s
+        capacity = self.n_cores * makespan
+        self.stats = {
+            "n_tasks"        : n_tasks,
+            "n_cached"       : n_cached,
+            "n_cores"        : self.n_cores,
+            "makespan_s"     : makespan,
+            "busy_core_s"    : busy_core_s,
+            "cpu_s"          : cpu_s,
+            # share of core-seconds occupied by a running task
+            "slot_efficiency": busy_core_s / capacity if capacity > 0 else float("nan"),
+            # share of core-seconds actually spent on CPU by the workers
+            "cpu_efficiency" : cpu_s / capacity if capacity > 0 else float("nan"),
+        }
+        self.tasks = []
+        return {run: self._fold_values(run, vals) for run, vals in self.results.items()}
+
+    def _fold_values(self, run, vals):
+        # (n_folds,) or (n_folds, n_targets); NaN for folds not fitted
+        if run in self.targets:
+            vals = [np.full(len(self.targets[run]), np.nan) if v is None else v for v in vals]
+        return np.asarray(vals, dtype=float)
+
+    def _fused(self, tasks):
+        # same data, same fold, same split -> one task
+        by_split = {}
+        for t in tasks:
+            split = (t["data_id"], t["fold"], len(t["train_idx"]), t["test_idx"].tobytes())
+            by_split.setdefault(split, []).append(t)
+        out = []
+        for members in by_split.values():
+            if len(members) == 1:
+                out.append(members[0])
+                continue
+            threads = [m["n_threads"] for m in members]
+            out.append({
+                "members"  : members,
+                "data_id"  : members[0]["data_id"],
+                "train_idx": members[0]["train_idx"],
+                "test_idx" : members[0]["test_idx"],
+                "n_threads": min(sum(threads), self.n_cores) if self.fuse == "threads" else max(threads),
+                "cost"     : sum(m["cost"] for m in members),
+            })
+        return out
+
+    def _call(self, t):
+        """(worker function, args) of a plain or fused task."""
+        if "members" in t:
+            members = [{k: m[k] for k in ("model_cls", "model_kwargs", "n_threads", "key",
+                                          "model_meta")} for m in t["members"]]
+            return _run_fused, (t["data_id"], t["train_idx"], t["test_idx"], members,
+                                t["n_threads"], self.store, t["submitted_at"], self.registry,
+                                self.fuse == "threads")
+        return _run_task, (t["data_id"], t["train_idx"], t["test_idx"], t["model_cls"],
+                           t["model_kwargs"], t["n_threads"], self.store, t["key"],
+                           t["submitted_at"], self.registry, t["model_meta"])
+
+    def _finished(self, t, result):
+        """(member task, (nrmse, preds, profile)) pairs of a finished task."""
+        if "members" not in t:
+            return [(t, result)]
+        for m in t["members"]:
+            m["submitted_at"] = t["submitted_at"]
+        return list(zip(t["members"], result))
+
+    def _drain(self, pending):
+        busy_core_s, cpu_s = 0.0, 0.0
+        free = self.n_cores
+        running = {}
+        with ProcessPoolExecutor(max_workers=self.n_cores, initializer=_init_worker,
+                                 initargs=(self.datasets,)) as pool:
+            while pending or running:
+                # start everything that fits into the free cores
+                still_waiting = []
+                for t in pending:
+                    if t["n_threads"] <= free:
+                        t["submitted_at"] = time.time()
+                        fn, args = self._call(t)
+                        running[pool.submit(fn, *args)] = t
+                        free -= t["n_threads"]
+                    else:
+                        still_waiting.append(t)
+                pending = still_waiting
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    t = running.pop(fut)
+                    free += t["n_threads"]
+                    for m, (nrmse, preds, prof) in self._finished(t, fut.result()):
+                        busy_core_s += prof["wall_s"] * m["n_threads"]
+                        cpu_s += prof["cpu_s"]
+                        self._collect(m, nrmse, preds, prof)
+
+        return busy_core_s, cpu_s
+
+    def _drain_backend(self, pending):
+        busy_core_s, cpu_s = 0.0, 0.0
+        payloads = []
+        for t in pending:
+            t["submitted_at"] = time.time()
+            fn, args = self._call(t)
+            payloads.append({"handle": self.datasets[t["data_id"]], "args": args,
+                             "fused": fn is _run_fused})
+        for i, result in self.backend.map_tasks(payloads):
+            for m, (nrmse, preds, prof) in self._finished(pending[i], result):
+                busy_core_s += prof["wall_s"] * m["n_threads"]
+                cpu_s += prof["cpu_s"]
+                self._collect(m, nrmse, preds, prof)
+        return busy_core_s, cpu_s
+
+    def _collect(self, t, nrmse, preds, prof):
+        if t["fold"] == FULL:
+            return
+        self.results[t["run"]][t["fold"]] = nrmse
+        if self.keep_oof:
+            k = self._fold_rows[t["run"]]
+            self.oof[t["run"]][t["fold"] // k, t["test_idx"]] = preds
+        if self.profile_log is not None:
+            round_trip = time.time() - t["submitted_at"]
+            self.profile_log.append(dict(
+                prof,
+                estimator=t["model_cls"].__name__,
+                group=t["run"][1],
+                fold=t["fold"],
+                nrmse=np.asarray(nrmse, dtype=float).tolist(),
+                dispatch_overhead_s=round_trip - prof["queue_wait_s"] - prof["wall_s"],
+            ))
+
+    def per_target(self, results=None):
+        """({(name, group, target): fold values}, {(name, group, target): OOF}) of the
+        multi-target runs."""
+        results = results if results is not None else self.results
+        folds, oof = {}, {}
+        for run, targets in self.targets.items():
+            vals = self._fold_values(run, results[run])
+            for j, target in enumerate(targets):
+                folds[run + (target,)] = vals[:, j]
+                if run in self.oof:
+                    oof[run + (target,)] = self.oof[run][..., j]
+        return folds, oof
+
+    def report(self):
+        s = self.stats
+        if s is None or s["n_tasks"] == 0:
+            print("Scheduler: nothing was fitted (all folds cached)")
+            return
+        print(f"Scheduler: {s['n_tasks']} folds in {s['makespan_s']:.1f} s on {s['n_cores']} cores | "
+              f"slot efficiency {s['slot_efficiency']:.1%} | "
+              f"CPU efficiency {s['cpu_efficiency']:.1%}")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Cross-validated nRMSE for a single (estimator, data) pair
+# runs through the same scheduler; folds already in `store` are reused
+#
+# adaptive=AdaptiveRule(...) adds repeats of the fold plan in batches and stops
+# once the requested precision is reached (see adaptive_cv.py); the returned
+# fold values then cover only the repeats that were used
+# ─────────────────────────────────────────────────────────────────────────────
+def cv_nrmse(model_cls, X, y, cv, y_stratify=None, cv_n_jobs=-1, store=None, group=None,
+             adaptive=None, baseline_vals=None, profile_log=None, backend=None, **model_kwargs):
+    scheduler = FoldScheduler(n_cores=cv_n_jobs, store=store, profile_log=profile_log,
+                              backend=backend)
+    run = (model_cls.__name__, group)
+    if adaptive is None:
+        scheduler.add_cv(*run, model_cls, X, y, cv, y_stratify=y_stratify, **model_kwargs)
+        nrmse_vals = scheduler.run()[run]
+    else:
+        spec = {"run": run, "model_cls": model_cls, "X": X, "y": y,
+                "y_stratify": y_stratify, "model_kwargs": model_kwargs,
+                "baseline_vals": baseline_vals}
+        fold_vals, _ = run_adaptive(scheduler, [spec], cv, adaptive)
+        nrmse_vals = fold_vals[run]
+    return np.mean(nrmse_vals), np.std(nrmse_vals), nrmse_vals
@@ -0,0 +1,144 @@
+import os
+import json
+import hashlib
+import tempfile
+
+import pandas as pd
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Columnar cache for unc_chao_fia_data.xlsx
+#
+# openpyxl parsing of the multi-sheet workbook dominates start-up of short
+# replot/debug runs. Each sheet, the cleaned modelling frame and the cut-plot
+# PLT_CN set are converted once to Parquet (pickle if pyarrow is missing)
+# under <workbook>_cache/<content hash>/, so editing the workbook invalidates
+# the cache automatically.
+# ─────────────────────────────────────────────────────────────────────────────
+
+TRT_COLS = ['TRTCD1', 'TRTCD2', 'TRTCD3']
+CUT_TRTCD = 10
+
+
+def workbook_hash(file_name, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _replace_atomic(path, write):
+    # write to a temp file next to path, then rename: a killed or concurrent
+    # run never leaves a truncated file under the final name
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _write_json(obj, path):
+    def write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(obj, f)
+    _replace_atomic(path, write)
+
+
+def _write_frame(df, path_stem):
+    try:
+        _replace_atomic(f"{path_stem}.parquet", lambda tmp: df.to_parquet(tmp, index=True))
+        return f"{path_stem}.parquet"
+    except (ImportError, ValueError, TypeError):
+        # no pyarrow, or object columns Arrow can't type -> keep it exact
+        if os.path.exists(f"{path_stem}.parquet"):
+            os.remove(f"{path_stem}.parquet")
+        _replace_atomic(f"{path_stem}.pkl", df.to_pickle)
+        return f"{path_stem}.pkl"
+
+
+def _read_frame(path_stem):
+    if os.path.exists(f"{path_stem}.parquet"):
+        return pd.read_parquet(f"{path_stem}.parquet")
+    if os.path.exists(f"{path_stem}.pkl"):
+        return pd.read_pickle(f"{path_stem}.pkl")
+    return None
+
+
+class WorkbookCache:
+    def __init__(self, file_name, na_values=None, cache_root=None):
+        self.file_name = file_name
+        self.na_values = na_values
+        self.hash = workbook_hash(file_name)
+        if cache_root is None:
+            cache_root = f"{os.path.splitext(file_name)[0]}_cache"
+        # na_values change how the sheets are parsed, so they are part of the key
+        na_tag = hashlib.sha1(json.dumps(sorted(na_values or [])).encode()).hexdigest()[:8]
+        self.cache_dir = os.path.join(cache_root, f"{self.hash[:16]}_{na_tag}")
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _stem(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    # ---- raw sheets ----------------------------------------------------------
+    def _convert_sheets(self):
+        sheets = pd.read_excel(self.file_name, sheet_name=None, na_values=self.na_values)
+        for name, df in sheets.items():
+            _write_frame(df, self._stem(f"sheet_{name}"))
+        _write_json(list(sheets), self._stem("sheets.json"))
+        return sheets
+
+    def sheet_names(self):
+        if not os.path.exists(self._stem("sheets.json")):
+            self._convert_sheets()
+        with open(self._stem("sheets.json")) as f:
+            return json.load(f)
+
+    def sheet(self, name):
+        df = _read_frame(self._stem(f"sheet_{name}"))
+        if df is None:
+            df = self._convert_sheets()[name]
+        return df
+
+    # ---- cleaned modelling frame ---------------------------------------------
+    def cleaned_frame(self):
+        """Same return value as model_utils.load_and_preprocess_data: (cleaned_df, short_tag)."""
+        # cleaned.json is written last and marks a complete pair; a frame
+        # without it (run killed in between) is rebuilt
+        meta = self._stem("cleaned.json")
+        if os.path.exists(meta):
+            df = _read_frame(self._stem("cleaned"))
+            if df is not None:
+                with open(meta) as f:
+                    return df, json.load(f)["short_tag"]
+
+        # imported here so a cache hit never pulls in model_utils' dependencies
+        from model_utils import load_and_preprocess_data
+        df, short_tag = load_and_preprocess_data(self.file_name, na_values=self.na_values)
+        _write_frame(df, self._stem("cleaned"))
+        _write_json({"short_tag": short_tag}, meta)
+        return df, short_tag
+
+    # ---- fia_cond treatment columns + cut plots ------------------------------
+    def treatment_columns(self):
+        df = _read_frame(self._stem("fia_cond_trt"))
+        if df is None:
+            fia_cond = self.sheet("fia_cond")
+            trt_cols = [c for c in TRT_COLS if c in fia_cond.columns]
+            df = fia_cond[['PLT_CN'] + trt_cols].copy()
+            _write_frame(df, self._stem("fia_cond_trt"))
+        return df
+
+    def cut_plot_cn(self):
+        """PLT_CN of plots with TRTCD = 10 (cutting) in any condition."""
+        df = _read_frame(self._stem("cut_plt_cn"))
+        if df is None:
+            trt = self.treatment_columns()
+            trt_cols = [c for c in TRT_COLS if c in trt.columns]
+            cut = trt.loc[trt[trt_cols].isin([CUT_TRTCD]).any(axis=1), 'PLT_CN']
+            df = pd.DataFrame({'PLT_CN': cut.drop_duplicates().values})
+            _write_frame(df, self._stem("cut_plt_cn"))
+        return set(df['PLT_CN'])
@@ -0,0 +1,308 @@
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Streaming zonal statistics: GFW / LandTrendr disturbance × biomass
+#
+# One pass over block-aligned windows of the biomass raster (non-forest =
+# nodata). The disturbance exports (GFW loss_year, LandTrendr
+# disturbance_year [+ disturbance_magnitude]) are read on the same windows —
+# through a nearest-neighbour WarpedVRT if they are not on the biomass grid.
+# Every window only adds to small per-source accumulators
+#     count[year], Σ AGB[year]        (year bins 2015…2022 + "undisturbed")
+# via np.bincount, plus the forest totals and the GFW ∩ LandTrendr agreement,
+# so peak memory is one window per worker whatever the domain size. Chunks of
+# windows run in a process pool and their accumulators are summed.
+#
+# From the sums, per year, per temporal proximity class and per gap period:
+#   area fraction             n_dist / n_forest
+#   biomass-weighted fraction Σ AGB_dist / Σ AGB_forest
+#   AGB density ratio         mean AGB_dist / mean AGB_forest
+#   worst-case mean shift     Σ AGB_dist / n_forest          [Mg/ha]
+#
+#   python disturbance_zonal.py --biomass agb.tif --gfw gfw_forest_loss.tif \
+#       --landtrendr landtrendr_disturbance_updated.tif --out-dir <OutBiomassRaster>/Disturbance
+#   python disturbance_zonal.py --demo                       # synthetic rasters
+#   python disturbance_zonal.py --check                      # known disturbed fraction
+# ─────────────────────────────────────────────────────────────────────────────
+
+YEARS = np.arange(2015, 2023)
+RS_WINDOW = (2018, 2019)
+PROXIMITY = {"Concurrent (0 yr)": (0, 0), "Near (1-2 yr)": (1, 2), "Far (3+ yr)": (3, 99)}
+GAP_PERIODS = {"Pre-RS gap (2015-2017)": (2015, 2017), "RS window (2018-2019)": (2018, 2019),
+               "Post-RS gap (2020-2022)": (2020, 2022)}
+MODEL_RMSE = 34.17                                         # Mg/ha, G20 full-model validation
+# year values up to this are raw Hansen lossyear codes (years since 2000);
+# DisturbanceAnalysisGFW.js already exports calendar years (lossyear + 2000)
+RAW_LOSSYEAR_MAX = 30
+
+
+def _rasterio():
+    try:
+        import rasterio
+    except ImportError as e:
+        raise ImportError("disturbance zonal statistics need rasterio (pip install rasterio)") from e
+    return rasterio
+
+
+def proximity(year):
+    """Years between a disturbance and the RS window (0 = concurrent)."""
+    return np.maximum(0, np.maximum(RS_WINDOW[0] - year, year - RS_WINDOW[1]))
+
+
+def gfw_source(path, year_offset=None):
+    # None: calendar years as exported, raw lossyear codes detected per pixel
+    return {"name": "GFW", "path": path, "year_band": 1, "year_offset": year_offset}
+
+
+def landtrendr_source(path, min_magnitude=None):
+    return {"name": "LandTrendr", "path": path, "year_band": 1, "year_offset": 0,
+            "magnitude_band": 2 if min_magnitude is not None else None,
+            "min_magnitude": min_magnitude}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Windows and per-window accumulation
+# ─────────────────────────────────────────────────────────────────────────────
+def aligned_windows(src, target_px=1024):
+    """Windows covering the raster, each a whole number of the file's blocks."""
+    from rasterio.windows import Window
+    bh, bw = src.block_shapes[0]
+    th = max(bh, target_px // bh * bh)
+    tw = max(bw, target_px // bw * bw) if bw < src.width else src.width
+    return [Window(c, r, min(tw, src.width - c), min(th, src.height - r))
+            for r in range(0, src.height, th) for c in range(0, src.width, tw)]
+
+
+def window_accumulators(agb, years, n_years=len(YEARS)):
+    """
+    agb   : (h, w) float, NaN outside forest
+    years : {source: (h, w) disturbance year, 0 / NaN = none}
+    Returns {"forest": [n, Σagb], source: (2 × n_years+1) [count; Σagb], "agreement": [n, Σagb]}.
+    """
+    forest = np.isfinite(agb)
+    a = agb[forest].astype(np.float64)
+    acc = {"forest": np.array([a.size, a.sum()])}
+    disturbed = {}
+    for name, yr in years.items():
+        y = np.nan_to_num(yr[forest], nan=0).astype(np.int64)
+        hit = (y >= YEARS[0]) & (y <= YEARS[-1])
+        idx = np.where(hit, y - YEARS[0], n_years)
+        acc[name] = np.vstack([np.bincount(idx, minlength=n_years + 1),
+                               np.bincount(idx, weights=a, minlength=n_years + 1)])
+        disturbed[name] = hit
+    if len(disturbed) >= 2:
+        both = np.logical_and.reduce(list(disturbed.values()))
+        acc["agreement"] = np.array([both.sum(), a[both].sum()])
+    return acc
+
+
+def _add(total, acc):
+    for k, v in acc.items():
+        total[k] = total[k] + v if k in total else v.astype(np.float64)
+    return total
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Worker side: datasets opened once per process
+# ─────────────────────────────────────────────────────────────────────────────
+_WORKER = {}
+
+
+def _open_on_grid(path, ref):
+    rasterio = _rasterio()
+    from rasterio.vrt import WarpedVRT
+    from rasterio.enums import Resampling
+    src = rasterio.open(path)
+    if (src.crs, src.transform, src.shape) == (ref.crs, ref.transform, ref.shape):
+        return src
+    return WarpedVRT(src, crs=ref.crs, transform=ref.transform, width=ref.width,
+                     height=ref.height, resampling=Resampling.nearest)
+
+
+def _init_zonal_worker(biomass_path, sources, cache_mb):
+    rasterio = _rasterio()
+    _WORKER.clear()
+    _WORKER["env"] = rasterio.Env(GDAL_CACHEMAX=cache_mb)
+    _WORKER["env"].__enter__()
+    _WORKER["bio"] = rasterio.open(biomass_path)
+    _WORKER["sources"] = [(s, _open_on_grid(s["path"], _WORKER["bio"])) for s in sources]
+
+
+def _read_years(src, spec, window):
+    yr = src.read(spec["year_band"], window=window, masked=True).astype(np.float64).filled(np.nan)
+    offset = spec.get("year_offset", 0)
+    if offset is None:
+        yr = np.where(yr <= RAW_LOSSYEAR_MAX, yr + 2000, yr)
+        offset = 0
+    yr = np.where(yr > 0, yr + offset, np.nan)
+    if spec.get("magnitude_band"):
+        mag = src.read(spec["magnitude_band"], window=window, masked=True).astype(np.float64).filled(0)
+        yr[np.abs(mag) < spec["min_magnitude"]] = np.nan
+    return yr
+
+
+def _zonal_task(windows):
+    total = {}
+    for window in windows:
+        agb = _WORKER["bio"].read(1, window=window, masked=True).astype(np.float64).filled(np.nan)
+        years = {s["name"]: _read_years(src, s, window) for s, src in _WORKER["sources"]}
+        _add(total, window_accumulators(agb, years))
+    return total
+
+
+def zonal_accumulators(biomass_path, sources, n_workers=-1, target_px=1024, windows_per_task=8,
+                       cache_mb=64):
+    rasterio = _rasterio()
+    with rasterio.open(biomass_path) as bio:
+        windows = aligned_windows(bio, target_px)
+        px_ha = abs(bio.transform.a * bio.transform.e) / 1e4
+    chunks = [windows[i:i + windows_per_task] for i in range(0, len(windows), windows_per_task)]
+    n_workers = os.cpu_count() if n_workers in (-1, None) else n_workers
+    total = {}
+    with ProcessPoolExecutor(max_workers=min(n_workers, len(chunks)), initializer=_init_zonal_worker,
+                             initargs=(biomass_path, sources, cache_mb)) as pool:
+        for acc in pool.map(_zonal_task, chunks):
+            _add(total, acc)
+    return total, px_ha, len(windows)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Metrics from the accumulators
+# ─────────────────────────────────────────────────────────────────────────────
+def _metrics(n, s, n_forest, agb_forest, px_ha):
+    mean_forest = agb_forest / n_forest
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "area_ha"           : n * px_ha,
+            "area_pct"          : n / n_forest * 100,
+            "biomass_Mg"        : s * px_ha,
+            "bio_weighted_pct"  : s / agb_forest * 100,
+            "mean_agb"          : s / n,
+            "density_ratio"     : (s / n) / mean_forest,
+            "worst_case_shift"  : s / n_forest,
+        }
+
+
+def zonal_tables(total, px_ha, sources, model_rmse=MODEL_RMSE):
+    n_forest, agb_forest = total["forest"]
+    annual, proximity_rows, gap_rows, cumulative = [], [], [], []
+    for spec in sources:
+        name = spec["name"]
+        cnt, s = total[name][0, :-1], total[name][1, :-1]
+        df = pd.DataFrame({"source": name, "year": YEARS,
+                           **_metrics(cnt, s, n_forest, agb_forest, px_ha)})
+        df["proximity_yr"] = proximity(YEARS)
+        annual.append(df)
+        for label, (lo, hi) in PROXIMITY.items():
+            m = (df["proximity_yr"] >= lo) & (df["proximity_yr"] <= hi)
+            proximity_rows.append({"source": name, "proximity": label,
+                                   "years": ",".join(map(str, YEARS[m.values])),
+                                   **_metrics(cnt[m].sum(), s[m].sum(), n_forest, agb_forest, px_ha)})
+        periods = {label: (YEARS >= lo) & (YEARS <= hi) for label, (lo, hi) in GAP_PERIODS.items()}
+        periods["All gap years"] = (YEARS < RS_WINDOW[0]) | (YEARS > RS_WINDOW[1])
+        for label, m in periods.items():
+            gap_rows.append({"source": name, "period": label,
+                             **_metrics(cnt[m].sum(), s[m].sum(), n_forest, agb_forest, px_ha)})
+        cumulative.append({"source": name, **_metrics(cnt.sum(), s.sum(), n_forest, agb_forest, px_ha)})
+    if "agreement" in total:
+        cumulative.append({"source": "Agreement", **_metrics(*total["agreement"], n_forest, agb_forest, px_ha)})
+    cumulative = pd.DataFrame(cumulative)
+    cumulative["shift_vs_rmse"] = cumulative["worst_case_shift"] / model_rmse
+    domain = pd.DataFrame([{"forest_ha": n_forest * px_ha, "pixel_ha": px_ha,
+                            "mean_agb": agb_forest / n_forest}])
+    return {"Domain": domain, "Combined_Annual": pd.concat(annual, ignore_index=True),
+            "Advanced_Metrics": cumulative, "Proximity_Breakdown": pd.DataFrame(proximity_rows),
+            "Gap_Periods": pd.DataFrame(gap_rows)}
+
+
+def write_tables(tables, out_dir, stem="time_mismatch_disturbance_summary"):
+    os.makedirs(out_dir, exist_ok=True)
+    annual = tables["Combined_Annual"]
+    sheets = {f"{s}_Annual": annual[annual["source"] == s] for s in annual["source"].unique()}
+    sheets.update(tables)
+    for name, df in sheets.items():
+        df.to_csv(os.path.join(out_dir, f"{stem}_{name}.csv"), index=False)
+    try:
+        with pd.ExcelWriter(os.path.join(out_dir, f"{stem}.xlsx")) as xl:
+            for name, df in sheets.items():
+                df.to_excel(xl, sheet_name=name[:31], index=False)
+    except ImportError:
+        pass                                   # no openpyxl: CSVs only
+    return sheets
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Known-answer check: half of a 64 × 64 forest disturbed in 2018, GFW year
+# band in both encodings (calendar year as exported, raw lossyear code)
+# ─────────────────────────────────────────────────────────────────────────────
+def check_known_fraction(out_dir, size=64):
+    rasterio = _rasterio()
+    from rasterio.transform import from_origin
+    os.makedirs(out_dir, exist_ok=True)
+    base = {"driver": "GTiff", "height": size, "width": size, "count": 1, "crs": "EPSG:32617",
+            "transform": from_origin(700000.0, 3900000.0, 30.0, 30.0)}
+    hit = np.zeros((size, size), dtype=bool)
+    hit[:, : size // 2] = True
+    paths = {"biomass": os.path.join(out_dir, "biomass.tif")}
+    with rasterio.open(paths["biomass"], "w", dtype="float32", **base) as dst:
+        dst.write(np.full((size, size), 100.0, dtype=np.float32), 1)
+    for name, year in [("calendar", 2018), ("raw", 18)]:
+        paths[name] = os.path.join(out_dir, f"gfw_{name}.tif")
+        with rasterio.open(paths[name], "w", dtype="float32", **base) as dst:
+            dst.write(np.where(hit, year, 0).astype(np.float32), 1)
+    for name in ("calendar", "raw"):
+        sources = [gfw_source(paths[name])]
+        total, px_ha, _ = zonal_accumulators(paths["biomass"], sources, n_workers=1)
+        row = zonal_tables(total, px_ha, sources)["Advanced_Metrics"].iloc[0]
+        if not np.isclose(row["area_pct"], 50.0):
+            raise AssertionError(f"GFW {name} encoding: area_pct {row['area_pct']:.3f}, expected 50")
+        print(f"GFW {name} encoding: area_pct {row['area_pct']:.1f} (expected 50.0) ok")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming disturbance × biomass zonal statistics")
+    parser.add_argument("--biomass", help="AGB raster (Mg/ha), non-forest = nodata")
+    parser.add_argument("--gfw", help="GFW loss_year export")
+    parser.add_argument("--gfw-year-offset", type=int, default=None,
+                        help="default: calendar years as exported by DisturbanceAnalysisGFW.js, "
+                             "raw Hansen lossyear codes (<= 30) + 2000")
+    parser.add_argument("--landtrendr", help="LandTrendr disturbance_year[/magnitude] export")
+    parser.add_argument("--lt-min-magnitude", type=float, default=None)
+    parser.add_argument("--out-dir", default="disturbance_zonal")
+    parser.add_argument("--workers", type=int, default=-1)
+    parser.add_argument("--window", type=int, default=1024, help="target window side in pixels")
+    parser.add_argument("--demo", action="store_true", help="run on synthetic rasters")
+    parser.add_argument("--check", action="store_true",
+                        help="check the disturbed fraction on a small raster of known content")
+    args = parser.parse_args()
+
+    if args.check:
+        check_known_fraction(os.path.join(args.out_dir, "check"))
+        raise SystemExit(0)
+
+    if args.demo:
+        from synthetic_fia import write_synthetic_disturbance
+        paths = write_synthetic_disturbance(os.path.join(args.out_dir, "synthetic"), 3000, 3000)
+        args.biomass, args.gfw, args.landtrendr = paths["biomass"], paths["gfw"], paths["landtrendr"]
+
+    sources = []
+    if args.gfw:
+        sources.append(gfw_source(args.gfw, args.gfw_year_offset))
+    if args.landtrendr:
+        sources.append(landtrendr_source(args.landtrendr, args.lt_min_magnitude))
+
+    t0 = time.perf_counter()
+    total, px_ha, n_windows = zonal_accumulators(args.biomass, sources, args.workers, args.window)
+    tables = zonal_tables(total, px_ha, sources)
+    write_tables(tables, args.out_dir)
+    print(f"{n_windows} windows in {time.perf_counter() - t0:.1f} s")
+    with pd.option_context("display.width", 160, "display.float_format", "{:.3f}".format):
+        print(tables["Advanced_Metrics"].to_string(index=False))
+        print(tables["Proximity_Breakdown"].to_string(index=False))
+    print(f"Saved tables to: {args.out_dir}")
@@ -0,0 +1,51 @@
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Figure rendering from saved results
+#
+# `python <benchmark script> --replot` redraws a script's figures from its
+# results CSV without fitting anything, so the script must not need
+# pytabkit / torch / sklearn for it: those are imported only on the
+# analysis path. Figures are drawn on the non-interactive Agg backend, one
+# worker process per figure.
+#
+# A FigureJob names an output file and a draw function (module level, so it
+# can be pickled) that returns a figure, or (figure, axes).
+# ─────────────────────────────────────────────────────────────────────────────
+
+FigureJob = namedtuple("FigureJob", ["out", "draw", "args", "kwargs", "savefig"],
+                       defaults=((), {}, {"dpi": 400}))
+
+
+def replot_requested(argv=None):
+    return "--replot" in (sys.argv[1:] if argv is None else argv)
+
+
+def use_agg():
+    """Switch to Agg; call before the first matplotlib.pyplot import."""
+    matplotlib.use("Agg", force=True)
+
+
+def _render(job):
+    import matplotlib.pyplot as plt
+    fig = job.draw(*job.args, **job.kwargs)
+    if isinstance(fig, tuple):
+        fig = fig[0]
+    fig.savefig(job.out, **job.savefig)
+    plt.close(fig)
+    return job.out
+
+
+def render_figures(jobs, n_workers=None):
+    """Draw and save every job; returns the output paths in job order."""
+    jobs = list(jobs)
+    n_workers = min(n_workers or os.cpu_count() or 1, len(jobs))
+    if n_workers <= 1:
+        return [_render(job) for job in jobs]
+    with ProcessPoolExecutor(n_workers, initializer=use_agg) as pool:
+        return list(pool.map(_render, jobs))
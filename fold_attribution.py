@@ -0,0 +1,254 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from cv_engine      import _limit_threads
+from fold_store     import FoldResultStore, data_hash
+from model_registry import ModelRegistry
+from shared_matrix  import SharedMatrix, default_share_root, remove_share_root
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Feature attribution over the fold models of the registry
+#
+# For every fold model of a CV run (estimator, group), on that fold's test
+# plots:
+#   permutation  increase in nRMSE when a unit's columns are shuffled
+#                (n_repeats shuffles); a unit is one feature or a block of
+#                features (CHM25, PROFILE, ...) shuffled jointly. All
+#                shuffled copies of the test matrix go through predict in a
+#                few large batches instead of one call per column.
+#   shap         tree SHAP of the xgboost / lightgbm / catboost boosters
+#                inside the estimator (native pred_contribs / ShapValues),
+#                reported as mean |SHAP| per unit (a block sums its
+#                features first); skipped for models without a booster.
+# Folds run in parallel worker processes on shared memmaps, and each
+# (model key, kind, units, settings) result is cached, so adding a group or
+# rerunning only computes the folds that are missing.
+#
+#   attr = FoldAttribution(registry, cache=f"{output_dir}/attribution_cache")
+#   attr.add("XGB", "G17", Xg_scaled, yg, plan, y_stratify=y_binned_g, blocks=blocks)
+#   table = attr.run(); summarize_attribution(table)
+#
+# This is an opt-in pass on top of a CV run that kept its fold models
+# (FoldScheduler(registry=...)); in Stage C, set model_registry and
+# run_attribution = True.
+# ─────────────────────────────────────────────────────────────────────────────
+
+KINDS = ("permutation", "shap")
+COLUMNS = ["estimator", "group", "fold", "kind", "unit", "unit_type", "n_features", "value",
+           "sd_repeats", "base_nrmse"]
+BOOSTER_MODULES = ("xgboost", "lightgbm", "catboost")
+
+
+def attribution_units(features, blocks=None):
+    """[(unit, unit type, column indices)]: every feature, then every block present."""
+    col = {f: i for i, f in enumerate(features)}
+    units = [(f, "feature", [i]) for i, f in enumerate(features)]
+    for name, feats in (blocks or {}).items():
+        cols = [col[f] for f in feats if f in col]
+        if cols:
+            units.append((name, "block", cols))
+    return units
+
+
+def _nrmse(y, P):
+    # rows of P are prediction vectors; RMSE / mean(y) as cv_engine.fold_nrmse
+    return np.sqrt(np.mean((P - y) ** 2, axis=-1)) / np.mean(y)
+
+
+def permutation_importance(model, X, y, units, n_repeats=5, seed=0, batch_rows=500_000):
+    """(base nRMSE, (units × n_repeats) nRMSE increase)."""
+    n = len(X)
+    base = float(_nrmse(y, np.asarray(model.predict(X)).ravel()))
+    copies = [(u, r) for u in range(len(units)) for r in range(n_repeats)]
+    perms = np.random.default_rng(seed).permuted(np.tile(np.arange(n), (len(copies), 1)), axis=1)
+    per_batch = max(1, batch_rows // max(n, 1))
+    scores = np.empty(len(copies))
+    for start in range(0, len(copies), per_batch):
+        chunk = copies[start:start + per_batch]
+        Xb = np.tile(X, (len(chunk), 1))
+        for j, (u, _) in enumerate(chunk):
+            cols = units[u][2]
+            Xb[j * n:(j + 1) * n, cols] = X[np.ix_(perms[start + j], cols)]
+        P = np.asarray(model.predict(Xb)).reshape(len(chunk), n)
+        scores[start:start + len(chunk)] = _nrmse(y, P)
+    return base, scores.reshape(len(units), n_repeats) - base
+
+
+def _boosters(obj, depth=6, seen=None):
+    """xgboost / lightgbm / catboost models inside a (pytabkit) estimator."""
+    seen = set() if seen is None else seen
+    if depth < 0 or id(obj) in seen:
+        return []
+    seen.add(id(obj))
+    if type(obj).__module__.split(".")[0] in BOOSTER_MODULES and hasattr(obj, "predict"):
+        return [obj]
+    if isinstance(obj, dict):
+        children = list(obj.values())
+    elif isinstance(obj, (list, tuple)):
+        children = list(obj)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+        children = list(vars(obj).values())
+    else:
+        return []
+    return [b for c in children for b in _boosters(c, depth - 1, seen)]
+
+
+def _contribs(booster, X):
+    # (n, p + 1) contributions, bias last
+    lib = type(booster).__module__.split(".")[0]
+    if lib == "xgboost":
+        import xgboost
+        b = booster.get_booster() if hasattr(booster, "get_booster") else booster
+        return b.predict(xgboost.DMatrix(X), pred_contribs=True)
+    if lib == "lightgbm":
+        return getattr(booster, "booster_", booster).predict(X, pred_contrib=True)
+    import catboost
+    return booster.get_feature_importance(catboost.Pool(X), type="ShapValues")
+
+
+def tree_shap(model, X):
+    """(n, p + 1) tree SHAP averaged over the boosters of the model, or None."""
+    out = []
+    for b in _boosters(model):
+        c = np.asarray(_contribs(b, X))
+        if c.ndim == 2 and c.shape[1] == X.shape[1] + 1:
+            out.append(c)
+    return np.mean(out, axis=0) if out else None
+
+
+def _attribute_fold(registry_root, key, handle, test_idx, units, kinds, n_repeats, seed,
+                    batch_rows, n_threads):
+    X, y = handle.open()
+    X_test = np.ascontiguousarray(X[test_idx])
+    y_test = np.asarray(y[test_idx])
+    model = ModelRegistry(registry_root).load_model(key)
+    out = {}
+    with _limit_threads(n_threads):
+        if "permutation" in kinds:
+            base, imp = permutation_importance(model, X_test, y_test, units, n_repeats, seed, batch_rows)
+            out["permutation"] = ({"base_nrmse": base}, imp)
+        if "shap" in kinds:
+            phi = tree_shap(model, X_test)
+            if phi is None:
+                out["shap"] = ({"base_nrmse": None, "available": False}, None)
+            else:
+                pred = np.asarray(model.predict(X_test)).ravel()
+                err = np.max(np.abs(phi.sum(axis=1) - pred)) / np.mean(np.abs(pred))
+                vals = np.array([np.mean(np.abs(phi[:, cols].sum(axis=1))) for _, _, cols in units])
+                out["shap"] = ({"base_nrmse": None, "available": True,
+                                "additivity_err": float(err)}, vals[:, None])
+    return out
+
+
+class FoldAttribution:
+    def __init__(self, registry, cache=None, kinds=KINDS, n_repeats=5, seed=0, n_cores=-1,
+                 threads_per_task=2, batch_rows=500_000):
+        self.registry = registry
+        self.cache = FoldResultStore(cache) if isinstance(cache, str) else cache
+        self.kinds = tuple(kinds)
+        self.n_repeats = n_repeats
+        self.seed = seed
+        self.n_cores = os.cpu_count() if n_cores in (None, -1) else int(n_cores)
+        self.threads_per_task = threads_per_task
+        self.batch_rows = batch_rows
+        self.tasks = []
+        self.rows = []
+
+    def _key(self, model_key, kind, units, fold):
+        payload = {"model": model_key, "kind": kind, "units": [(u, c) for u, _, c in units]}
+        if kind == "permutation":
+            payload.update(n_repeats=self.n_repeats, seed=[self.seed, fold])
+        return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def _rows(self, label, group, fold, kind, units, rec, arr):
+        if arr is None:
+            return
+        for (unit, utype, cols), vals in zip(units, arr):
+            self.rows.append({"estimator": label, "group": group, "fold": fold, "kind": kind,
+                              "unit": unit, "unit_type": utype, "n_features": len(cols),
+                              "value": float(np.mean(vals)),
+                              "sd_repeats": float(np.std(vals)) if len(vals) > 1 else np.nan,
+                              "base_nrmse": rec.get("base_nrmse")})
+
+    def add(self, label, group, X, y, plan, y_stratify=None, blocks=None, folds=None):
+        """Queue every fold model of the run (label, group) trained on exactly (X, y)."""
+        dhash = data_hash(X.astype(np.float32), y, y_stratify)
+        models = self.registry.fold_models(label, group, data_hash=dhash)
+        if not models:
+            print(f"Attribution: no fold models for {label}/{group} on this data, skipped")
+            return
+        features = [str(c) for c in X.columns]
+        units = attribution_units(features, blocks)
+        splits = list(plan.split(X))
+        handle = None
+        for fold, entry in models.items():
+            if folds is not None and fold not in folds:
+                continue
+            if entry.features != features:
+                raise ValueError(f"{entry}: model features differ from the columns of X")
+            todo = []
+            for kind in self.kinds:
+                ckey = self._key(entry.key, kind, units, fold)
+                rec = self.cache.get(ckey) if self.cache is not None else None
+                if rec is None:
+                    todo.append((kind, ckey))
+                else:
+                    self._rows(label, group, fold, kind, units, rec,
+                               self.cache.get_array(ckey) if rec.get("available", True) else None)
+            if todo:
+                self.tasks.append({"label": label, "group": group, "fold": fold, "key": entry.key,
+                                   "data": (f"{group}_{dhash[:16]}", X, y), "test_idx": splits[fold][1],
+                                   "units": units, "todo": todo})
+
+    def run(self):
+        """Compute the queued folds; long table of every (run, fold, kind, unit)."""
+        tasks, self.tasks = self.tasks, []
+        if tasks:
+            share_root = default_share_root()
+            n_workers = max(1, min(len(tasks), self.n_cores // self.threads_per_task))
+            print(f"Attribution: {len(tasks)} fold models, {n_workers} workers")
+            try:
+                handles = {}
+                for t in tasks:
+                    data_id, X, y = t["data"]
+                    if data_id not in handles:
+                        handles[data_id] = SharedMatrix.create(share_root, data_id, X, y)
+                with ProcessPoolExecutor(n_workers) as pool:
+                    futures = {pool.submit(_attribute_fold, self.registry.root, t["key"],
+                                           handles[t["data"][0]], t["test_idx"], t["units"],
+                                           [k for k, _ in t["todo"]], self.n_repeats,
+                                           [self.seed, t["fold"]], self.batch_rows,
+                                           self.threads_per_task): t for t in tasks}
+                    for fut in as_completed(futures):
+                        t = futures[fut]
+                        out = fut.result()
+                        for kind, ckey in t["todo"]:
+                            rec, arr = out[kind]
+                            if self.cache is not None:
+                                # array first: a record always implies its values
+                                if arr is not None:
+                                    self.cache.put_array(ckey, arr)
+                                self.cache.put(ckey, rec)
+                            self._rows(t["label"], t["group"], t["fold"], kind, t["units"], rec, arr)
+            finally:
+                remove_share_root(share_root)
+        # columns= keeps the usual (empty) table when no fold model was found
+        return pd.DataFrame(self.rows, columns=COLUMNS).sort_values(
+            ["estimator", "group", "kind", "unit_type", "unit", "fold"]).reset_index(drop=True)
+
+
+def summarize_attribution(df):
+    """Mean / SD over folds per (estimator, group, kind, unit), ranked within unit type."""
+    keys = ["estimator", "group", "kind", "unit_type", "unit"]
+    out = (df.groupby(keys, sort=False)
+             .agg(n_features=("n_features", "first"), n_folds=("fold", "nunique"),
+                  mean=("value", "mean"), sd=("value", "std"))
+             .reset_index())
+    out["rank"] = (out.groupby(keys[:-1])["mean"].rank(ascending=False, method="min")
+                      .astype(int))
+    return out.sort_values(keys[:-1] + ["rank"]).reset_index(drop=True)
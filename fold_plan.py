@@ -0,0 +1,135 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import KBinsDiscretizer
+from sklearn.model_selection import RepeatedKFold, RepeatedStratifiedKFold
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Shared fold plan
+#
+# One repeated (stratified) K-fold assignment computed on the plots that are
+# complete for *every* feature group of a stage, stored as an int8 array
+# (n_repeats × n_plots) of fold ids. All estimators and groups split with the
+# same plan, so fold k of group A and fold k of the baseline test the same
+# plots and ttest_rel really compares matched folds.
+#
+# FoldPlan.split(X, y) has the sklearn CV signature, so it drops in wherever a
+# RepeatedKFold / RepeatedStratifiedKFold object was used before.
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def quantile_strata(y, n_bins=10):
+    """Quantile bins of the target used for stratification (same as Stage C)."""
+    binner = KBinsDiscretizer(n_bins=n_bins, encode='ordinal', strategy='quantile')
+    y_binned_array = binner.fit_transform(np.asarray(y).reshape(-1, 1)).flatten()
+    return pd.Series(y_binned_array, index=getattr(y, "index", None))
+
+
+def common_plot_index(df, feature_lists, y=None):
+    """Index of plots with no NaN in any of the feature lists (and in y, or any
+    column of a multi-target y)."""
+    cols = list(dict.fromkeys(c for feats in feature_lists for c in feats))
+    mask = df[cols].notna().all(axis=1)
+    if y is not None:
+        ok = y.loc[df.index].notna()
+        mask &= ok.all(axis=1) if ok.ndim == 2 else ok
+    return df.index[mask]
+
+
+class FoldPlan:
+    def __init__(self, index, assignment, n_splits, random_state=None, stratified=False):
+        self.index = pd.Index(index)
+        self.assignment = np.asarray(assignment, dtype=np.int8)
+        self.n_splits = int(n_splits)
+        self.n_repeats = self.assignment.shape[0]
+        self.random_state = random_state
+        self.stratified = bool(stratified)
+        self._splits = None
+        # content hash of the plan; fold_store keys every task on it via
+        # repr(), so it is computed once here rather than per task
+        h = hashlib.sha1()
+        h.update(pd.util.hash_pandas_object(self.index.to_series(), index=False).values.tobytes())
+        h.update(self.assignment.tobytes())
+        h.update(f"{self.n_splits}".encode())
+        self.hash = h.hexdigest()
+
+    @classmethod
+    def build(cls, index, n_splits=5, n_repeats=10, random_state=42, strata=None):
+        index = pd.Index(index)
+        n = len(index)
+        if strata is not None:
+            cv = RepeatedStratifiedKFold(n_splits=n_splits, n_repeats=n_repeats, random_state=random_state)
+            splits = cv.split(np.zeros(n), np.asarray(strata))
+        else:
+            cv = RepeatedKFold(n_splits=n_splits, n_repeats=n_repeats, random_state=random_state)
+            splits = cv.split(np.zeros(n))
+
+        assignment = np.full((n_repeats, n), -1, dtype=np.int8)
+        for i, (_, test_idx) in enumerate(splits):
+            assignment[i // n_splits, test_idx] = i % n_splits
+        return cls(index, assignment, n_splits, random_state, stratified=strata is not None)
+
+    # ---- identity ------------------------------------------------------------
+    def __repr__(self):
+        # used by fold_store.cv_signature -> the store key follows the plan
+        return (f"FoldPlan(n_splits={self.n_splits}, n_repeats={self.n_repeats}, "
+                f"random_state={self.random_state}, stratified={self.stratified}, "
+                f"hash={self.hash[:16]})")
+
+    def __len__(self):
+        return self.n_splits * self.n_repeats
+
+    # ---- sklearn CV interface ------------------------------------------------
+    def get_n_splits(self, X=None, y=None, groups=None):
+        return len(self)
+
+    def split(self, X=None, y=None, groups=None):
+        if X is not None:
+            if len(X) != len(self.index):
+                raise ValueError(f"X has {len(X)} rows but the fold plan covers {len(self.index)} plots")
+            if hasattr(X, "index") and not X.index.equals(self.index):
+                raise ValueError("X is not aligned with the fold plan index")
+        if self._splits is None:
+            self._splits = []
+            for r in range(self.n_repeats):
+                for k in range(self.n_splits):
+                    in_test = self.assignment[r] == k
+                    self._splits.append((np.flatnonzero(~in_test), np.flatnonzero(in_test)))
+        return iter(self._splits)
+
+    # ---- persistence ---------------------------------------------------------
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            index=np.asarray(self.index),
+            assignment=self.assignment,
+            meta=json.dumps({"n_splits": self.n_splits, "random_state": self.random_state,
+                             "stratified": self.stratified}),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=True) as z:
+            meta = json.loads(str(z["meta"]))
+            return cls(z["index"], z["assignment"], meta["n_splits"],
+                       meta["random_state"], meta["stratified"])
+
+    @classmethod
+    def load_or_build(cls, plan_dir, index, n_splits=5, n_repeats=10, random_state=42, strata=None):
+        """Reuse a saved plan for the same plots / strata / scheme, otherwise build and save it."""
+        h = hashlib.sha1()
+        h.update(pd.util.hash_pandas_object(pd.Index(index).to_series(), index=False).values.tobytes())
+        if strata is not None:
+            h.update(np.ascontiguousarray(strata, dtype=np.float64).tobytes())
+        h.update(f"{n_splits}-{n_repeats}-{random_state}".encode())
+        path = os.path.join(plan_dir, f"foldplan_{h.hexdigest()[:16]}.npz")
+
+        if os.path.exists(path):
+            return cls.load(path)
+        plan = cls.build(index, n_splits, n_repeats, random_state, strata)
+        os.makedirs(plan_dir, exist_ok=True)
+        plan.save(path)
+        return plan
@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+import time
+import resource
+import threading
+
+import pandas as pd
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Per-fold profiling for the CV engine
+#
+# With FoldScheduler(profile_log=...), every fitted fold appends one JSON line:
+#   estimator, group, fold, n_train, n_test, n_threads, worker_pid,
+#   queue_wait_s (submit -> worker start), slice_s, fit_s, predict_s,
+#   wall_s / cpu_s (whole task in the worker), dispatch_overhead_s
+#   (round trip minus queue wait and worker wall time), peak_rss_mb
+#   (largest resident set of the worker while this fold ran, sampled every
+#   50 ms by RSSSampler), rss_growth_mb (that peak minus the RSS at the start
+#   of the fold), worker_peak_rss_mb (the worker process's lifetime
+#   high-water mark, ru_maxrss: in a reused worker it includes every earlier
+#   task).
+# summarize_profile() aggregates the log per estimator and group.
+#
+#   python fold_profiler.py <output_dir>/fold_profile.jsonl
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def peak_rss_mb():
+    """Lifetime high-water mark of this process's RSS (MB)."""
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 ** 2) if sys.platform == "darwin" else rss / 1024
+
+
+def current_rss_mb():
+    """Resident set size of this process right now (MB)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return peak_rss_mb()
+    return psutil.Process().memory_info().rss / 1024 ** 2
+
+
+class RSSSampler:
+    """Peak RSS while the with-block runs, polled by a daemon thread."""
+
+    def __init__(self, interval_s=0.05):
+        self.interval_s = interval_s
+        self.start_mb = self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _poll(self):
+        while not self._stop.wait(self.interval_s):
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+    def __enter__(self):
+        self.start_mb = self.peak_mb = current_rss_mb()
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, current_rss_mb())
+        return False
+
+    @property
+    def growth_mb(self):
+        return self.peak_mb - self.start_mb
+
+
+class ProfileLog:
+    """Append-only JSON-lines log, written by the scheduler (single writer)."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def append(self, record):
+        record = dict(record, logged_at=time.time())
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+
+def load_profile(path):
+    with open(path) as f:
+        return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+
+def summarize_profile(path_or_df):
+    df = load_profile(path_or_df) if isinstance(path_or_df, str) else path_or_df
+    if "worker_peak_rss_mb" not in df:
+        df = df.assign(worker_peak_rss_mb=float("nan"))        # older logs
+    return (df.groupby(["estimator", "group"])
+              .agg(n_folds=("fold", "size"),
+                   n_threads=("n_threads", "max"),
+                   fit_s_mean=("fit_s", "mean"),
+                   fit_s_p95=("fit_s", lambda s: s.quantile(0.95)),
+                   predict_s_mean=("predict_s", "mean"),
+                   slice_s_mean=("slice_s", "mean"),
+                   queue_wait_s_mean=("queue_wait_s", "mean"),
+                   dispatch_overhead_s_mean=("dispatch_overhead_s", "mean"),
+                   wall_s_total=("wall_s", "sum"),
+                   cpu_s_total=("cpu_s", "sum"),
+                   peak_rss_mb_max=("peak_rss_mb", "max"),
+                   rss_growth_mb_max=("rss_growth_mb", "max"),
+                   worker_peak_rss_mb_max=("worker_peak_rss_mb", "max"))
+              .reset_index())
+
+
+def print_profile_summary(path_or_df):
+    summary = summarize_profile(path_or_df)
+    with pd.option_context("display.width", 200, "display.max_columns", None,
+                           "display.float_format", "{:.3f}".format):
+        print(summary.to_string(index=False))
+    return summary
+
+
+if __name__ == "__main__":
+    log_path = sys.argv[1] if len(sys.argv) > 1 else "fold_profile.jsonl"
+    summary = print_profile_summary(log_path)
+    out_csv = os.path.splitext(log_path)[0] + "_summary.csv"
+    summary.to_csv(out_csv, index=False)
+    print(f"Saved profile summary to: {out_csv}")
@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Persistent per-fold result store
+#
+# Every (estimator, feature group, fold) CV task is written to its own small
+# JSON file as soon as it finishes, with its test-fold predictions next to it
+# as .npy. The file name is a hash of everything that determines the result
+# (estimator, group, fold index, CV scheme + seed, model kwargs, data hash
+# incl. feature list), so a rerun after preemption only fits the folds that
+# are missing, and adding a new group only costs its own folds.
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def data_hash(X, y, y_stratify=None):
+    """Content hash of the predictors (values, index, feature list) and target."""
+    h = hashlib.sha1()
+    h.update(json.dumps([str(c) for c in X.columns]).encode())
+    h.update(pd.util.hash_pandas_object(X, index=True).values.tobytes())
+    h.update(pd.util.hash_pandas_object(y, index=True).values.tobytes())
+    if y_stratify is not None:
+        h.update(np.ascontiguousarray(y_stratify).tobytes())
+    return h.hexdigest()
+
+
+def cv_signature(cv):
+    """CV scheme + seed, e.g. 'RepeatedStratifiedKFold(n_repeats=10, n_splits=5, random_state=42)'."""
+    return repr(cv)
+
+
+def task_key(estimator, group, fold, cv, model_kwargs, dhash):
+    payload = json.dumps({
+        "estimator"   : estimator,
+        "group"       : group,
+        "fold"        : int(fold),
+        "cv"          : cv_signature(cv),
+        "cv_seed"     : getattr(cv, "random_state", None),
+        "model_kwargs": model_kwargs,
+        "data_hash"   : dhash,
+    }, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class FoldResultStore:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # half-written / corrupt record -> treat as missing and refit
+            return None
+
+    def get_many(self, keys):
+        return {k: rec for k in keys if (rec := self.get(k)) is not None}
+
+    def put(self, key, record):
+        # write to a temp file and rename so a killed job never leaves a
+        # truncated record behind
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(record, f, default=str)
+        os.replace(tmp, path)
+
+    # out-of-fold predictions of a task live next to its JSON record; write
+    # them before the record so a record always implies its predictions
+    def put_array(self, key, arr):
+        path = self._path(key)[:-len(".json")] + ".npy"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".npy.tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.asarray(arr))
+        os.replace(tmp, path)
+
+    def get_array(self, key):
+        path = self._path(key)[:-len(".json")] + ".npy"
+        if not os.path.exists(path):
+            return None
+        try:
+            return np.load(path)
+        except (OSError, ValueError):
+            return None
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def __len__(self):
+        return sum(len([f for f in files if f.endswith(".json")])
+                   for _, _, files in os.walk(self.root))
@@ -0,0 +1,344 @@
+import os
+import json
+import math
+import hashlib
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from cv_engine import FoldScheduler
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Successive-halving hyperparameter search on a search fold plan
+#
+# The search never scores the folds the benchmarks report on: it runs on its
+# own FoldPlan over the same plots, drawn with the stage's seed +
+# SEARCH_SEED_OFFSET (or --plan-seed). The winner's entry records that
+# plan's hash, and load_best_params(..., benchmark_plan=plan) drops entries
+# that were selected on the benchmark plan itself.
+#
+# Every configuration is first scored on the first `min_repeats` repeats of
+# the search plan; only the best 1/eta move on to eta× more repeats,
+# until a rung at the plan's full number of repeats picks the winner. Since
+# repeats are added in plan order, a promoted configuration keeps the folds
+# it already has, and all configurations are compared on matched folds.
+# The tuned defaults ({} = the pytabkit *_TD_Regressor settings) are always
+# configuration 0.
+#
+# Several searches (estimator × group, or Hyperband brackets) run side by
+# side: each rung of every search goes into one FoldScheduler round, so the
+# cores stay busy across configurations. Folds are saved in the fold store
+# under <output_dir>/fold_cache, and each search writes its state after
+# every rung, so an interrupted search resumes where it stopped. None of
+# these folds are reused by the benchmarks: they run on another plan (see
+# above), and Stage C also keeps its own fold_cache.
+#
+#   python hparam_search.py experiments.json --stage stageC --n-configs 27
+#   -> the config's "tuned_params" (OutBiomassRaster/hpo/best_params.json),
+#      read by run_experiments.py and by the Stage A / C scripts
+#      (<output_dir>/hpo/best_params.json if the config sets none)
+# ─────────────────────────────────────────────────────────────────────────────
+
+# (kind, low, high) or ("choice", values); parameter names of pytabkit's
+# *_TD_Regressor constructors
+# the search plan's seed is the benchmark plan's seed + this
+SEARCH_SEED_OFFSET = 1000
+
+SEARCH_SPACES = {
+    "XGB_TD_Regressor": {
+        "lr"              : ("log", 0.01, 0.3),
+        "max_depth"       : ("int", 3, 10),
+        "subsample"       : ("float", 0.5, 1.0),
+        "colsample_bytree": ("float", 0.5, 1.0),
+        "min_child_weight": ("log", 1e-3, 20.0),
+        "reg_lambda"      : ("log", 1e-3, 10.0),
+    },
+    "LGBM_TD_Regressor": {
+        "lr"              : ("log", 0.01, 0.3),
+        "num_leaves"      : ("int", 8, 128),
+        "subsample"       : ("float", 0.5, 1.0),
+        "colsample_bytree": ("float", 0.5, 1.0),
+        "min_data_in_leaf": ("int", 2, 60),
+    },
+    "CatBoost_TD_Regressor": {
+        "lr"              : ("log", 0.01, 0.3),
+        "depth"           : ("int", 4, 10),
+        "l2_leaf_reg"     : ("log", 0.5, 30.0),
+    },
+    "RealMLP_TD_Regressor": {
+        "lr"              : ("log", 0.01, 0.15),
+        "n_epochs"        : ("choice", [128, 256]),
+        "p_drop"          : ("float", 0.0, 0.3),
+        "wd"              : ("choice", [0.0, 0.02]),
+    },
+}
+
+
+def _draw(rng, spec):
+    kind = spec[0]
+    if kind == "choice":
+        return spec[1][rng.integers(len(spec[1]))]
+    lo, hi = spec[1], spec[2]
+    if kind == "int":
+        return int(rng.integers(lo, hi + 1))
+    v = math.exp(rng.uniform(math.log(lo), math.log(hi))) if kind == "log" else rng.uniform(lo, hi)
+    return float(f"{v:.4g}")                      # short, JSON-stable values
+
+
+def config_id(params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:8]
+
+
+def sample_configs(space, n_configs, seed=0):
+    """{config_id: params}; the first is {} (estimator defaults)."""
+    rng = np.random.default_rng(seed)
+    configs = {config_id({}): {}}
+    for _ in range(100 * n_configs):
+        if len(configs) >= n_configs:
+            break
+        params = {name: _draw(rng, spec) for name, spec in space.items()}
+        configs.setdefault(config_id(params), params)
+    return configs
+
+
+def hyperband_brackets(max_repeats, eta=3):
+    """(n_configs, min_repeats) per Hyperband bracket, most aggressive first."""
+    s_max = int(math.floor(math.log(max_repeats, eta) + 1e-9))
+    return [(int(math.ceil((s_max + 1) / (s + 1) * eta ** s)), max(1, int(max_repeats // eta ** s)))
+            for s in range(s_max, -1, -1)]
+
+
+def _atomic_json(obj, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(obj, f, indent=1, default=str)
+    os.replace(tmp, path)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# One successive-halving run for one (estimator, group)
+# ─────────────────────────────────────────────────────────────────────────────
+class HalvingSearch:
+    def __init__(self, label, group, model_cls, X, y, plan, configs, y_stratify=None,
+                 model_kwargs=None, eta=3, min_repeats=1, max_repeats=None, state_path=None,
+                 bracket=0):
+        self.label, self.group, self.bracket = label, group, bracket
+        self.model_cls, self.X, self.y, self.y_stratify = model_cls, X, y, y_stratify
+        self.plan = plan
+        self.model_kwargs = dict(model_kwargs or {})
+        self.eta = eta
+        self.min_repeats = int(min_repeats)
+        self.max_repeats = min(max_repeats or plan.n_repeats, plan.n_repeats)
+        self.state_path = state_path
+
+        settings = {"configs": sorted(configs), "eta": eta, "min_repeats": self.min_repeats,
+                    "max_repeats": self.max_repeats, "plan": plan.hash,
+                    "model_kwargs": self.model_kwargs}
+        state = None
+        if state_path and os.path.exists(state_path):
+            with open(state_path) as f:
+                state = json.load(f)
+            if state.get("settings") != json.loads(json.dumps(settings, default=str)):
+                print(f"{state_path}: search settings changed, starting over")
+                state = None
+        self.state = state or {"settings": settings, "configs": configs, "alive": list(configs),
+                               "rung": 0, "history": [], "best": None}
+
+    def __repr__(self):
+        return (f"HalvingSearch({self.label}, {self.group}, bracket={self.bracket}, "
+                f"alive={len(self.state['alive'])}, rung={self.state['rung']})")
+
+    @property
+    def done(self):
+        return self.state["best"] is not None
+
+    def n_repeats(self, rung=None):
+        rung = self.state["rung"] if rung is None else rung
+        return min(self.min_repeats * self.eta ** rung, self.max_repeats)
+
+    def run_name(self, cid):
+        return f"{self.label}[{cid}]"
+
+    def submit(self, scheduler):
+        # all folds up to this rung; folds of earlier rungs are already filled in
+        K = self.plan.n_splits
+        for cid in self.state["alive"]:
+            kwargs = dict(self.model_kwargs, **self.state["configs"][cid])
+            scheduler.add_cv(self.run_name(cid), self.group, self.model_cls, self.X, self.y,
+                             self.plan, y_stratify=self.y_stratify,
+                             folds=range(self.n_repeats() * K), **kwargs)
+
+    def advance(self, results):
+        r = self.n_repeats()
+        n = r * self.plan.n_splits
+        scores = {cid: float(np.mean(results[(self.run_name(cid), self.group)][:n]))
+                  for cid in self.state["alive"]}
+        ranked = sorted(scores, key=scores.get)
+        self.state["history"].append({"rung": self.state["rung"], "n_repeats": r, "scores": scores})
+        if r >= self.max_repeats:
+            self.state["best"] = ranked[0]
+        else:
+            self.state["alive"] = ranked[:max(1, len(ranked) // self.eta)]
+            self.state["rung"] += 1
+        if self.state_path:
+            _atomic_json(self.state, self.state_path)
+
+    def best(self):
+        """{params, config_id, cv_nrmse, n_repeats} of the winner (after the search)."""
+        cid = self.state["best"]
+        last = self.state["history"][-1]
+        return {"params": self.state["configs"][cid], "config_id": cid,
+                "cv_nrmse": last["scores"][cid], "n_repeats": last["n_repeats"],
+                "plan": self.plan.hash}
+
+    def log(self):
+        rows = []
+        for h in self.state["history"]:
+            for cid, score in h["scores"].items():
+                rows.append({"estimator": self.label, "group": self.group, "bracket": self.bracket,
+                             "rung": h["rung"], "n_repeats": h["n_repeats"], "config_id": cid,
+                             "params": json.dumps(self.state["configs"][cid], sort_keys=True),
+                             "cv_nrmse": score})
+        return rows
+
+
+def run_searches(scheduler, searches):
+    """Advance every search rung by rung, all rungs of a round in one scheduler run."""
+    rounds = 0
+    while True:
+        active = [s for s in searches if not s.done]
+        if not active:
+            break
+        for s in active:
+            s.submit(scheduler)
+        results = scheduler.run()
+        for s in active:
+            s.advance(results)
+        rounds += 1
+        print(f"Search round {rounds}: " + ", ".join(
+            f"{s.label}/{s.group}/b{s.bracket} " + (f"best={s.state['best']}" if s.done
+                                                   else f"{len(s.state['alive'])} alive")
+            for s in active))
+    return searches
+
+
+def best_per_run(searches):
+    """Winner per (estimator label, group); across Hyperband brackets by full-plan nRMSE."""
+    best = {}
+    for s in searches:
+        b = s.best()
+        cur = best.get((s.label, s.group))
+        if cur is None or (b["n_repeats"], -b["cv_nrmse"]) > (cur["n_repeats"], -cur["cv_nrmse"]):
+            best[(s.label, s.group)] = b
+    return best
+
+
+def save_best_params(best, path):
+    """Merge {(label, group): best} into best_params.json ({label: {group: entry}})."""
+    out = load_best_params(path, params_only=False)
+    for (label, group), b in best.items():
+        out.setdefault(label, {})[group] = b
+    _atomic_json(out, path)
+    return path
+
+
+def load_best_params(path, params_only=True, benchmark_plan=None):
+    """{label: {group: params}} from best_params.json ({} if there is none yet).
+    With benchmark_plan, settings searched on that plan's folds are left out."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        out = json.load(f)
+    if benchmark_plan is not None:
+        for label, by_group in out.items():
+            for g in [g for g, b in by_group.items() if b.get("plan") == benchmark_plan.hash]:
+                print(f"{label}/{g}: tuned on the benchmark's own folds ({benchmark_plan.hash}), "
+                      f"using the defaults")
+                del by_group[g]
+    if params_only:
+        return {label: {g: b["params"] for g, b in by_group.items()} for label, by_group in out.items()}
+    return out
+
+
+def tuned_kwargs(tuned, label, group):
+    return dict(tuned.get(label, {}).get(group, {}))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# MAIN: search on the fold plan and design matrices of an experiment stage
+# ─────────────────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    from fold_store      import FoldResultStore
+    from run_experiments import build_dag, build_plans, design_matrix, resolve_estimator
+
+    parser = argparse.ArgumentParser(description="Successive-halving search over estimator settings")
+    parser.add_argument("config", nargs="?", default="experiments.json")
+    parser.add_argument("--stage", required=True)
+    parser.add_argument("--estimator", action="append", help="only these estimators (repeatable)")
+    parser.add_argument("--group", action="append", help="only these groups (repeatable)")
+    parser.add_argument("--n-configs", type=int, default=27)
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--min-repeats", type=int, default=1)
+    parser.add_argument("--hyperband", action="store_true", help="run all Hyperband brackets")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--plan-seed", type=int, default=None,
+                        help="seed of the search fold plan (default: stage seed + SEARCH_SEED_OFFSET)")
+    parser.add_argument("--out", default=None,
+                        help="default: directory of the config's tuned_params, else <output_dir>/hpo")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    config = dict(config, stages=[s for s in config["stages"] if s["name"] == args.stage])
+    if not config["stages"]:
+        raise SystemExit(f"no stage {args.stage!r} in {args.config}")
+    # same plots and scheme, other folds than the benchmark plan
+    stage = config["stages"][0]
+    bench_seed = stage.get("cv", {}).get("random_state", 42)
+    plan_seed = bench_seed + SEARCH_SEED_OFFSET if args.plan_seed is None else args.plan_seed
+    if plan_seed == bench_seed:
+        raise SystemExit("--plan-seed must differ from the benchmark plan's seed")
+    config["stages"] = [dict(stage, cv=dict(stage.get("cv", {}), random_state=plan_seed))]
+    out_dir = args.out or (os.path.dirname(config["tuned_params"]) if config.get("tuned_params")
+                           else f"{config['output_dir']}/hpo")
+    store = FoldResultStore(f"{config['output_dir']}/fold_cache")
+
+    jobs, _ = build_dag(dict(config, tuned_params=None))
+    jobs = {j: s for j, s in jobs.items()
+            if (not args.estimator or s["estimator"] in args.estimator)
+            and (not args.group or s["group"] in args.group)}
+    plans = build_plans(config, jobs)
+
+    searches = []
+    for job_id, spec in jobs.items():
+        plan, df, y = plans[spec["plan_key"]]
+        cls_name = config["estimators"][spec["estimator"]]
+        X = design_matrix(df, plan.index, spec["group"])
+        brackets = (hyperband_brackets(plan.n_repeats, args.eta) if args.hyperband
+                    else [(args.n_configs, args.min_repeats)])
+        for b, (n_configs, min_rep) in enumerate(brackets):
+            configs = sample_configs(SEARCH_SPACES.get(cls_name, {}), n_configs, args.seed + b)
+            searches.append(HalvingSearch(
+                spec["estimator"], spec["group"], resolve_estimator(cls_name), X, y, plan, configs,
+                model_kwargs=spec["model_kwargs"], eta=args.eta, min_repeats=min_rep,
+                state_path=f"{out_dir}/state/{spec['estimator']}__{spec['group']}__b{b}.json",
+                bracket=b))
+
+    scheduler = FoldScheduler(n_cores=config.get("n_cores", -1), store=store, keep_oof=False)
+    run_searches(scheduler, searches)
+    scheduler.report()
+
+    log = pd.DataFrame([row for s in searches for row in s.log()])
+    log.to_csv(f"{out_dir}/search_log.csv", index=False)
+    best = best_per_run(searches)
+    for (label, group), b in best.items():
+        default = log[(log["estimator"] == label) & (log["group"] == group)
+                      & (log["config_id"] == config_id({}))
+                      & (log["n_repeats"] == b["n_repeats"])]["cv_nrmse"]
+        vs = f" (defaults {default.iloc[0]:.4f})" if len(default) else ""
+        print(f"{label:>9s} {group:>6s}: nRMSE {b['cv_nrmse']:.4f}{vs} on {b['n_repeats']} repeats, "
+              f"{b['params'] or 'defaults'}")
+    print(f"Saved: {save_best_params(best, f'{out_dir}/best_params.json')}")
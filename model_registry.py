@@ -0,0 +1,220 @@
+import os
+import json
+import glob
+import argparse
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Fitted-model registry
+#
+# Fold models (and full-data refits, fold = FULL) are saved as they are
+# fitted, under the same task key as the fold result store:
+#     <root>/<key[:2]>/<key>.joblib     the fitted estimator (zlib-compressed)
+#     <root>/<key[:2]>/<key>.json       estimator, group, fold, data hash,
+#                                       CV signature, model kwargs, features
+#     <root>/scalers/<data hash>.joblib one StandardScaler per design matrix
+#     <root>/binning/<edges hash>.joblib  FeatureBinner of GBDTs fitted on
+#                                       bin codes (binned_cache.py)
+# Lookups by (estimator, group, fold) only read the small JSON files; the
+# model and scaler are loaded on first use. An entry can be turned into the
+# bundle dict used by raster_predict.py.
+# ─────────────────────────────────────────────────────────────────────────────
+
+FULL = -1                       # fold index of a model refitted on all plots
+
+
+def _atomic_dump(obj, path, writer):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        writer(obj, f)
+    os.replace(tmp, path)
+
+
+class ModelEntry:
+    """Registry record; `model` and `scaler` are loaded lazily."""
+
+    def __init__(self, registry, meta):
+        self.registry = registry
+        self.meta = meta
+        self._model = None
+        self._scaler = None
+        self._binning = None
+
+    def __repr__(self):
+        fold = "full" if self.fold == FULL else self.fold
+        return f"ModelEntry({self.meta['estimator']}, {self.group}, fold={fold}, key={self.key[:12]})"
+
+    key      = property(lambda self: self.meta["key"])
+    group    = property(lambda self: self.meta["group"])
+    fold     = property(lambda self: self.meta["fold"])
+    features = property(lambda self: self.meta["features"])
+    path     = property(lambda self: self.registry._path(self.key, ".joblib"))
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = self.registry.load_model(self.key)
+        return self._model
+
+    @property
+    def scaler(self):
+        if self._scaler is None and self.meta.get("scaler"):
+            self._scaler = joblib.load(os.path.join(self.registry.root, "scalers", self.meta["scaler"]))
+        return self._scaler
+
+    @property
+    def binning(self):
+        if self._binning is None and self.meta.get("binning"):
+            self._binning = joblib.load(os.path.join(self.registry.root, "binning", self.meta["binning"]))
+        return self._binning
+
+    def predict(self, X):
+        """Predict from unscaled predictors (DataFrame with the group's features)."""
+        X = X[self.features] if hasattr(X, "columns") else pd.DataFrame(X, columns=self.features)
+        if self.scaler is not None:
+            X = pd.DataFrame(self.scaler.transform(X), index=X.index, columns=self.features)
+        if self.binning is not None:
+            X = self.binning.transform(X)
+        preds = np.asarray(self.model.predict(X))
+        # multi-target models: one column per target
+        return preds.reshape(len(X), -1) if isinstance(self.meta.get("target"), list) else preds.ravel()
+
+    def bundle(self):
+        return {"group": self.group, "features": self.features, "target": self.meta.get("target"),
+                "scaler": self.scaler, "binning": self.binning, "model": self.model,
+                "estimator": self.meta["estimator"],
+                "model_kwargs": self.meta.get("model_kwargs", {}), "n_plots": self.meta.get("n_train")}
+
+
+class ModelRegistry:
+    def __init__(self, root, compress=3):
+        self.root = root
+        self.compress = compress
+        os.makedirs(root, exist_ok=True)
+        self._index = None
+
+    def _path(self, key, ext):
+        return os.path.join(self.root, key[:2], f"{key}{ext}")
+
+    # ---- writing -------------------------------------------------------------
+    def put_scaler(self, dhash, scaler):
+        name = f"{dhash[:16]}.joblib"
+        path = os.path.join(self.root, "scalers", name)
+        if scaler is not None and not os.path.exists(path):
+            _atomic_dump(scaler, path, lambda o, f: joblib.dump(o, f, compress=self.compress))
+        return name if scaler is not None else None
+
+    def put_binning(self, binner):
+        if binner is None:
+            return None
+        name = f"{binner.signature[:16]}.joblib"
+        path = os.path.join(self.root, "binning", name)
+        if not os.path.exists(path):
+            _atomic_dump(binner, path, lambda o, f: joblib.dump(o, f, compress=self.compress))
+        return name
+
+    def put(self, key, model, meta):
+        # model first, metadata last: a JSON record always has its model
+        _atomic_dump(model, self._path(key, ".joblib"),
+                     lambda o, f: joblib.dump(o, f, compress=self.compress))
+        meta = dict(meta, key=key)
+        _atomic_dump(meta, self._path(key, ".json"),
+                     lambda o, f: f.write(json.dumps(o, default=str).encode()))
+        if self._index is not None:
+            self._index[key] = meta
+
+    # ---- lookup --------------------------------------------------------------
+    def __contains__(self, key):
+        return os.path.exists(self._path(key, ".json"))
+
+    def _load_index(self, refresh=False):
+        if self._index is None or refresh:
+            self._index = {}
+            for p in glob.glob(os.path.join(self.root, "??", "*.json")):
+                try:
+                    with open(p) as f:
+                        meta = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                self._index[meta["key"]] = meta
+        return self._index
+
+    def load_model(self, key):
+        """Fitted model of a key, without reading the index (for workers)."""
+        return joblib.load(self._path(key, ".joblib"))
+
+    def entry(self, key):
+        meta = self._load_index().get(key)
+        if meta is None and key in self:
+            meta = self._load_index(refresh=True).get(key)
+        return None if meta is None else ModelEntry(self, meta)
+
+    def find(self, estimator=None, group=None, fold=None, data_hash=None, refresh=False):
+        """Entries matching every given field; estimator matches class name or run label."""
+        out = []
+        for meta in self._load_index(refresh).values():
+            if estimator is not None and estimator not in (meta["estimator"], meta.get("label")):
+                continue
+            if group is not None and meta["group"] != group:
+                continue
+            if fold is not None and meta["fold"] != fold:
+                continue
+            if data_hash is not None and meta["data_hash"] != data_hash:
+                continue
+            out.append(ModelEntry(self, meta))
+        return sorted(out, key=lambda e: (e.meta["estimator"], e.group, e.fold, e.meta.get("created", 0)))
+
+    def get(self, estimator, group, fold=FULL, data_hash=None):
+        """Most recent model for (estimator, group, fold), or None."""
+        hits = self.find(estimator, group, fold, data_hash)
+        return max(hits, key=lambda e: e.meta.get("created", 0)) if hits else None
+
+    def fold_models(self, estimator, group, data_hash=None):
+        """{fold: entry} of one CV run (latest entry per fold)."""
+        out = {}
+        for e in self.find(estimator, group, data_hash=data_hash):
+            if e.fold != FULL:
+                out[e.fold] = e
+        return dict(sorted(out.items()))
+
+    def table(self):
+        return pd.DataFrame([{k: v for k, v in m.items() if k not in ("features", "model_kwargs")}
+                             for m in self._load_index(refresh=True).values()])
+
+    def __len__(self):
+        return len(self._load_index(refresh=True))
+
+
+def load_entry(model_path):
+    """ModelEntry from the path of a registry .joblib file."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(model_path)))
+    key = os.path.basename(model_path)[:-len(".joblib")]
+    return ModelRegistry(root).entry(key)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List models in a fitted-model registry")
+    parser.add_argument("root")
+    parser.add_argument("--estimator")
+    parser.add_argument("--group")
+    args = parser.parse_args()
+
+    reg = ModelRegistry(args.root)
+    df = reg.table()
+    if args.estimator:
+        df = df[(df["estimator"] == args.estimator) | (df.get("label") == args.estimator)]
+    if args.group:
+        df = df[df["group"] == args.group]
+    if df.empty:
+        print("no models")
+    else:
+        summary = (df.assign(full=df["fold"] == FULL)
+                     .groupby(["estimator", "group"])
+                     .agg(n_fold_models=("full", lambda s: int((~s).sum())),
+                          full_model=("full", "any"), data_hashes=("data_hash", "nunique")))
+        print(summary.to_string())
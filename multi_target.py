@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Total / hardwood / softwood biomass from one multi-target CV run
+#
+# FoldScheduler.add_cv(..., y=df[TARGETS], ...) fits all targets on the same
+# fold plan and scaled design matrix (natively for cv_engine.MULTI_OUTPUT
+# estimators, one model per target otherwise); per_target() gives per-target
+# fold nRMSE and OOF predictions. Nothing forces the component models to sum
+# to the total model, so additivity_check() measures how far they are apart:
+#   gap          mean |pred_total - Σ pred_component| / mean(y_total)
+#   obs_gap      the same for the observed targets (rounding / definitions)
+#   nrmse_total  nRMSE of the direct total prediction
+#   nrmse_sum    nRMSE of Σ components as a total prediction
+# per test fold, NaN-aware like oof_metrics.
+# ─────────────────────────────────────────────────────────────────────────────
+
+TOTAL = "total_biomass_tons_ha"
+COMPONENTS = ("hrdwd_biomass_tons_ha", "sftwd_biomass_tons_ha")
+TARGETS = (TOTAL,) + COMPONENTS
+
+
+def target_summary(fold_vals):
+    """Mean / SD of fold nRMSE per (run ..., target) key of FoldScheduler.per_target()."""
+    rows = []
+    for key, vals in fold_vals.items():
+        *run, target = key
+        vals = np.asarray(vals, dtype=float)
+        rows.append({"run": run[0] if len(run) == 1 else tuple(run), "target": target,
+                     "mean_nrmse": np.nanmean(vals), "sd_nrmse": np.nanstd(vals),
+                     "n_folds": int(np.isfinite(vals).sum())})
+    return pd.DataFrame(rows)
+
+
+def _nrmse(y, p):
+    return np.sqrt(np.mean((y - p) ** 2)) / np.mean(y)
+
+
+def additivity_check(Y, oof, assignment, n_splits, targets=TARGETS, total=TOTAL,
+                     components=COMPONENTS):
+    """
+    Y          : (n_plots, n_targets) observed targets in plan order
+    oof        : (n_repeats, n_plots, n_targets) OOF predictions of one run
+    assignment : (n_repeats, n_plots) test-fold id of every plot per repeat
+
+    Returns one row per (repeat, fold): n, gap, obs_gap, nrmse_total, nrmse_sum.
+    """
+    targets = list(targets)
+    t, c = targets.index(total), [targets.index(x) for x in components]
+    Y = np.asarray(Y, dtype=np.float64)
+    P = np.asarray(oof, dtype=np.float64)
+    y_tot, y_sum = Y[:, t], Y[:, c].sum(axis=1)
+    rows = []
+    for r in range(P.shape[0]):
+        p_tot, p_sum = P[r, :, t], P[r][:, c].sum(axis=1)
+        ok = np.isfinite(p_tot) & np.isfinite(p_sum)
+        for k in range(n_splits):
+            m = ok & (np.asarray(assignment[r]) == k)
+            if not m.any():
+                continue
+            scale = np.mean(y_tot[m])
+            rows.append({"repeat": r, "fold": k, "n": int(m.sum()),
+                         "gap": np.mean(np.abs(p_tot[m] - p_sum[m])) / scale,
+                         "obs_gap": np.mean(np.abs(y_tot[m] - y_sum[m])) / scale,
+                         "nrmse_total": _nrmse(y_tot[m], p_tot[m]),
+                         "nrmse_sum": _nrmse(y_tot[m], p_sum[m])})
+    return pd.DataFrame(rows)
+
+
+def summarize_additivity(df):
+    """Mean / max over folds of the additivity_check columns."""
+    cols = ["gap", "obs_gap", "nrmse_total", "nrmse_sum"]
+    return pd.Series({**{f"mean_{c}": df[c].mean() for c in cols},
+                      "max_gap": df["gap"].max(), "n_folds": len(df)})
@@ -0,0 +1,246 @@
+import os
+import argparse
+import itertools
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import solve_triangular
+from scipy.optimize import nnls
+
+from oof_store  import OOFStore
+from stat_tests import compare_pairs
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Stacking / blending ensembles from stored out-of-fold predictions
+#
+# No base model is refitted: the members of an ensemble are runs of one
+# fold plan in the OOF store, (estimator, group). For every repeat r and
+# test fold k the blend is learned on the OOF predictions of the other
+# folds of repeat r and applied to fold k, so a fold's ensemble prediction
+# never uses that fold's target in its weights, and ensembles score on the
+# same (repeat, fold) cells as their members (paired tests, bootstrap CIs,
+# oof_metrics all work on them unchanged). Base-model OOF predictions of
+# the training folds come from models that saw fold k, as in any stacking
+# on OOF predictions without nested base-model refits.
+#
+# Methods:
+#   mean    equal weights
+#   convex  non-negative weights summing to 1 (NNLS)
+#   ridge   intercept + ridge weights; alpha chosen by inner CV over the
+#           remaining folds of the repeat (train without k and k2, score k2)
+#
+# Everything is fitted from per-cell sufficient statistics: for Z = [1, OOF
+# of every run] the (repeat, fold) cells hold Z'Z, Z'y and y'y once, so the
+# training set of a fold is (repeat total - cell), an inner fold is (repeat
+# total - cell k - cell k2), and scoring an inner fold is w'Sw - 2w'b + y'y.
+# A candidate ensemble is a few batched (p × p) solves, which makes a
+# search over all combinations of estimators × groups cheap.
+#
+#   python oof_ensemble.py <output_dir>/oof --method ridge --max-size 3 --save-top 3
+# ─────────────────────────────────────────────────────────────────────────────
+
+METHODS = ("mean", "convex", "ridge")
+ALPHAS = (1e-4, 1e-3, 1e-2, 1e-1, 1.0)     # relative to mean Σ prediction² of a member
+
+EnsembleResult = namedtuple("EnsembleResult",
+                            ["members", "method", "repeats", "fold_nrmse", "oof", "weights", "alpha"])
+
+
+def run_label(run):
+    return ".".join(run) if isinstance(run, tuple) else str(run)
+
+
+def _ridge(S, b, alpha):
+    # S (..., p, p), b (..., p), alpha broadcast to S[..., 0, 0]; no penalty on the intercept
+    p = S.shape[-1]
+    scale = np.trace(S[..., 1:, 1:], axis1=-2, axis2=-1) / max(p - 1, 1)
+    pen = np.eye(p)
+    pen[0, 0] = 0.0
+    A = S + (np.asarray(alpha) * scale)[..., None, None] * pen
+    return np.linalg.solve(A, b[..., None])[..., 0]
+
+
+def _convex(S, b):
+    # min w'Aw - 2b'w, w >= 0, Σw = 1, for every cell of S (..., p, p)
+    shape = S.shape[:-2]
+    p = S.shape[-1]
+    W = np.zeros(shape + (p,))
+    for cell in np.ndindex(shape):
+        A, v = S[cell][1:, 1:], b[cell][1:]
+        jitter = 1e-10 * np.trace(A) / len(A)
+        L = np.linalg.cholesky(A + jitter * np.eye(len(A)))
+        rho = 1e3 * np.sqrt(np.trace(A) / len(A))
+        M = np.vstack([L.T, np.full((1, len(A)), rho)])
+        rhs = np.append(solve_triangular(L, v, lower=True), rho)
+        w = nnls(M, rhs)[0]
+        W[cell][1:] = w / w.sum() if w.sum() > 0 else 1.0 / len(w)
+    return W
+
+
+def _sse(S, b, syy, w):
+    return np.einsum("...i,...ij,...j->...", w, S, w) - 2 * np.einsum("...i,...i->...", w, b) + syy
+
+
+class OOFEnsemble:
+    def __init__(self, y, oofs, assignment, n_splits):
+        self.runs = list(oofs)
+        self.col = {run: i + 1 for i, run in enumerate(self.runs)}         # column 0 = intercept
+        P = np.stack([np.asarray(oofs[r], dtype=np.float64) for r in self.runs])   # (G, R, N)
+        G, R, N = P.shape
+        self.complete = np.isfinite(P).all(axis=2)                          # (G, R)
+        self.P = np.nan_to_num(P)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.assignment = np.asarray(assignment, dtype=np.int64)[:R]
+        self.K = int(n_splits)
+
+        # per-(repeat, fold) statistics of Z = [1, P]
+        Z = np.concatenate([np.ones((1, R, N)), self.P])
+        K = self.K
+        self.S = np.empty((R, K, G + 1, G + 1))
+        self.b = np.empty((R, K, G + 1))
+        self.syy = np.empty((R, K))
+        for k in range(K):
+            in_k = (self.assignment == k).astype(np.float64)                # (R, N)
+            Zk = Z * in_k
+            self.S[:, k] = np.einsum("arn,brn->rab", Zk, Z)
+            self.b[:, k] = np.einsum("arn,n->ra", Zk, self.y)
+            self.syy[:, k] = in_k @ (self.y ** 2)
+
+    @classmethod
+    def from_store(cls, store, plan_id, runs=None):
+        plan, oofs = store.load_all(plan_id)
+        if runs is not None:
+            oofs = {r: oofs[r] for r in runs}
+        return cls(plan["y"], oofs, plan["assignment"], plan["n_splits"])
+
+    def _weights(self, S, b, syy, method, alphas):
+        # S (R, K, p, p) per cell; weights (R, K, p) learned without each cell
+        S_tr = S.sum(axis=1, keepdims=True) - S
+        b_tr = b.sum(axis=1, keepdims=True) - b
+        p = S.shape[-1]
+        if method == "mean":
+            w = np.r_[0.0, np.full(p - 1, 1.0 / (p - 1))]
+            return np.broadcast_to(w, b.shape).copy(), None
+        if method == "convex":
+            return _convex(S_tr, b_tr), None
+        if method != "ridge":
+            raise ValueError(f"unknown method {method!r}; expected one of {METHODS}")
+        # inner folds: train on repeat - k - k2, score k2 (k2 == k: placeholder, not scored)
+        R, K = b.shape[:2]
+        S_in = S_tr[:, :, None] - S[:, None, :]                             # (R, K, K2, p, p)
+        b_in = b_tr[:, :, None] - b[:, None, :]
+        diag = np.eye(K, dtype=bool)
+        S_in[:, diag] = S_tr
+        b_in[:, diag] = b_tr
+        alphas = np.asarray(alphas, dtype=np.float64)
+        W_in = _ridge(S_in[:, :, :, None], b_in[:, :, :, None],
+                      np.broadcast_to(alphas, (R, K, K, len(alphas))))      # (R, K, K2, A, p)
+        loss = _sse(S[:, None, :, None], b[:, None, :, None], syy[:, None, :, None], W_in)
+        loss[:, diag] = 0.0
+        alpha = alphas[np.argmin(loss.sum(axis=2), axis=-1)]               # (R, K)
+        return _ridge(S_tr, b_tr, alpha), alpha
+
+    def evaluate(self, members, method="ridge", alphas=ALPHAS):
+        """Blend the runs in `members`; fold nRMSE in plan order (repeat * K + fold)."""
+        members = list(members)
+        g = [self.col[m] - 1 for m in members]
+        repeats = np.flatnonzero(self.complete[g].all(axis=0))
+        cols = [0] + [i + 1 for i in g]
+        S = self.S[np.ix_(repeats, np.arange(self.K), cols, cols)]
+        b = self.b[np.ix_(repeats, np.arange(self.K), cols)]
+        syy = self.syy[repeats]
+        W, alpha = self._weights(S, b, syy, method, alphas)
+
+        fold = self.assignment[repeats]                                    # (R', N)
+        Wp = W[np.arange(len(repeats))[:, None], fold]                     # (R', N, p)
+        pred = Wp[..., 0] + np.einsum("rnp,prn->rn", Wp[..., 1:], self.P[np.ix_(g, repeats)])
+        oof = np.full(self.assignment.shape, np.nan, dtype=np.float32)
+        oof[repeats] = pred
+
+        # fold nRMSE as cv_engine.fold_nrmse: RMSE / mean(y_test)
+        cell = (np.arange(len(repeats))[:, None] * self.K + fold).ravel()
+        n_cells = len(repeats) * self.K
+        n = np.bincount(cell, minlength=n_cells)
+        se = np.bincount(cell, weights=((pred - self.y) ** 2).ravel(), minlength=n_cells)
+        sy = np.bincount(cell, weights=np.broadcast_to(self.y, pred.shape).ravel(), minlength=n_cells)
+        fold_nrmse = np.sqrt(se / n) / (sy / n)
+        return EnsembleResult(tuple(members), method, repeats, fold_nrmse, oof, W, alpha)
+
+    def search(self, candidates=None, max_size=3, min_size=2, method="ridge", alphas=ALPHAS):
+        """Every combination of min_size … max_size candidate runs; (table, {key: result})."""
+        candidates = list(candidates or self.runs)
+        single = {run: self.evaluate([run], "mean") for run in candidates}
+        results, rows = {}, []
+        for size in range(min_size, max_size + 1):
+            for members in itertools.combinations(candidates, size):
+                res = self.evaluate(members, method, alphas)
+                key = (f"ENS_{method}", "+".join(run_label(m) for m in members))
+                results[key] = res
+                best = min(members, key=lambda m: single[m].fold_nrmse.mean())
+                w = res.weights[..., 1:].reshape(-1, size).mean(axis=0)
+                rows.append({
+                    "estimator": key[0], "group": key[1], "n_members": size,
+                    "n_folds": len(res.fold_nrmse),
+                    "mean_nrmse": res.fold_nrmse.mean(), "sd_nrmse": res.fold_nrmse.std(),
+                    "best_member": run_label(best),
+                    "best_member_nrmse": single[best].fold_nrmse.mean(),
+                    "pct_vs_best_member": (res.fold_nrmse.mean() / single[best].fold_nrmse.mean() - 1) * 100,
+                    "weights": " ".join(f"{run_label(m)}={v:.3f}" for m, v in zip(members, w)),
+                })
+        table = pd.DataFrame(rows).sort_values("mean_nrmse").reset_index(drop=True)
+        return table, results, single
+
+
+def ranked_table(table, results, single, n_test=20, correction="holm", n_perm=10000, n_splits=5):
+    """Top n_test ensembles tested against their best member on matched folds."""
+    top = table.head(n_test)
+    fold_vals = {run: res.fold_nrmse for run, res in single.items()}
+    best = {}
+    for r in top.itertuples():
+        key = (r.estimator, r.group)
+        fold_vals[key] = results[key].fold_nrmse
+        best[key] = next(m for m in single if run_label(m) == r.best_member)
+    if not best:
+        return table
+    tests = compare_pairs(fold_vals, list(best.items()), n_splits=n_splits, n_perm=n_perm,
+                          correction=correction)
+    cols = ["p_wilcoxon", "p_corrected_t", "p_wilcoxon_adj", "significant"]
+    tests = pd.DataFrame({"estimator": [a[0] for a in tests["a"]], "group": [a[1] for a in tests["a"]],
+                          **{c: tests[c].values for c in cols}})
+    return table.merge(tests, on=["estimator", "group"], how="left")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Blend / stack stored OOF predictions without refits")
+    parser.add_argument("oof_dir")
+    parser.add_argument("--plan", default=None, help="fold plan id (default: every plan)")
+    parser.add_argument("--method", choices=METHODS, default="ridge")
+    parser.add_argument("--max-size", type=int, default=3)
+    parser.add_argument("--min-size", type=int, default=2)
+    parser.add_argument("--estimator", action="append", help="only these estimators (repeatable)")
+    parser.add_argument("--group", action="append", help="only these groups (repeatable)")
+    parser.add_argument("--n-test", type=int, default=20, help="ensembles tested vs their best member")
+    parser.add_argument("--save-top", type=int, default=0,
+                        help="store the OOF predictions of the best n ensembles as runs")
+    args = parser.parse_args()
+
+    store = OOFStore(args.oof_dir)
+    for plan_id in ([args.plan] if args.plan else store.plan_ids()):
+        runs = [r for r in store.runs(plan_id) if not r[0].startswith("ENS_")
+                and (not args.estimator or r[0] in args.estimator)
+                and (not args.group or r[1] in args.group)]
+        if len(runs) < args.min_size:
+            continue
+        ens = OOFEnsemble.from_store(store, plan_id, runs)
+        n_splits = ens.K
+        table, results, single = ens.search(runs, args.max_size, args.min_size, args.method)
+        table = ranked_table(table, results, single, args.n_test, n_splits=n_splits)
+        print(f"Plan {plan_id}: {len(runs)} runs, {len(table)} ensembles")
+        with pd.option_context("display.width", 200, "display.max_colwidth", 60):
+            print(table.head(10).drop(columns="weights").to_string(index=False))
+        out = os.path.join(args.oof_dir, f"ensembles_{plan_id}_{args.method}.csv")
+        table.to_csv(out, index=False)
+        print(f"Saved: {out}")
+        for r in table.head(args.save_top).itertuples():
+            store.save_run(plan_id, r.estimator, r.group, results[(r.estimator, r.group)].oof)
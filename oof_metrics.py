@@ -0,0 +1,136 @@
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from oof_store import OOFStore
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Vectorized metrics over stored out-of-fold predictions
+#
+# All runs of one fold plan are stacked into a (runs × repeats × plots) array.
+# Each prediction gets one integer cell id
+#     ((run * n_repeats + repeat) * n_folds + fold) * n_strata + stratum
+# and the sufficient statistics (n, Σe, Σe², Σ|e|, Σy, Σy²) of every cell come
+# out of six np.bincount calls, so nRMSE / RMSE / MAE / bias / R² for every
+# run × repeat × fold × stratum cost a few passes over memory instead of one
+# sklearn call per fold. nRMSE is RMSE / mean(y_test), exactly as in
+# cv_engine.fold_nrmse.
+#
+#   python oof_metrics.py <output_dir>/oof [--by MEASYEAR|biomass_bin] [--level repeat]
+# ─────────────────────────────────────────────────────────────────────────────
+
+METRICS = ["nrmse", "rmse", "mae", "bias", "r2"]
+
+
+def biomass_bins(y, n_bins=5):
+    """Quantile bin of the target per plot (0 … n_bins-1)."""
+    return pd.qcut(np.asarray(y), n_bins, labels=False, duplicates="drop")
+
+
+def oof_metrics(y, oofs, assignment, n_splits, by=None, level="fold"):
+    """
+    y          : (n_plots,) observed target in plan order
+    oofs       : {run: (n_repeats, n_plots) predictions}; NaN = not predicted
+    assignment : (n_repeats, n_plots) test-fold id of every plot per repeat
+    by         : optional (n_plots,) stratum label per plot (MEASYEAR, bin, ...)
+    level      : "fold" (one row per test fold) or "repeat" (pooled per repeat)
+
+    Returns a long DataFrame: run, repeat[, fold][, stratum], n, METRICS.
+    """
+    runs = list(oofs)
+    P = np.stack([np.asarray(oofs[r], dtype=np.float64) for r in runs])    # (G, R, N)
+    G, R, N = P.shape
+    y = np.asarray(y, dtype=np.float64)
+    assignment = np.asarray(assignment, dtype=np.int64)[:R]
+
+    K = n_splits if level == "fold" else 1
+    fold = assignment if level == "fold" else np.zeros_like(assignment)
+    if by is None:
+        codes, levels = np.zeros(N, dtype=np.int64), np.array([None])
+    else:
+        codes, levels = pd.factorize(np.asarray(by), sort=True)
+        codes = codes.astype(np.int64)
+    S = len(levels)
+
+    cell = ((np.arange(G)[:, None, None] * R + np.arange(R)[None, :, None]) * K
+            + fold[None]) * S + codes[None, None, :]
+    ok = np.isfinite(P) & (codes >= 0)[None, None, :]
+    cell = cell[ok]
+    err = (P - y)[ok]
+    yy = np.broadcast_to(y, P.shape)[ok]
+
+    n_cells = G * R * K * S
+    n   = np.bincount(cell, minlength=n_cells)
+    se  = np.bincount(cell, weights=err * err, minlength=n_cells)
+    ae  = np.bincount(cell, weights=np.abs(err), minlength=n_cells)
+    e   = np.bincount(cell, weights=err, minlength=n_cells)
+    sy  = np.bincount(cell, weights=yy, minlength=n_cells)
+    syy = np.bincount(cell, weights=yy * yy, minlength=n_cells)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_y = sy / n
+        rmse = np.sqrt(se / n)
+        sst = syy - n * mean_y ** 2
+        out = pd.DataFrame({
+            "n"    : n,
+            "nrmse": rmse / mean_y,
+            "rmse" : rmse,
+            "mae"  : ae / n,
+            "bias" : e / n,
+            "r2"   : 1 - se / sst,
+        })
+
+    g, r, k, s = np.unravel_index(np.arange(n_cells), (G, R, K, S))
+    idx = pd.DataFrame({"run": [runs[i] for i in g], "repeat": r})
+    if level == "fold":
+        idx["fold"] = r * K + k
+    if by is not None:
+        idx["stratum"] = levels[s]
+    out = pd.concat([idx, out], axis=1)
+    return out[out["n"] > 0].reset_index(drop=True)
+
+
+def summarize_metrics(df):
+    """Mean and SD of every metric across folds (or repeats) per run [× stratum]."""
+    keys = [c for c in ("plan", "estimator", "group", "run", "stratum") if c in df]
+    agg = df.groupby(keys, sort=False)[METRICS].agg(["mean", "std"])
+    agg.columns = [f"{m}_{stat}" for m, stat in agg.columns]
+    agg.insert(0, "n_units", df.groupby(keys, sort=False).size())
+    return agg.reset_index()
+
+
+def plan_metrics(store, plan_id, by=None, level="fold", n_bins=5):
+    """Metrics for every run stored under one fold plan; by = plan column or 'biomass_bin'."""
+    plan, oofs = store.load_all(plan_id)
+    if by == "biomass_bin":
+        strata = biomass_bins(plan["y"], n_bins)
+    elif by is not None:
+        strata = plan["columns"][by]
+    else:
+        strata = None
+    df = oof_metrics(plan["y"], oofs, plan["assignment"], plan["n_splits"], by=strata, level=level)
+    df.insert(0, "plan", plan_id)
+    df.insert(1, "estimator", [r[0] for r in df["run"]])
+    df.insert(2, "group", [r[1] for r in df["run"]])
+    return df.drop(columns="run")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute CV metrics from stored OOF predictions")
+    parser.add_argument("oof_dir")
+    parser.add_argument("--by", default=None, help="plan column (e.g. MEASYEAR) or 'biomass_bin'")
+    parser.add_argument("--level", choices=["fold", "repeat"], default="fold")
+    parser.add_argument("--n-bins", type=int, default=5)
+    args = parser.parse_args()
+
+    store = OOFStore(args.oof_dir)
+    frames = [plan_metrics(store, pid, args.by, args.level, args.n_bins) for pid in store.plan_ids()]
+    df = pd.concat(frames, ignore_index=True)
+    with pd.option_context("display.width", 160, "display.max_rows", 200):
+        print(summarize_metrics(df).to_string(index=False))
+    tag = f"_{args.by}" if args.by else ""
+    out = os.path.join(args.oof_dir, f"oof_metrics_{args.level}{tag}.csv")
+    df.to_csv(out, index=False)
+    print(f"Saved: {out}")
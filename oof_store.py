@@ -0,0 +1,76 @@
+import os
+import glob
+
+import numpy as np
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Out-of-fold prediction store
+#
+# For every fold plan:   plan_<hash>.npz   plot index, fold assignment
+#                                          (n_repeats × n_plots), y and any
+#                                          extra plot columns (MEASYEAR, ...)
+# For every run:         oof_<hash>__<estimator>__<group>.npy
+#                                          float32 (n_repeats × n_plots)
+# so any metric can be recomputed later from the predictions (oof_metrics.py)
+# without refitting a model.
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+class OOFStore:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def plan_id(plan):
+        return plan.hash[:16]
+
+    # ---- fold plan + plot table ----------------------------------------------
+    def save_plan(self, plan, y, extra=None):
+        cols = {f"col_{k}": np.asarray(v) for k, v in (extra or {}).items()}
+        np.savez_compressed(
+            os.path.join(self.root, f"plan_{self.plan_id(plan)}.npz"),
+            index=np.asarray(plan.index), assignment=plan.assignment,
+            n_splits=plan.n_splits, y=np.asarray(y, dtype=np.float64), **cols)
+
+    def load_plan(self, plan_id):
+        with np.load(os.path.join(self.root, f"plan_{plan_id}.npz"), allow_pickle=True) as z:
+            out = {k: z[k] for k in ("index", "assignment", "y")}
+            out["n_splits"] = int(z["n_splits"])
+            out["columns"] = {k[4:]: z[k] for k in z.files if k.startswith("col_")}
+        return out
+
+    def plan_ids(self):
+        return sorted(os.path.basename(p)[5:-4] for p in glob.glob(os.path.join(self.root, "plan_*.npz")))
+
+    # ---- predictions ---------------------------------------------------------
+    def _path(self, plan_id, estimator, group):
+        return os.path.join(self.root, f"oof_{plan_id}__{estimator}__{group}.npy")
+
+    def save(self, estimator, group, plan, oof):
+        self.save_run(self.plan_id(plan), estimator, group, oof)
+
+    def save_run(self, plan_id, estimator, group, oof):
+        np.save(self._path(plan_id, estimator, group), np.asarray(oof, dtype=np.float32))
+
+    def load(self, plan_id, estimator, group, mmap=True):
+        return np.load(self._path(plan_id, estimator, group), mmap_mode="r" if mmap else None)
+
+    def runs(self, plan_id):
+        runs = []
+        for p in sorted(glob.glob(os.path.join(self.root, f"oof_{plan_id}__*.npy"))):
+            _, estimator, group = os.path.basename(p)[:-4].split("__")
+            runs.append((estimator, group))
+        return runs
+
+    def load_all(self, plan_id):
+        """(plan dict, {(estimator, group): oof array}) for one fold plan."""
+        return self.load_plan(plan_id), {run: self.load(plan_id, *run) for run in self.runs(plan_id)}
+
+
+    def save_runs(self, plan, y, oofs, extra=None):
+        """Plan table + every {(estimator, group): oof} computed on it."""
+        self.save_plan(plan, y, extra)
+        for (estimator, group), oof in oofs.items():
+            self.save(estimator, group, plan, oof)
+        return len(oofs)
@@ -0,0 +1,281 @@
+import os
+import glob
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Plot-location extraction from many rasters
+#
+# Points (plot coordinates in any CRS) are reprojected once per raster CRS
+# and turned into pixel row / col with the inverse geotransform. Points are
+# then indexed by raster cell: a cell is a whole number of the file's
+# internal blocks (≈ target_px square), points are sorted by cell id, and
+# every occupied cell is read once as one block-aligned window (padded by
+# the buffer radius) with all bands — so a GeoTIFF block is decompressed
+# once however many plots fall in it, and cells without plots are never
+# touched. Centre values and buffer statistics of all points in a cell are
+# gathered with one fancy index into that window.
+#
+# Buffers are circular (pixel centres within `buffer` map units of the
+# plot); stats over valid pixels: mean, std, min, max, count. A point
+# outside a raster, or on nodata, gets NaN.
+# Cells of all rasters are spread over a process pool in chunks; each
+# worker keeps its datasets open.
+#
+#   python point_extract.py plots.csv gfw_forest_loss.tif landtrendr_disturbance.tif \
+#       --x LON --y LAT --crs EPSG:4326 --buffer 30 --out plot_rasters.csv
+#   python point_extract.py --demo                          # synthetic rasters and plots
+# ─────────────────────────────────────────────────────────────────────────────
+
+STATS = ("mean", "std", "min", "max", "count")
+
+
+def _rasterio():
+    try:
+        import rasterio
+    except ImportError as e:
+        raise ImportError("point extraction needs rasterio (pip install rasterio)") from e
+    return rasterio
+
+
+def raster_table(rasters):
+    """{name: path} from a dict, a list of paths, or a directory of .tif files."""
+    if isinstance(rasters, dict):
+        return dict(rasters)
+    if isinstance(rasters, str):
+        rasters = sorted(glob.glob(os.path.join(rasters, "*.tif"))) if os.path.isdir(rasters) else [rasters]
+    return {os.path.splitext(os.path.basename(p))[0]: p for p in rasters}
+
+
+def pixel_index(transform, x, y):
+    """Row and col (int64) of the pixels containing the points."""
+    inv = ~transform
+    col = inv.a * x + inv.b * y + inv.c
+    row = inv.d * x + inv.e * y + inv.f
+    return np.floor(row).astype(np.int64), np.floor(col).astype(np.int64)
+
+
+def buffer_offsets(radius, res_x, res_y):
+    """(dy, dx) of the pixels whose centres lie within radius of the centre pixel."""
+    ry, rx = int(np.ceil(radius / res_y)), int(np.ceil(radius / res_x))
+    dy, dx = np.mgrid[-ry:ry + 1, -rx:rx + 1]
+    keep = (dy * res_y) ** 2 + (dx * res_x) ** 2 <= radius ** 2
+    return dy[keep], dx[keep]
+
+
+def cell_shape(block_shape, shape, target_px=512):
+    bh, bw = block_shape
+    return (min(shape[0], max(bh, target_px // bh * bh)),
+            min(shape[1], max(bw, target_px // bw * bw)))
+
+
+def index_points(rows, cols, shape, cell):
+    """[(cell row, cell col, point indices)] of every cell that holds a point."""
+    inside = np.flatnonzero((rows >= 0) & (rows < shape[0]) & (cols >= 0) & (cols < shape[1]))
+    n_cell_cols = -(-shape[1] // cell[1])
+    cid = rows[inside] // cell[0] * n_cell_cols + cols[inside] // cell[1]
+    order = np.argsort(cid, kind="stable")
+    cid, inside = cid[order], inside[order]
+    starts = np.flatnonzero(np.r_[True, cid[1:] != cid[:-1]])
+    ends = np.r_[starts[1:], len(cid)]
+    return [(int(cid[s] // n_cell_cols), int(cid[s] % n_cell_cols), inside[s:e])
+            for s, e in zip(starts, ends)]
+
+
+def _stats(vals, valid):
+    # vals (bands, n, k), valid (bands, n, k) -> {stat: (bands, n)}
+    cnt = valid.sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        s = np.where(valid, vals, 0.0).sum(axis=-1)
+        mean = s / cnt
+        var = np.where(valid, vals * vals, 0.0).sum(axis=-1) / cnt - mean ** 2
+        out = {"mean": mean, "std": np.sqrt(np.maximum(var, 0.0)),
+               "min": np.where(valid, vals, np.inf).min(axis=-1),
+               "max": np.where(valid, vals, -np.inf).max(axis=-1),
+               "count": cnt.astype(np.float64)}
+    for k in ("min", "max"):
+        out[k][cnt == 0] = np.nan
+    return out
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Worker side: datasets stay open for the life of the process
+# ─────────────────────────────────────────────────────────────────────────────
+_WORKER = {}
+
+
+def _init_extract_worker(cache_mb):
+    rasterio = _rasterio()
+    _WORKER.clear()
+    _WORKER["env"] = rasterio.Env(GDAL_CACHEMAX=cache_mb)
+    _WORKER["env"].__enter__()
+    _WORKER["datasets"] = {}
+
+
+def _dataset(path):
+    ds = _WORKER.setdefault("datasets", {}).get(path)
+    if ds is None:
+        ds = _WORKER["datasets"][path] = _rasterio().open(path)
+    return ds
+
+
+def extract_cells(path, cells, cell, rows, cols, offsets, stats):
+    """Centre values (bands, n) and buffer stats of the points of some cells of one raster."""
+    from rasterio.windows import Window
+    src = _dataset(path)
+    H, W = src.height, src.width
+    dy, dx = offsets
+    pad_y, pad_x = (int(np.abs(dy).max()), int(np.abs(dx).max())) if stats else (0, 0)
+    out_idx, centre, buf = [], [], {s: [] for s in stats}
+    for cr, cc, idx in cells:
+        r0, c0 = max(0, cr * cell[0] - pad_y), max(0, cc * cell[1] - pad_x)
+        r1, c1 = min(H, (cr + 1) * cell[0] + pad_y), min(W, (cc + 1) * cell[1] + pad_x)
+        a = src.read(window=Window(c0, r0, c1 - c0, r1 - r0), masked=True)
+        data = np.ma.getdata(a).astype(np.float64)
+        ok = ~np.ma.getmaskarray(a) & np.isfinite(data)
+        lr, lc = rows[idx] - r0, cols[idx] - c0
+        centre.append(np.where(ok[:, lr, lc], data[:, lr, lc], np.nan))
+        if stats:
+            rr, cc2 = lr[:, None] + dy[None], lc[:, None] + dx[None]
+            inb = (rr >= 0) & (rr < r1 - r0) & (cc2 >= 0) & (cc2 < c1 - c0)
+            rr, cc2 = np.clip(rr, 0, r1 - r0 - 1), np.clip(cc2, 0, c1 - c0 - 1)
+            st = _stats(data[:, rr, cc2], ok[:, rr, cc2] & inb[None])
+            for s in stats:
+                buf[s].append(st[s])
+        out_idx.append(idx)
+    cat = lambda parts: np.concatenate(parts, axis=1)
+    return np.concatenate(out_idx), cat(centre), {s: cat(v) for s, v in buf.items()}
+
+
+def _extract_task(task):
+    name, path, cells, cell, rows, cols, offsets, stats = task
+    return name, extract_cells(path, cells, cell, rows, cols, offsets, stats)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Coordinator
+# ─────────────────────────────────────────────────────────────────────────────
+def _band_names(name, src):
+    if src.count == 1:
+        return [name]
+    return [f"{name}_{d}" if d else f"{name}_b{i + 1}" for i, d in enumerate(src.descriptions)]
+
+
+def extract_points(points, rasters, x="x", y="y", crs=None, buffer=None, stats=STATS,
+                   n_workers=-1, target_px=512, points_per_task=20_000, cache_mb=256):
+    """
+    points  : DataFrame with coordinate columns x / y (in `crs`; None = the
+              rasters' own CRS)
+    rasters : {name: path}, list of paths, or a directory of GeoTIFFs
+    buffer  : radius in raster map units for buffer stats (None = centre only)
+
+    Returns a DataFrame on points.index: one column per raster band
+    (<name> or <name>_<band>), plus <column>_<stat> per buffer stat.
+    """
+    rasterio = _rasterio()
+    from rasterio.crs import CRS
+    from rasterio.warp import transform as warp_transform
+
+    rasters = raster_table(rasters)
+    stats = tuple(stats) if buffer else ()
+    px, py = points[x].to_numpy(np.float64), points[y].to_numpy(np.float64)
+    projected = {}
+    tasks, columns = [], {}
+    for name, path in rasters.items():
+        with rasterio.open(path) as src:
+            meta = (src.crs, src.transform, src.shape, src.block_shapes[0], _band_names(name, src))
+        r_crs, transform, shape, block, bands = meta
+        columns[name] = bands
+        key = str(r_crs)
+        if key not in projected:
+            if crs is None or r_crs is None or CRS.from_user_input(crs) == r_crs:
+                projected[key] = (px, py)
+            else:
+                projected[key] = tuple(np.asarray(v) for v in warp_transform(crs, r_crs, px, py))
+        rows, cols = pixel_index(transform, *projected[key])
+        offsets = (buffer_offsets(buffer, abs(transform.a), abs(transform.e)) if buffer
+                   else (np.zeros(1, np.int64), np.zeros(1, np.int64)))
+        cell = cell_shape(block, shape, target_px)
+        chunk, n = [], 0
+        for c in index_points(rows, cols, shape, cell):
+            chunk.append(c)
+            n += len(c[2])
+            if n >= points_per_task:
+                tasks.append((name, path, chunk, cell, rows, cols, offsets, stats))
+                chunk, n = [], 0
+        if chunk:
+            tasks.append((name, path, chunk, cell, rows, cols, offsets, stats))
+
+    values = {}
+    for name, bands in columns.items():
+        for b in bands:
+            values[b] = np.full(len(points), np.nan)
+            for s in stats:
+                values[f"{b}_{s}"] = np.full(len(points), np.nan)
+
+    def collect(name, result):
+        idx, centre, buf = result
+        for j, b in enumerate(columns[name]):
+            values[b][idx] = centre[j]
+            for s in stats:
+                values[f"{b}_{s}"][idx] = buf[s][j]
+
+    n_workers = os.cpu_count() if n_workers in (-1, None) else n_workers
+    n_workers = min(n_workers, len(tasks))
+    if n_workers <= 1:
+        _init_extract_worker(cache_mb)
+        for task in tasks:
+            collect(*_extract_task(task))
+    else:
+        with ProcessPoolExecutor(n_workers, initializer=_init_extract_worker,
+                                 initargs=(cache_mb,)) as pool:
+            for name, result in pool.map(_extract_task, tasks):
+                collect(name, result)
+    return pd.DataFrame(values, index=points.index)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sample rasters at plot locations")
+    parser.add_argument("points", nargs="?", help="CSV with plot coordinates")
+    parser.add_argument("rasters", nargs="*", help="GeoTIFFs or directories of GeoTIFFs")
+    parser.add_argument("--x", default="x")
+    parser.add_argument("--y", default="y")
+    parser.add_argument("--crs", default=None, help="CRS of the coordinates, e.g. EPSG:4326")
+    parser.add_argument("--id", default=None, help="id column kept in the output (e.g. PLT_CN)")
+    parser.add_argument("--buffer", type=float, default=None, help="buffer radius in map units")
+    parser.add_argument("--stats", default=",".join(STATS))
+    parser.add_argument("--workers", type=int, default=-1)
+    parser.add_argument("--out", default="plot_rasters.csv")
+    parser.add_argument("--demo", action="store_true", help="synthetic rasters and 5000 plots")
+    args = parser.parse_args()
+
+    if args.demo:
+        from synthetic_fia import write_synthetic_disturbance
+        out_dir = os.path.dirname(os.path.abspath(args.out))
+        paths = write_synthetic_disturbance(os.path.join(out_dir, "synthetic"), 3000, 3000)
+        rasters = paths
+        with _rasterio().open(paths["biomass"]) as src:
+            left, bottom, right, top = src.bounds
+        rng = np.random.default_rng(0)
+        points = pd.DataFrame({"x": rng.uniform(left, right, 5000), "y": rng.uniform(bottom, top, 5000)})
+        args.x, args.y = "x", "y"
+    else:
+        if not args.points or not args.rasters:
+            parser.error("points CSV and at least one raster are required (or --demo)")
+        points = pd.read_csv(args.points)
+        rasters = {}
+        for r in args.rasters:
+            rasters.update(raster_table(r))
+
+    t0 = time.perf_counter()
+    df = extract_points(points, rasters, args.x, args.y, args.crs, args.buffer,
+                        args.stats.split(","), args.workers)
+    print(f"{len(points)} plots × {len(rasters)} rasters -> {df.shape[1]} columns "
+          f"in {time.perf_counter() - t0:.1f} s")
+    keep = [c for c in (args.id, args.x, args.y) if c and c in points]
+    pd.concat([points[keep], df], axis=1).to_csv(args.out, index=False)
+    print(f"Saved: {args.out}")
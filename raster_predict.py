@@ -0,0 +1,292 @@
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as pd
+import joblib
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Wall-to-wall biomass prediction from predictor rasters
+#
+# A model bundle (fitted StandardScaler + model + the group's feature list)
+# is applied to aligned predictor GeoTIFFs — one per feature, <dir>/<feature>.tif,
+# or multi-band files whose band descriptions are feature names. The output
+# grid is cut into square tiles sized so one tile (all feature bands, the
+# scaled matrix and the predictions) fits the per-worker memory budget. A
+# process pool reads, scales and predicts tiles; the parent is the only
+# writer of the tiled, compressed float32 GeoTIFF and keeps at most
+# 2 × workers tiles in flight, so memory stays flat for any region size.
+# A pixel is nodata if any of its predictors is missing.
+#
+#   python raster_predict.py fit --group G16 --estimator XGB_TD_Regressor --out G16_xgb.joblib
+#   python raster_predict.py predict G16_xgb.joblib <raster_dir> <OutBiomassRaster>/agb_G16.tif
+#   python raster_predict.py demo --rows 3000 --cols 3000       # synthetic rasters
+#
+# rasterio is only needed for predict/demo; model_config / sklearn / the CV
+# engine only for fit/demo, so predict runs on a bundle or registry entry alone.
+# ─────────────────────────────────────────────────────────────────────────────
+
+NODATA = -9999.0
+
+
+def _rasterio():
+    try:
+        import rasterio
+    except ImportError as e:
+        raise ImportError("raster prediction needs rasterio (pip install rasterio)") from e
+    return rasterio
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Model bundles
+# ─────────────────────────────────────────────────────────────────────────────
+def fit_group_model(df, gid, model_cls, target="total_biomass_tons_ha", **model_kwargs):
+    """Fit scaler + model for one feature group on every complete plot."""
+    from sklearn.preprocessing import StandardScaler
+    from model_config import model_feature_sets
+    features = list(model_feature_sets[gid])
+    data = df[features + [target]].dropna()
+    scaler = StandardScaler().fit(data[features])
+    X = pd.DataFrame(scaler.transform(data[features]), index=data.index, columns=features)
+    model = model_cls(**model_kwargs).fit(X, data[target])
+    return {"group": gid, "features": features, "target": target, "scaler": scaler,
+            "model": model, "estimator": model_cls.__name__, "model_kwargs": model_kwargs,
+            "n_plots": len(data)}
+
+
+def save_bundle(bundle, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    joblib.dump(bundle, path)
+
+
+def load_bundle(path):
+    obj = joblib.load(path)
+    if isinstance(obj, dict):
+        return obj
+    # a bare estimator from the fitted-model registry (<models>/<key>.joblib)
+    from model_registry import load_entry
+    entry = load_entry(path)
+    if entry is None:
+        raise ValueError(f"{path} is neither a model bundle nor a registry model")
+    return entry.bundle()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Predictor rasters and tiling
+# ─────────────────────────────────────────────────────────────────────────────
+def feature_rasters(raster_dir, features):
+    """{feature: (path, band)} from <dir>/<feature>.tif or band descriptions."""
+    rasterio = _rasterio()
+    found = {}
+    for f in features:
+        path = os.path.join(raster_dir, f"{f}.tif")
+        if os.path.exists(path):
+            found[f] = (path, 1)
+    if len(found) < len(features):
+        for name in sorted(os.listdir(raster_dir)):
+            if not name.lower().endswith((".tif", ".tiff")):
+                continue
+            with rasterio.open(os.path.join(raster_dir, name)) as src:
+                for b, desc in enumerate(src.descriptions, start=1):
+                    if desc in features and desc not in found:
+                        found[desc] = (src.name, b)
+    missing = [f for f in features if f not in found]
+    if missing:
+        raise FileNotFoundError(f"no raster band for {len(missing)} feature(s) in {raster_dir}: "
+                                + ", ".join(missing[:10]))
+    return {f: found[f] for f in features}
+
+
+def check_alignment(sources):
+    """All predictor rasters must share CRS, transform and size; returns that grid."""
+    rasterio = _rasterio()
+    grid = None
+    for f, (path, _) in sources.items():
+        with rasterio.open(path) as src:
+            this = (src.crs, src.transform, src.height, src.width)
+        if grid is None:
+            grid, ref = this, f
+        elif this != grid:
+            raise ValueError(f"raster for {f} is not aligned with {ref}: {this} vs {grid}")
+    return grid
+
+
+def tile_size(n_features, mem_mb, block=256):
+    """Largest tile side (multiple of block) whose working set fits mem_mb."""
+    # float32 band reads + float64 stacked/scaled copies + output per pixel
+    per_pixel = n_features * (4 + 8 + 8) + 16
+    side = int(np.sqrt(mem_mb * 2 ** 20 / per_pixel)) // block * block
+    return max(block, side)
+
+
+def tile_windows(height, width, tile):
+    from rasterio.windows import Window
+    return [Window(c, r, min(tile, width - c), min(tile, height - r))
+            for r in range(0, height, tile) for c in range(0, width, tile)]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Worker side: bundle and open datasets are set up once per process
+# ─────────────────────────────────────────────────────────────────────────────
+_WORKER = {}
+
+
+def _init_raster_worker(bundle_path, sources, n_threads, cache_mb):
+    from cv_engine import _limit_threads
+    rasterio = _rasterio()
+    _WORKER.clear()
+    _WORKER["env"] = rasterio.Env(GDAL_CACHEMAX=cache_mb)
+    _WORKER["env"].__enter__()
+    _WORKER["threads"] = _limit_threads(n_threads)
+    _WORKER["bundle"] = load_bundle(bundle_path)
+    _WORKER["datasets"] = {}
+    for f, (path, band) in sources.items():
+        if path not in _WORKER["datasets"]:
+            _WORKER["datasets"][path] = rasterio.open(path)
+    _WORKER["bands"] = [(_WORKER["datasets"][path], band) for path, band in sources.values()]
+
+
+def predict_window(window, bands, bundle, nodata=NODATA):
+    """Read one window of every feature band, scale, predict -> float32 (rows × cols)."""
+    h, w = int(window.height), int(window.width)
+    X = np.empty((h * w, len(bands)), dtype=np.float64)
+    valid = np.ones(h * w, dtype=bool)
+    for j, (ds, band) in enumerate(bands):
+        a = ds.read(band, window=window, masked=True)
+        valid &= ~np.ma.getmaskarray(a).ravel()
+        col = np.ma.getdata(a).ravel().astype(np.float64)
+        valid &= np.isfinite(col)
+        X[:, j] = col
+    out = np.full(h * w, nodata, dtype=np.float32)
+    if valid.any():
+        Xv = pd.DataFrame(bundle["scaler"].transform(
+            pd.DataFrame(X[valid], columns=bundle["features"])), columns=bundle["features"])
+        if bundle.get("binning") is not None:
+            Xv = bundle["binning"].transform(Xv)
+        out[valid] = np.asarray(bundle["model"].predict(Xv), dtype=np.float32).ravel()
+    return out.reshape(h, w), int(valid.sum())
+
+
+def _predict_task(window):
+    t0 = time.perf_counter()
+    arr, n_valid = predict_window(window, _WORKER["bands"], _WORKER["bundle"])
+    return window, arr, n_valid, time.perf_counter() - t0
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Driver
+# ─────────────────────────────────────────────────────────────────────────────
+def predict_raster(bundle_path, raster_dir, out_path, n_workers=-1, mem_mb=512, block=256,
+                   compress="deflate", n_threads=1):
+    rasterio = _rasterio()
+    bundle = load_bundle(bundle_path)
+    sources = feature_rasters(raster_dir, bundle["features"])
+    crs, transform, height, width = check_alignment(sources)
+    n_workers = os.cpu_count() if n_workers in (-1, None) else n_workers
+    tile = tile_size(len(sources), mem_mb, block)
+    windows = tile_windows(height, width, tile)
+    print(f"{bundle['estimator']} on {bundle['group']} ({len(sources)} features): "
+          f"{height}×{width} px, {len(windows)} tiles of {tile}², {n_workers} workers × {mem_mb} MB")
+
+    profile = {"driver": "GTiff", "height": height, "width": width, "count": 1,
+               "dtype": "float32", "crs": crs, "transform": transform, "nodata": NODATA,
+               "tiled": True, "blockxsize": block, "blockysize": block,
+               "compress": compress, "predictor": 3, "BIGTIFF": "IF_SAFER"}
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    tmp_path = out_path + ".part"
+
+    t0 = time.perf_counter()
+    n_valid, busy = 0, 0.0
+    cache_mb = max(16, min(256, mem_mb // 4))
+    with rasterio.open(tmp_path, "w", **profile) as dst, \
+            ProcessPoolExecutor(max_workers=n_workers, initializer=_init_raster_worker,
+                                initargs=(bundle_path, sources, n_threads, cache_mb)) as pool:
+        dst.update_tags(group=bundle["group"], estimator=bundle["estimator"],
+                        target=bundle["target"], features=",".join(bundle["features"]))
+        todo = iter(windows)
+        running = set()
+        done = 0
+        while True:
+            while len(running) < 2 * n_workers:
+                window = next(todo, None)
+                if window is None:
+                    break
+                running.add(pool.submit(_predict_task, window))
+            if not running:
+                break
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                window, arr, nv, secs = fut.result()
+                dst.write(arr, 1, window=window)
+                n_valid += nv
+                busy += secs
+                done += 1
+            if done % max(1, len(windows) // 10) == 0 or done == len(windows):
+                print(f"  {done}/{len(windows)} tiles, {time.perf_counter() - t0:.1f} s")
+    os.replace(tmp_path, out_path)
+
+    wall = time.perf_counter() - t0
+    stats = {"out": out_path, "pixels": height * width, "valid_pixels": n_valid,
+             "tiles": len(windows), "tile": tile, "wall_s": wall,
+             "mpix_per_s": height * width / wall / 1e6, "worker_busy_s": busy}
+    print(f"Wrote {out_path}: {n_valid:,} valid px, {stats['mpix_per_s']:.2f} Mpx/s")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tiled wall-to-wall biomass prediction")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("fit", help="fit scaler + model on all plots of a group")
+    p.add_argument("--config", default="experiments.json")
+    p.add_argument("--group", default="G16")
+    p.add_argument("--estimator", default="XGB_TD_Regressor")
+    p.add_argument("--exclude-cut-plots", action="store_true")
+    p.add_argument("--out", required=True)
+
+    p = sub.add_parser("predict", help="apply a model bundle to predictor rasters")
+    p.add_argument("bundle")
+    p.add_argument("raster_dir")
+    p.add_argument("out")
+    p.add_argument("--workers", type=int, default=-1)
+    p.add_argument("--mem-mb", type=int, default=512, help="memory budget per worker")
+    p.add_argument("--block", type=int, default=256)
+
+    p = sub.add_parser("demo", help="synthetic plots + rasters, fit and predict end to end")
+    p.add_argument("--out-dir", default="raster_demo")
+    p.add_argument("--group", default="G16")
+    p.add_argument("--estimator", default="XGB_TD_Regressor")
+    p.add_argument("--rows", type=int, default=2000)
+    p.add_argument("--cols", type=int, default=2000)
+    p.add_argument("--workers", type=int, default=-1)
+    p.add_argument("--mem-mb", type=int, default=256)
+    args = parser.parse_args()
+
+    import json
+
+    if args.cmd == "fit":
+        from run_experiments import load_population, resolve_estimator
+        with open(args.config) as f:
+            config = json.load(f)
+        df = load_population(config, args.exclude_cut_plots)
+        bundle = fit_group_model(df, args.group, resolve_estimator(args.estimator),
+                                 config.get("target", "total_biomass_tons_ha"),
+                                 **config.get("model_kwargs", {}))
+        save_bundle(bundle, args.out)
+        print(f"Saved {args.estimator}/{args.group} ({bundle['n_plots']} plots) to {args.out}")
+    elif args.cmd == "predict":
+        predict_raster(args.bundle, args.raster_dir, args.out, args.workers, args.mem_mb, args.block)
+    else:
+        from run_experiments import resolve_estimator
+        from synthetic_fia import make_synthetic_fia, write_synthetic_rasters
+        df, _ = make_synthetic_fia(1000, seed=0)
+        bundle = fit_group_model(df, args.group, resolve_estimator(args.estimator), device="cpu")
+        bundle_path = os.path.join(args.out_dir, f"{args.group}_{args.estimator}.joblib")
+        save_bundle(bundle, bundle_path)
+        raster_dir = os.path.join(args.out_dir, "rasters")
+        write_synthetic_rasters(raster_dir, args.rows, args.cols,
+                                feature_sets={args.group: bundle["features"]})
+        predict_raster(bundle_path, raster_dir, os.path.join(args.out_dir, f"agb_{args.group}.tif"),
+                       args.workers, args.mem_mb)
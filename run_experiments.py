@@ -0,0 +1,301 @@
+import warnings
+warnings.filterwarnings(
+    "ignore",
+    message="X does not have valid feature names, but StandardScaler was fitted with feature names"
+)
+
+import os
+import json
+import argparse
+import itertools
+
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from sklearn.preprocessing import StandardScaler
+
+from model_config import model_feature_sets
+from data_cache   import WorkbookCache
+from fold_plan    import FoldPlan, common_plot_index, quantile_strata
+from fold_store   import FoldResultStore
+from oof_store    import OOFStore
+from stat_tests   import compare_pairs
+from cv_engine    import FoldScheduler
+from hparam_search import load_best_params, tuned_kwargs
+from task_queue   import make_backend
+from binned_cache import BinnedCache
+from fold_profiler import print_profile_summary
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Declarative experiment runner
+#
+# A JSON config lists stages (feature groups from model_feature_sets,
+# estimators, CV scheme, population, statistics). The runner
+#   1) builds one fold plan per (population, CV scheme) on the plots complete
+#      for every group of every stage using it,
+#   2) turns all stages into a DAG: unique fit jobs (estimator, group, plan,
+#      model kwargs) -> stage reports; a job needed by several stages (e.g.
+#      the G16 baseline) is a single node,
+#   3) runs every unique job once through one FoldScheduler, then fans the
+#      fold-level nRMSE out to each stage's statistics, CSV and figure.
+# "tuned_params" (best_params.json of hparam_search.py) adds the searched
+# settings of each (estimator, group) to its model kwargs. "backend", e.g.
+# {"type": "file_queue", "queue_dir": "/work/.../queue"}, sends the folds to
+# workers on other nodes (task_queue.py) instead of the local process pool.
+# "fuse" (true or "threads") fits all estimators of a fold in one task.
+# "quantize" (max bins, e.g. 255) fits the GBDTs on cached bin codes.
+#
+#   python run_experiments.py experiments.json [--stage stageC] [--dry-run]
+# ─────────────────────────────────────────────────────────────────────────────
+
+DEFAULT_NA_VALUES = ['1.#QNB', '1.#INF', '-1.#INF', 'nan', 'NaN', 'inf', '-inf']
+
+
+def resolve_estimator(cls_name):
+    # pytabkit is only imported when something is actually fitted
+    import pytabkit
+    return getattr(pytabkit, cls_name)
+
+
+def plan_key(stage):
+    cv = stage.get("cv", {})
+    return (bool(stage.get("exclude_cut_plots", False)),
+            int(cv.get("n_splits", 5)), int(cv.get("n_repeats", 10)),
+            cv.get("random_state", 42), bool(cv.get("stratified", True)))
+
+
+def stage_groups(stage):
+    base = [stage["baseline"]] if stage.get("baseline") else []
+    return list(dict.fromkeys(base + stage["groups"]))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Build the job DAG
+# ─────────────────────────────────────────────────────────────────────────────
+def build_dag(config):
+    """Return (jobs, consumers): jobs[job_id] = spec, consumers[job_id] = stage names."""
+    base_kwargs = config.get("model_kwargs", {"device": "cpu"})
+    tuned = load_best_params(config.get("tuned_params"))
+    jobs, consumers = {}, {}
+    for stage in config["stages"]:
+        for est in stage["estimators"]:
+            for gid in stage_groups(stage):
+                model_kwargs = dict(base_kwargs, **tuned_kwargs(tuned, est, gid))
+                job_id = (est, gid, plan_key(stage),
+                          json.dumps(model_kwargs, sort_keys=True))
+                jobs.setdefault(job_id, {"estimator": est, "group": gid,
+                                         "plan_key": plan_key(stage),
+                                         "model_kwargs": model_kwargs})
+                consumers.setdefault(job_id, []).append(stage["name"])
+    return jobs, consumers
+
+
+def print_dag(jobs, consumers):
+    n_fits = sum(k[2][1] * k[2][2] for k in jobs)
+    n_naive = sum(k[2][1] * k[2][2] * len(consumers[k]) for k in jobs)
+    print(f"{len(jobs)} unique fit jobs ({n_fits} folds; {n_naive} without dedup)")
+    for job_id, spec in jobs.items():
+        shared = " (shared)" if len(consumers[job_id]) > 1 else ""
+        print(f"  {spec['estimator']:>9s} {spec['group']:>6s} plan={spec['plan_key']} "
+              f"-> {', '.join(consumers[job_id])}{shared}")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Data, fold plans and scaled design matrices
+# ─────────────────────────────────────────────────────────────────────────────
+def load_population(config, exclude_cut_plots, population=None):
+    """population=(cleaned_df, cut_plt_cn) replaces the workbook, e.g. synthetic data."""
+    if population is not None:
+        cleaned_df, cut_plt_cn = population
+    else:
+        data = config["data"]
+        workbook = WorkbookCache(data["file_name"], na_values=data.get("na_values", DEFAULT_NA_VALUES))
+        cleaned_df, _ = workbook.cleaned_frame()
+        cut_plt_cn = workbook.cut_plot_cn() if exclude_cut_plots else set()
+    if exclude_cut_plots:
+        cleaned_df = cleaned_df[~cleaned_df['PLT_CN'].isin(cut_plt_cn)].copy()
+    return cleaned_df
+
+
+def build_plans(config, jobs, population=None):
+    target = config.get("target", "total_biomass_tons_ha")
+    plans = {}
+    for key in dict.fromkeys(spec["plan_key"] for spec in jobs.values()):
+        exclude_cut, n_splits, n_repeats, seed, stratified = key
+        df = load_population(config, exclude_cut, population)
+        y = df[target]
+        groups = [spec["group"] for spec in jobs.values() if spec["plan_key"] == key]
+        plot_index = common_plot_index(df, [model_feature_sets[g] for g in groups], y)
+        strata = quantile_strata(y.loc[plot_index], n_bins=10).values if stratified else None
+        plan = FoldPlan.load_or_build(f"{config['output_dir']}/fold_plans", plot_index,
+                                      n_splits=n_splits, n_repeats=n_repeats,
+                                      random_state=seed, strata=strata)
+        print(f"Fold plan {key}: {len(plot_index)} plots, {plan}")
+        plans[key] = (plan, df, y.loc[plot_index])
+    return plans
+
+
+def design_matrix(df, plot_index, gid):
+    Xg = df.loc[plot_index, model_feature_sets[gid]]
+    scaler = StandardScaler().fit(Xg)
+    return pd.DataFrame(scaler.transform(Xg), index=Xg.index, columns=Xg.columns)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Run every unique job once
+# ─────────────────────────────────────────────────────────────────────────────
+def run_jobs(config, jobs, plans, store):
+    profile_log = (f"{config['output_dir']}/fold_profile.jsonl"
+                   if config.get("profile", False) else None)
+    scheduler = FoldScheduler(n_cores=config.get("n_cores", -1), store=store,
+                              profile_log=profile_log, backend=make_backend(config.get("backend")),
+                              fuse=config.get("fuse", False), quantize=config.get("quantize"),
+                              binned_cache=BinnedCache(f"{config['output_dir']}/binned_cache"))
+    estimators = config["estimators"]
+    designs = {}
+    for job_id, spec in jobs.items():
+        plan, df, y = plans[spec["plan_key"]]
+        dkey = (spec["plan_key"], spec["group"])
+        if dkey not in designs:
+            designs[dkey] = design_matrix(df, plan.index, spec["group"])
+        scheduler.add_cv(job_id, spec["group"], resolve_estimator(estimators[spec["estimator"]]),
+                         designs[dkey], y, plan, **spec["model_kwargs"])
+    fold_nrmse = scheduler.run()
+    scheduler.report()
+    if profile_log and os.path.exists(profile_log):
+        print_profile_summary(profile_log)
+    save_oof(config, jobs, plans, scheduler.oof)
+    return {job_id: vals for (job_id, _), vals in fold_nrmse.items()}
+
+
+def save_oof(config, jobs, plans, oof):
+    """One plan table + (estimator, group) prediction arrays per fold plan."""
+    store = OOFStore(f"{config['output_dir']}/oof")
+    for key, (plan, df, y) in plans.items():
+        runs = {(spec["estimator"], spec["group"]): oof[(job_id, spec["group"])]
+                for job_id, spec in jobs.items()
+                if spec["plan_key"] == key and (job_id, spec["group"]) in oof}
+        extra = {c: df.loc[plan.index, c].values for c in ("PLT_CN", "MEASYEAR") if c in df}
+        store.save_runs(plan, y, runs, extra)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Stage statistics
+# ─────────────────────────────────────────────────────────────────────────────
+def stats_vs_baseline(stage, fold_vals):
+    """Stage C style: percent change in nRMSE against the baseline group + paired tests."""
+    ests, groups = stage["estimators"], stage["groups"]
+    tests = compare_pairs(fold_vals, [((est, gid), (est, stage["baseline"]))
+                                      for est in ests for gid in groups],
+                          n_splits=stage.get("cv", {}).get("n_splits", 5),
+                          n_perm=stage.get("n_perm", 10000),
+                          correction=stage.get("correction", "holm"),
+                          family=[est for est in ests for _ in groups])
+    rows = []
+    for r in tests.itertuples():
+        rows.append({
+            "estimator": r.a[0], "baseline_mean": r.mean_b, "group": r.a[1],
+            "pct_change": (r.mean_a - r.mean_b) / r.mean_b * 100,
+            "mean_nrmse": r.mean_a, "sd_nrmse": np.std(fold_vals[r.a]), "p_value": r.p_ttest,
+            "p_wilcoxon": r.p_wilcoxon, "p_corrected_t": r.p_corrected_t,
+            "p_permutation": r.p_permutation, "p_value_adj": r.p_ttest_adj,
+        })
+    return pd.DataFrame(rows)
+
+
+def stats_pairwise(stage, fold_vals):
+    """Stage A style: one-sided Wilcoxon + paired t per pair, Bonferroni corrected."""
+    pairs = stage.get("pairs") or list(itertools.combinations(stage["groups"], 2))
+    alpha = stage.get("alpha", 0.05)
+    ests = stage["estimators"]
+    tests = compare_pairs(fold_vals, [((est, a), (est, b)) for est in ests for a, b in pairs],
+                          alternative="greater", n_splits=stage.get("cv", {}).get("n_splits", 5),
+                          n_perm=stage.get("n_perm", 10000),
+                          correction=stage.get("correction", "bonferroni"),
+                          family=[est for est in ests for _ in pairs], alpha=alpha)
+    rows = []
+    for r in tests.itertuples():
+        rows.append({
+            "estimator": r.a[0], "group_a": r.a[1], "group_b": r.b[1],
+            "mean_nrmse_a": r.mean_a, "mean_nrmse_b": r.mean_b,
+            "p_wilcoxon": r.p_wilcoxon, "p_ttest": r.p_ttest,
+            "p_corrected_t": r.p_corrected_t, "p_permutation": r.p_permutation,
+            "p_wilcoxon_adj": r.p_wilcoxon_adj,
+            "alpha_bonferroni": alpha / len(pairs), "significant": r.significant,
+        })
+    return pd.DataFrame(rows)
+
+
+def plot_stage(stage, fold_vals, labels, out_png):
+    ests = stage["estimators"]
+    fig, axes = plt.subplots(1, len(ests), figsize=(4 * len(ests), 4), squeeze=False)
+    groups = stage_groups(stage)
+    colors = ['#3E7CB1', '#66A182', '#F5A623', '#D65A31', '#8C564B']
+    for ax, est in zip(axes[0], ests):
+        means = [np.mean(fold_vals[(est, g)]) for g in groups]
+        sds = [np.std(fold_vals[(est, g)]) for g in groups]
+        x = np.arange(len(groups))
+        ax.bar(x, means, yerr=sds, capsize=4, color=colors[:len(groups)],
+               edgecolor='black', linewidth=0.6)
+        ax.set_xticks(x)
+        ax.set_xticklabels([labels.get(g, g) for g in groups], fontsize=9, rotation=15)
+        ax.set_title(est, fontsize=11)
+        ax.set_ylabel("nRMSE", fontsize=11)
+    fig.suptitle(stage["name"])
+    plt.tight_layout()
+    fig.savefig(out_png, dpi=stage.get("dpi", 300))
+    plt.close(fig)
+
+
+def report_stage(config, stage, fold_vals):
+    out_dir = os.path.join(config["output_dir"], stage["name"])
+    os.makedirs(out_dir, exist_ok=True)
+    if stage.get("stats", "vs_baseline") == "vs_baseline":
+        df = stats_vs_baseline(stage, fold_vals)
+    else:
+        df = stats_pairwise(stage, fold_vals)
+    csv_out = os.path.join(out_dir, f"{stage['name']}_results.csv")
+    df.to_csv(csv_out, index=False)
+    plot_stage(stage, fold_vals, config.get("labels", {}),
+               os.path.join(out_dir, f"{stage['name']}_nrmse.png"))
+    print(f"[{stage['name']}] saved {csv_out}")
+    return df
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# MAIN
+# ─────────────────────────────────────────────────────────────────────────────
+def run(config, stages=None, dry_run=False, population=None):
+    if stages:
+        config = dict(config, stages=[s for s in config["stages"] if s["name"] in stages])
+    jobs, consumers = build_dag(config)
+    print_dag(jobs, consumers)
+    if dry_run:
+        return None
+
+    os.makedirs(config["output_dir"], exist_ok=True)
+    store = FoldResultStore(f"{config['output_dir']}/fold_cache")
+    plans = build_plans(config, jobs, population)
+    job_vals = run_jobs(config, jobs, plans, store)
+
+    reports = {}
+    for stage in config["stages"]:
+        # fan the shared job results out as (estimator, group) -> fold values
+        fold_vals = {(spec["estimator"], spec["group"]): job_vals[job_id]
+                     for job_id, spec in jobs.items() if stage["name"] in consumers[job_id]}
+        reports[stage["name"]] = report_stage(config, stage, fold_vals)
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run benchmark stages from a JSON config")
+    parser.add_argument("config", nargs="?", default="experiments.json")
+    parser.add_argument("--stage", action="append", help="only run these stages (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="print the job DAG and exit")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    run(config, stages=args.stage, dry_run=args.dry_run)
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Shared, read-only feature matrices for CV workers
+#
+# The scaled predictors of a feature group are written once as a C-contiguous
+# float32 .npy file (in /dev/shm when available, i.e. RAM-backed shared
+# memory). Workers receive only a SharedMatrix handle and memory-map the file,
+# so all processes share the same physical pages and nothing is pickled per
+# fold; only the rows of the current fold are copied out.
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def default_share_root():
+    shm = "/dev/shm"
+    base = shm if os.path.isdir(shm) and os.access(shm, os.W_OK) else None
+    return tempfile.mkdtemp(prefix="cv_share_", dir=base)
+
+
+class SharedMatrix:
+    """Picklable handle to a memory-mapped (X, y) pair."""
+
+    def __init__(self, x_path, y_path, shape, columns):
+        self.x_path = x_path
+        self.y_path = y_path
+        self.shape = shape
+        self.columns = columns
+
+    @classmethod
+    def create(cls, root, name, X, y):
+        os.makedirs(root, exist_ok=True)
+        x_path = os.path.join(root, f"{name}_X.npy")
+        y_path = os.path.join(root, f"{name}_y.npy")
+        if not os.path.exists(x_path):
+            np.save(x_path, np.ascontiguousarray(np.asarray(X, dtype=np.float32)))
+            np.save(y_path, np.ascontiguousarray(np.asarray(y, dtype=np.float64)))
+        return cls(x_path, y_path, tuple(np.shape(X)), [str(c) for c in getattr(X, "columns", [])])
+
+    def open(self):
+        return (np.load(self.x_path, mmap_mode="r"),
+                np.load(self.y_path, mmap_mode="r"))
+
+    def remove(self):
+        for path in (self.x_path, self.y_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def __repr__(self):
+        return f"SharedMatrix({os.path.basename(self.x_path)}, shape={self.shape})"
+
+
+def remove_share_root(root):
+    shutil.rmtree(root, ignore_errors=True)
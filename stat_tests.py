@@ -0,0 +1,218 @@
+import itertools
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm, rankdata
+from scipy.stats import t as t_dist
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Batched paired tests on fold-level CV results
+#
+# fold_vals maps a run key (a group id, or (estimator, group)) to its
+# fold-level nRMSE in fold-plan order. A list of (a, b) pairs becomes one
+# (pairs × folds) difference matrix D = a - b, and every test works on all
+# rows at once:
+#   ttest        paired t (= scipy ttest_rel)
+#   wilcoxon     signed-rank, following scipy.stats.wilcoxon's method="auto":
+#                exact null for rows without ties / zeros and at most 50
+#                differences, all 2^n sign flips of the ranks when a row has
+#                ties or zeros and n <= 13, tie-corrected normal otherwise
+#   corrected_t  Nadeau & Bengio corrected resampled t for repeated k-fold:
+#                var * (1/J + n_test/n_train), since folds of different
+#                repeats share training plots
+#   permutation  sign-flip test on the mean difference; one ±1 matrix
+#                (n_perm × folds) times D.T gives every pair's null at once
+# followed by Bonferroni / Holm / Benjamini-Hochberg within each family.
+# Pairs of unequal length (adaptive CV) compare their matched leading folds.
+# ─────────────────────────────────────────────────────────────────────────────
+
+TESTS = ("ttest", "wilcoxon", "corrected_t", "permutation")
+# largest n with the exact signed-rank null / the full sign-flip null for
+# rows with ties or zeros (as scipy's method="auto")
+WILCOXON_EXACT_MAX_N = 50
+WILCOXON_FLIP_MAX_N = 13
+CORRECTIONS = ("bonferroni", "holm", "fdr_bh", "none")
+
+
+def _p_from_t(t, df, alternative):
+    if alternative == "greater":
+        return t_dist.sf(t, df)
+    if alternative == "less":
+        return t_dist.cdf(t, df)
+    return 2 * t_dist.sf(np.abs(t), df)
+
+
+def paired_t(D, alternative="two-sided"):
+    n = D.shape[1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = D.mean(axis=1) / (D.std(axis=1, ddof=1) / np.sqrt(n))
+    return t, _p_from_t(t, n - 1, alternative)
+
+
+def corrected_resampled_t(D, n_splits, alternative="two-sided"):
+    """Nadeau & Bengio (2003) with n_test/n_train = 1/(n_splits-1)."""
+    J = D.shape[1]
+    ratio = 1.0 / (n_splits - 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = D.mean(axis=1) / np.sqrt((1.0 / J + ratio) * D.var(axis=1, ddof=1))
+    return t, _p_from_t(t, J - 1, alternative)
+
+
+@lru_cache(maxsize=None)
+def _signed_rank_pmf(n):
+    # null distribution of W+ for n untied, non-zero differences
+    pmf = np.zeros(n * (n + 1) // 2 + 1)
+    pmf[0] = 1.0
+    for k in range(1, n + 1):
+        shifted = np.zeros_like(pmf)
+        shifted[k:] = pmf[:-k]
+        pmf = 0.5 * (pmf + shifted)
+    return pmf
+
+
+def wilcoxon_signed_rank(D, alternative="two-sided"):
+    """Row-wise Wilcoxon signed-rank test, zeros dropped (zero_method='wilcox')."""
+    P, n = D.shape
+    absd = np.abs(D)
+    n_zero = (D == 0).sum(axis=1)
+    # zeros rank lowest; shifting by their count gives ranks among non-zeros
+    ranks = rankdata(absd, axis=1) - n_zero[:, None]
+    r_plus = np.where(D > 0, ranks, 0).sum(axis=1)
+    count = n - n_zero
+
+    # tie groups per row (non-zero values only) for the variance correction
+    srt = np.sort(np.where(D == 0, np.nan, absd), axis=1)
+    new_run = np.ones_like(srt, dtype=bool)
+    new_run[:, 1:] = srt[:, 1:] != srt[:, :-1]
+    run_id = np.cumsum(new_run, axis=1) + (np.arange(P) * (n + 1))[:, None]
+    valid = ~np.isnan(srt)
+    sizes = np.bincount(run_id[valid], minlength=P * (n + 1) + n + 1).reshape(-1)
+    row_of_run = np.arange(sizes.size) // (n + 1)
+    tie_term = np.bincount(row_of_run, weights=sizes.astype(float) ** 3 - sizes, minlength=P)[:P]
+    has_ties = tie_term > 0
+
+    mn = count * (count + 1) / 4
+    se = np.sqrt((count * (count + 1) * (2 * count + 1) - tie_term / 2) / 24)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = (r_plus - mn) / se
+    if alternative == "greater":
+        p = norm.sf(z)
+    elif alternative == "less":
+        p = norm.cdf(z)
+    else:
+        p = 2 * norm.sf(np.abs(z))
+
+    exact = ~has_ties & (n_zero == 0) & (count <= WILCOXON_EXACT_MAX_N)
+    for i in np.flatnonzero(exact):
+        pmf = _signed_rank_pmf(int(count[i]))
+        w = int(round(r_plus[i]))
+        sf, cdf = pmf[w:].sum(), pmf[:w + 1].sum()
+        p[i] = sf if alternative == "greater" else cdf if alternative == "less" else min(1.0, 2 * min(sf, cdf))
+
+    # ties or zeros: the signed-rank pmf no longer applies, so enumerate every
+    # sign vector over the row's fixed ranks (scipy's permutation_test branch)
+    flip = (has_ties | (n_zero > 0)) & (n <= WILCOXON_FLIP_MAX_N)
+    if flip.any():
+        signs = (np.arange(2 ** n)[:, None] >> np.arange(n)) & 1    # (2^n, n)
+        for i in np.flatnonzero(flip):
+            null = signs @ np.where(D[i] != 0, ranks[i], 0.0)
+            tol = 100 * np.finfo(float).eps * abs(r_plus[i])
+            sf, cdf = np.mean(null >= r_plus[i] - tol), np.mean(null <= r_plus[i] + tol)
+            p[i] = sf if alternative == "greater" else cdf if alternative == "less" else min(1.0, 2 * min(sf, cdf))
+    stat = r_plus if alternative != "two-sided" else np.minimum(r_plus, count * (count + 1) / 2 - r_plus)
+    return stat, p
+
+
+def sign_flip_permutation(D, n_perm=10000, alternative="two-sided", seed=0, chunk=2000):
+    """Monte-Carlo sign-flip test of mean(D) = 0 for every row; p = (1 + #extreme) / (1 + n_perm)."""
+    P, n = D.shape
+    obs = D.mean(axis=1)
+    rng = np.random.default_rng(seed)
+    extreme = np.zeros(P, dtype=np.int64)
+    tol = 1e-12 * np.maximum(1.0, np.abs(obs))
+    for start in range(0, n_perm, chunk):
+        m = min(chunk, n_perm - start)
+        signs = rng.integers(0, 2, size=(m, n), dtype=np.int8) * 2.0 - 1.0
+        null = signs @ D.T / n                                  # (m, P)
+        if alternative == "greater":
+            extreme += (null >= obs - tol).sum(axis=0)
+        elif alternative == "less":
+            extreme += (null <= obs + tol).sum(axis=0)
+        else:
+            extreme += (np.abs(null) >= np.abs(obs) - tol).sum(axis=0)
+    return obs, (1 + extreme) / (1 + n_perm)
+
+
+def adjust_pvalues(p, method="bonferroni"):
+    p = np.asarray(p, dtype=float)
+    m = p.size
+    if method == "none" or m == 0:
+        return p.copy()
+    if method == "bonferroni":
+        return np.minimum(p * m, 1.0)
+    order = np.argsort(p)
+    ps = p[order]
+    if method == "holm":
+        adj = np.maximum.accumulate(np.minimum((m - np.arange(m)) * ps, 1.0))
+    elif method == "fdr_bh":
+        adj = np.minimum.accumulate((ps * m / np.arange(1, m + 1))[::-1])[::-1]
+        adj = np.minimum(adj, 1.0)
+    else:
+        raise ValueError(f"unknown correction {method!r}; expected one of {CORRECTIONS}")
+    out = np.empty(m)
+    out[order] = adj
+    return out
+
+
+def all_pairs(keys, by=None):
+    """Every (a, b) combination, optionally only within the same by(key) (e.g. estimator)."""
+    keys = list(keys)
+    return [(a, b) for a, b in itertools.combinations(keys, 2) if by is None or by(a) == by(b)]
+
+
+def compare_pairs(fold_vals, pairs, tests=TESTS, alternative="two-sided", n_splits=None,
+                  n_perm=10000, correction="bonferroni", family=None, primary="wilcoxon",
+                  alpha=0.05, seed=0):
+    """
+    One row per (a, b) pair with mean nRMSE of both, the mean difference
+    a - b, p_<test> for every requested test and p_<test>_adj after
+    `correction` within each family (family: one label per pair, default
+    one family). `significant` = p_<primary>_adj < alpha.
+    """
+    tests = [t for t in tests if t != "corrected_t" or n_splits is not None]
+    family = np.zeros(len(pairs), dtype=int) if family is None else np.asarray(family, dtype=object)
+
+    # pairs sharing a length are tested together
+    n_of = [min(len(fold_vals[a]), len(fold_vals[b])) for a, b in pairs]
+    cols = {c: np.full(len(pairs), np.nan) for c in
+            ["mean_a", "mean_b", "mean_diff", "t_stat", "w_stat"] + [f"p_{t}" for t in tests]}
+    for n in sorted(set(n_of)):
+        rows = [i for i, m in enumerate(n_of) if m == n]
+        A = np.stack([np.asarray(fold_vals[pairs[i][0]], dtype=float)[:n] for i in rows])
+        B = np.stack([np.asarray(fold_vals[pairs[i][1]], dtype=float)[:n] for i in rows])
+        D = A - B
+        cols["mean_a"][rows], cols["mean_b"][rows] = A.mean(axis=1), B.mean(axis=1)
+        cols["mean_diff"][rows] = D.mean(axis=1)
+        if "ttest" in tests:
+            cols["t_stat"][rows], cols["p_ttest"][rows] = paired_t(D, alternative)
+        if "wilcoxon" in tests:
+            cols["w_stat"][rows], cols["p_wilcoxon"][rows] = wilcoxon_signed_rank(D, alternative)
+        if "corrected_t" in tests:
+            cols["p_corrected_t"][rows] = corrected_resampled_t(D, n_splits, alternative)[1]
+        if "permutation" in tests:
+            cols["p_permutation"][rows] = sign_flip_permutation(D, n_perm, alternative, seed)[1]
+
+    df = pd.DataFrame({"a": pd.Series(list(p[0] for p in pairs), dtype=object),
+                       "b": pd.Series(list(p[1] for p in pairs), dtype=object),
+                       "n_folds": n_of, "family": family, **cols})
+    for t in tests:
+        adj = np.empty(len(df))
+        for fam in pd.unique(df["family"]):
+            mask = (df["family"] == fam).values
+            adj[mask] = adjust_pvalues(df.loc[mask, f"p_{t}"].values, correction)
+        df[f"p_{t}_adj"] = adj
+    if primary in tests:
+        df["significant"] = df[f"p_{primary}_adj"] < alpha
+    df.attrs.update(alternative=alternative, correction=correction, n_perm=n_perm, alpha=alpha)
+    return df
@@ -0,0 +1,227 @@
+import os
+import zlib
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Synthetic FIA-like plot table
+#
+# The real unc_chao_fia_data.xlsx is confidential (~300 plots). This builds a
+# frame with the same columns as the cleaned modelling frame — every predictor
+# named in model_feature_sets plus ID, PLT_CN, MEASYEAR and the biomass
+# targets — for any number of plots (1e2 … 1e6), so the CV pipeline can be
+# scaled and benchmarked without the real data.
+#
+# Plots are driven by a few latent stand variables (canopy height, stocking,
+# hardwood share, phenology). Canopy-structure predictors (CHM / NAIP-DAP
+# profile style names) follow height; spectral predictors mix stocking,
+# hardwood share and season. Each column's loadings are seeded from its name,
+# so the same column always behaves the same way across sizes.
+# ─────────────────────────────────────────────────────────────────────────────
+
+TARGET_COLS = ['hrdwdDRYBIO_AGac_live', 'sftwdDRYBIO_AGac_live',
+               'hrdwd_biomass_tons_ha', 'sftwd_biomass_tons_ha', 'total_biomass_tons_ha',
+               'hrdwd_proportion', 'sftwd_proportion']
+STRUCTURE_TOKENS = ('chm', 'height', 'naip', 'dap', 'prof', 'rh', 'gedi')
+HEIGHT_SD = 9.0                                           # sd of gamma(4, 4.5)
+# lb/acre -> Mg/ha
+LBAC_TO_MGHA = 0.45359237 / 0.40468564224 / 1000
+
+
+def feature_columns(feature_sets=None):
+    if feature_sets is None:
+        # the real groups, only needed when no feature sets are given
+        from model_config import model_feature_sets
+        feature_sets = model_feature_sets
+    return list(dict.fromkeys(c for feats in feature_sets.values() for c in feats))
+
+
+def _column_rng(name, seed):
+    return np.random.default_rng([zlib.crc32(name.encode()), seed])
+
+
+def _latent_matrix(height, stocking, hw_share, phase):
+    # height is scaled by the plot-level SD (gamma(4, 4.5)) so plots and
+    # raster pixels share one scale
+    return np.column_stack([height / HEIGHT_SD, stocking, hw_share, np.sin(phase), np.cos(phase)])
+
+
+def _column_values(name, latent, seed):
+    crng = _column_rng(name, seed)
+    if any(tok in name.lower() for tok in STRUCTURE_TOKENS):
+        w = np.array([crng.uniform(0.6, 1.2), crng.uniform(0, 0.3), 0, 0, 0])
+    else:
+        w = np.array([crng.uniform(0, 0.2), crng.uniform(0.2, 1.0),
+                      crng.uniform(-0.6, 0.6), crng.uniform(-0.3, 0.3), crng.uniform(-0.3, 0.3)])
+    noise_sd = crng.uniform(0.05, 0.3)
+    scale, shift = crng.uniform(0.5, 2.0), crng.normal(0, 1)
+    x = latent @ w + crng.normal(0, noise_sd, size=len(latent))
+    return scale * x + shift
+
+
+def make_synthetic_fia(n_plots, feature_sets=None, seed=0, nan_frac=0.0, cut_frac=0.24,
+                       dtype=np.float32):
+    """Return (cleaned_df, cut_plt_cn) shaped like the real modelling data."""
+    rng = np.random.default_rng(seed)
+    n = int(n_plots)
+
+    # latent stand state
+    height   = rng.gamma(shape=4.0, scale=4.5, size=n)            # m
+    stocking = rng.beta(2.5, 1.5, size=n)
+    hw_share = rng.beta(1.5, 1.5, size=n)
+    phase    = rng.uniform(0, 2 * np.pi, size=n)
+
+    cols = {
+        "ID"      : np.arange(n),
+        "PLT_CN"  : 10 ** 12 + 1000 * rng.permutation(n),
+        "MEASYEAR": rng.integers(2015, 2023, size=n),
+    }
+
+    latent = _latent_matrix(height, stocking, hw_share, phase)
+    for name in feature_columns(feature_sets):
+        x = _column_values(name, latent, seed)
+        if nan_frac > 0:
+            x[rng.random(n) < nan_frac] = np.nan
+        cols[name] = x.astype(dtype)
+
+    # biomass: allometric-ish in height and stocking, split by hardwood share
+    total = 3.0 * height ** 1.25 * (0.3 + stocking) * rng.lognormal(0, 0.25, size=n)
+    total = np.maximum(total, 0.5)
+    hrdwd = total * hw_share
+    sftwd = total - hrdwd
+    cols.update({
+        'hrdwdDRYBIO_AGac_live': hrdwd / LBAC_TO_MGHA,
+        'sftwdDRYBIO_AGac_live': sftwd / LBAC_TO_MGHA,
+        'hrdwd_biomass_tons_ha': hrdwd,
+        'sftwd_biomass_tons_ha': sftwd,
+        'total_biomass_tons_ha': total,
+        'hrdwd_proportion'     : hrdwd / total,
+        'sftwd_proportion'     : sftwd / total,
+    })
+    df = pd.DataFrame(cols)
+
+    # ~24% of the real plots carry TRTCD = 10 (cutting)
+    cut_plt_cn = set(df['PLT_CN'].values[rng.random(n) < cut_frac])
+    return df, cut_plt_cn
+
+
+def write_synthetic_rasters(out_dir, n_rows, n_cols, feature_sets=None, seed=0, res=30.0,
+                            origin=(700000.0, 3900000.0), crs="EPSG:32617", nodata_frac=0.01,
+                            blocksize=256):
+    """
+    One single-band float32 GeoTIFF per predictor (<out_dir>/<feature>.tif),
+    all on the same grid (UTM 17N, `res` m pixels), from smooth latent stand
+    fields pushed through the same per-column loadings as the plot table.
+    Returns {feature: path}. Needs rasterio.
+    """
+    import rasterio
+    from rasterio.transform import from_origin
+    from scipy.ndimage import gaussian_filter
+    from scipy.stats import beta, gamma, norm
+
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    shape = (int(n_rows), int(n_cols))
+
+    def field(sigma):
+        f = gaussian_filter(rng.normal(size=shape), sigma)
+        return (f - f.mean()) / f.std()
+
+    # smooth fields mapped onto the plot-level marginals
+    height   = gamma.ppf(norm.cdf(field(6)), a=4.0, scale=4.5)
+    stocking = beta.ppf(norm.cdf(field(4)), 2.5, 1.5)
+    hw_share = beta.ppf(norm.cdf(field(10)), 1.5, 1.5)
+    phase    = 2 * np.pi * norm.cdf(field(20))
+    latent = _latent_matrix(height.ravel(), stocking.ravel(), hw_share.ravel(), phase.ravel())
+    invalid = rng.random(shape) < nodata_frac
+
+    profile = {"driver": "GTiff", "height": shape[0], "width": shape[1], "count": 1,
+               "dtype": "float32", "crs": crs, "nodata": np.nan,
+               "transform": from_origin(origin[0], origin[1], res, res),
+               "tiled": True, "blockxsize": blocksize, "blockysize": blocksize,
+               "compress": "deflate"}
+    paths = {}
+    for name in feature_columns(feature_sets):
+        x = _column_values(name, latent, seed).reshape(shape).astype(np.float32)
+        x[invalid] = np.nan
+        paths[name] = os.path.join(out_dir, f"{name}.tif")
+        with rasterio.open(paths[name], "w", **profile) as dst:
+            dst.write(x, 1)
+            dst.set_band_description(1, name)
+    return paths
+
+
+def write_synthetic_disturbance(out_dir, n_rows, n_cols, seed=0, res=25.0, origin=(700000.0, 3900000.0),
+                                crs="EPSG:32617", forest_frac=0.7, blocksize=256):
+    """
+    Biomass + GFW/LandTrendr-style disturbance GeoTIFFs on one grid:
+    biomass.tif (Mg/ha, NaN outside forest), gfw_forest_loss.tif (float
+    loss_year 0 / 2015…2022, as DisturbanceAnalysisGFW.js exports it) and
+    landtrendr_disturbance.tif (year, magnitude).
+    Disturbance comes in patches; LandTrendr sees a subset of GFW plus some of
+    its own. Returns {"biomass", "gfw", "landtrendr": path}. Needs rasterio.
+    """
+    import rasterio
+    from rasterio.transform import from_origin
+    from scipy.ndimage import gaussian_filter
+
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    shape = (int(n_rows), int(n_cols))
+
+    def field(sigma):
+        f = gaussian_filter(rng.normal(size=shape), sigma)
+        return (f - f.mean()) / f.std()
+
+    cover = field(15)
+    forest = cover > np.quantile(cover, 1 - forest_frac)
+    agb = np.where(forest, np.maximum(3.0, 100 * np.exp(0.45 * field(5))), np.nan).astype(np.float32)
+
+    patches = field(3)
+    year_field = field(25)
+    disturbed = forest & (patches > np.quantile(patches, 0.87))
+    loss_year = np.where(disturbed, 2015 + np.clip(((year_field + 2.5) / 5 * 8).astype(int), 0, 7), 0)
+    lt_keep = disturbed & (rng.random(shape) < 0.5) | (forest & (patches < np.quantile(patches, 0.01)))
+    lt_year = np.where(lt_keep, np.where(loss_year > 0, loss_year, 2015 + rng.integers(0, 8, shape)), 0)
+    lt_mag = np.where(lt_keep, -rng.uniform(100, 600, shape), 0)
+
+    base = {"driver": "GTiff", "height": shape[0], "width": shape[1], "crs": crs,
+            "transform": from_origin(origin[0], origin[1], res, res),
+            "tiled": True, "blockxsize": blocksize, "blockysize": blocksize, "compress": "deflate"}
+    paths = {k: os.path.join(out_dir, f) for k, f in
+             [("biomass", "biomass.tif"), ("gfw", "gfw_forest_loss.tif"),
+              ("landtrendr", "landtrendr_disturbance.tif")]}
+    with rasterio.open(paths["biomass"], "w", count=1, dtype="float32", nodata=np.nan, **base) as dst:
+        dst.write(agb, 1)
+    with rasterio.open(paths["gfw"], "w", count=1, dtype="float32", nodata=None, **base) as dst:
+        dst.write(loss_year.astype(np.float32), 1)
+        dst.set_band_description(1, "loss_year")
+    with rasterio.open(paths["landtrendr"], "w", count=2, dtype="float32", nodata=None, **base) as dst:
+        dst.write(lt_year.astype(np.float32), 1)
+        dst.write(lt_mag.astype(np.float32), 2)
+        dst.set_band_description(1, "disturbance_year")
+        dst.set_band_description(2, "disturbance_magnitude")
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic FIA-like plot table")
+    parser.add_argument("--n-plots", type=float, default=1e4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--nan-frac", type=float, default=0.0)
+    parser.add_argument("--out", default="synthetic_fia.parquet")
+    parser.add_argument("--rasters", nargs=2, type=int, metavar=("ROWS", "COLS"),
+                        help="also write predictor GeoTIFFs of this size next to --out")
+    args = parser.parse_args()
+
+    if args.rasters:
+        raster_dir = os.path.join(os.path.dirname(os.path.abspath(args.out)), "synthetic_rasters")
+        paths = write_synthetic_rasters(raster_dir, *args.rasters, seed=args.seed)
+        print(f"Wrote {len(paths)} predictor rasters ({args.rasters[0]}×{args.rasters[1]}) to {raster_dir}")
+
+    df, cut = make_synthetic_fia(int(args.n_plots), seed=args.seed, nan_frac=args.nan_frac)
+    df.to_parquet(args.out, index=False)
+    pd.DataFrame({'PLT_CN': sorted(cut)}).to_parquet(args.out.replace(".parquet", "_cut.parquet"), index=False)
+    print(f"Wrote {len(df)} plots × {df.shape[1]} columns to {args.out}")
@@ -0,0 +1,309 @@
+import os
+import time
+import uuid
+import pickle
+import socket
+import argparse
+import tempfile
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from cv_engine import run_payload
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Execution backends for FoldScheduler(backend=...)
+#
+# A backend takes the scheduler's fold tasks (picklable payloads that carry
+# their SharedMatrix handle) and yields (task index, result) as tasks finish.
+# The scheduler writes each result into its (run, fold) slot, so collection
+# is deterministic whatever the completion order; a task that finishes twice
+# (a retried task whose first worker was not dead after all) is only
+# counted once.
+#
+# FileQueueBackend  shared-filesystem queue for several nodes:
+#     <queue_dir>/pending/<task>.pkl        waiting
+#     <queue_dir>/running/<task>.<worker>   claimed (atomic rename); the
+#                                           worker touches it every heartbeat_s
+#     <queue_dir>/done/<task>.pkl           result
+#     <queue_dir>/failed/<task>.pkl         traceback of a failed attempt
+#     <queue_dir>/data/                     shared matrices (share_root); a
+#                                           coordinator removes its own after run()
+#   A claim whose heartbeat is older than lease_s (preempted / killed node)
+#   goes back to pending; failed tasks are retried up to max_retries times.
+#   Workers on any node:  python task_queue.py worker <queue_dir> --procs 8
+#   local_workers=n starts n such workers on this machine for the run, so
+#   the whole protocol can be tested on one node.
+# ExecutorBackend   any concurrent.futures executor (a ProcessPoolExecutor,
+#   dask's client.get_executor(), ...), with retries of failed futures;
+#   executors other than the local process / thread pools need share_root.
+#
+# Everything a worker touches (queue, data, fold store) must be on a
+# filesystem shared by all nodes, e.g. /work rather than /dev/shm.
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def _atomic_pickle(obj, path):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def _load_pickle(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def _queue_dirs(queue_dir):
+    dirs = {d: os.path.join(queue_dir, d) for d in ("pending", "running", "done", "failed", "data")}
+    for d in dirs.values():
+        os.makedirs(d, exist_ok=True)
+    return dirs
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Worker side
+# ─────────────────────────────────────────────────────────────────────────────
+def _claim(dirs, worker_id):
+    # oldest batch / most expensive task first (names sort that way)
+    for name in sorted(os.listdir(dirs["pending"])):
+        if not name.endswith(".pkl"):
+            continue
+        task_id = name[:-4]
+        pending = os.path.join(dirs["pending"], name)
+        claimed = os.path.join(dirs["running"], f"{task_id}.{worker_id}")
+        try:
+            # rename keeps the mtime, so a task queued longer than lease_s would
+            # look stale the moment it lands in running/: touch it first
+            os.utime(pending)
+            os.rename(pending, claimed)
+        except OSError:
+            continue                                   # another worker was faster
+        return task_id, claimed
+    return None, None
+
+
+def _heartbeat(path, stop, every):
+    while not stop.wait(every):
+        try:
+            os.utime(path)
+        except OSError:
+            return                                     # requeued / removed
+
+
+def worker_loop(queue_dir, worker_id=None, poll_s=0.5, heartbeat_s=10.0, idle_exit_s=None):
+    """Claim and run tasks until <queue_dir>/STOP exists or idle for idle_exit_s."""
+    dirs = _queue_dirs(queue_dir)
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    idle_since = time.time()
+    while not os.path.exists(os.path.join(queue_dir, "STOP")):
+        task_id, claimed = _claim(dirs, worker_id)
+        if task_id is None:
+            if idle_exit_s is not None and time.time() - idle_since > idle_exit_s:
+                return
+            time.sleep(poll_s)
+            continue
+        stop = threading.Event()
+        beat = threading.Thread(target=_heartbeat, args=(claimed, stop, heartbeat_s), daemon=True)
+        beat.start()
+        try:
+            result = run_payload(_load_pickle(claimed))
+            _atomic_pickle(result, os.path.join(dirs["done"], f"{task_id}.pkl"))
+        except Exception:
+            _atomic_pickle({"worker": worker_id, "traceback": traceback.format_exc()},
+                           os.path.join(dirs["failed"], f"{task_id}.pkl"))
+        finally:
+            stop.set()
+            beat.join()
+            try:
+                os.remove(claimed)
+            except OSError:
+                pass
+        idle_since = time.time()
+
+
+def run_workers(queue_dir, procs=1, **kwargs):
+    """procs worker processes on this node (e.g. one `srun` per node)."""
+    ps = [multiprocessing.Process(target=worker_loop, args=(queue_dir,),
+                                  kwargs=dict(kwargs, worker_id=f"{socket.gethostname()}-w{i}"))
+          for i in range(procs)]
+    for p in ps:
+        p.start()
+    for p in ps:
+        p.join()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Coordinator side
+# ─────────────────────────────────────────────────────────────────────────────
+class FileQueueBackend:
+    def __init__(self, queue_dir, lease_s=120.0, max_retries=2, poll_s=0.5, local_workers=0,
+                 heartbeat_s=10.0):
+        self.queue_dir = queue_dir
+        self.dirs = _queue_dirs(queue_dir)
+        self.share_root = self.dirs["data"]
+        self.lease_s = lease_s
+        self.max_retries = max_retries
+        self.poll_s = poll_s
+        self.local_workers = local_workers
+        self.heartbeat_s = min(heartbeat_s, lease_s / 3)
+        self.n_requeued = 0
+
+    def __repr__(self):
+        return (f"FileQueueBackend({self.queue_dir}, lease_s={self.lease_s}, "
+                f"max_retries={self.max_retries}, local_workers={self.local_workers})")
+
+    def _start_local(self):
+        ps = [multiprocessing.Process(
+                  target=worker_loop, args=(self.queue_dir,),
+                  kwargs={"worker_id": f"local-{os.getpid()}-{i}", "poll_s": self.poll_s,
+                          "heartbeat_s": self.heartbeat_s}, daemon=True)
+              for i in range(self.local_workers)]
+        for p in ps:
+            p.start()
+        return ps
+
+    def _requeue(self, task_id, payloads, attempts, why):
+        attempts[task_id] += 1
+        if attempts[task_id] > self.max_retries + 1:
+            raise RuntimeError(f"task {task_id} failed {attempts[task_id] - 1} times; last: {why}")
+        self.n_requeued += 1
+        _atomic_pickle(payloads[task_id], os.path.join(self.dirs["pending"], f"{task_id}.pkl"))
+
+    def map_tasks(self, payloads):
+        batch = f"{time.strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        ids = [f"{batch}_{i:06d}" for i in range(len(payloads))]
+        index = {task_id: i for i, task_id in enumerate(ids)}
+        by_id = dict(zip(ids, payloads))
+        for task_id in ids:
+            _atomic_pickle(by_id[task_id], os.path.join(self.dirs["pending"], f"{task_id}.pkl"))
+        attempts = {task_id: 1 for task_id in ids}
+        outstanding = set(ids)
+        local = self._start_local()
+        try:
+            while outstanding:
+                progressed = False
+                for name in os.listdir(self.dirs["done"]):
+                    task_id = name[:-4]
+                    if task_id not in index:
+                        continue
+                    path = os.path.join(self.dirs["done"], name)
+                    if task_id in outstanding:
+                        outstanding.discard(task_id)
+                        progressed = True
+                        yield index[task_id], _load_pickle(path)
+                    os.remove(path)
+                for name in os.listdir(self.dirs["failed"]):
+                    task_id = name[:-4]
+                    if task_id not in outstanding:
+                        continue
+                    path = os.path.join(self.dirs["failed"], name)
+                    err = _load_pickle(path)
+                    os.remove(path)
+                    self._requeue(task_id, by_id, attempts,
+                                  f"{err['worker']}:\n{err['traceback']}")
+                # claims whose worker stopped sending heartbeats
+                now = time.time()
+                for name in os.listdir(self.dirs["running"]):
+                    task_id = name.split(".", 1)[0]
+                    if task_id not in outstanding:
+                        continue
+                    path = os.path.join(self.dirs["running"], name)
+                    try:
+                        stale = now - os.path.getmtime(path) > self.lease_s
+                        if stale:
+                            os.remove(path)
+                    except OSError:
+                        continue
+                    if stale:
+                        self._requeue(task_id, by_id, attempts,
+                                      f"lease of {name.split('.', 1)[1]} expired")
+                if local and not any(p.is_alive() for p in local):
+                    local = self._start_local()          # all local workers died
+                if not progressed:
+                    time.sleep(self.poll_s)
+        finally:
+            for p in local:
+                p.terminate()
+            for p in local:
+                p.join()
+            # nothing of this batch may be left for other workers
+            for d in ("pending", "running"):
+                for name in os.listdir(self.dirs[d]):
+                    if name.startswith(batch):
+                        try:
+                            os.remove(os.path.join(self.dirs[d], name))
+                        except OSError:
+                            pass
+
+
+class ExecutorBackend:
+    # executors whose workers run on this machine and can read /dev/shm
+    LOCAL = (ProcessPoolExecutor, ThreadPoolExecutor)
+
+    def __init__(self, executor, max_retries=2, share_root=None):
+        if share_root is None and not isinstance(executor, self.LOCAL):
+            raise ValueError(f"{type(executor).__name__} workers may run on other nodes: pass "
+                             "share_root on a filesystem they all see (not /dev/shm)")
+        self.executor = executor
+        self.max_retries = max_retries
+        self.share_root = share_root
+        self.n_requeued = 0
+
+    def map_tasks(self, payloads):
+        futures = {self.executor.submit(run_payload, p): (i, 1) for i, p in enumerate(payloads)}
+        while futures:
+            for fut in as_completed(list(futures)):
+                i, attempt = futures.pop(fut)
+                try:
+                    result = fut.result()
+                except Exception:
+                    if attempt > self.max_retries:
+                        raise
+                    self.n_requeued += 1
+                    futures[self.executor.submit(run_payload, payloads[i])] = (i, attempt + 1)
+                    continue
+                yield i, result
+
+
+def make_backend(spec):
+    """Backend from a config dict, e.g. {"type": "file_queue", "queue_dir": ..., "local_workers": 0}."""
+    if not spec:
+        return None
+    spec = dict(spec)
+    kind = spec.pop("type", "file_queue")
+    if kind == "file_queue":
+        return FileQueueBackend(**spec)
+    if kind == "dask":
+        if not spec.get("share_root"):
+            raise ValueError("dask backend needs a share_root on a filesystem shared by all workers")
+        from dask.distributed import Client
+        client = Client(spec.pop("address"))
+        return ExecutorBackend(client.get_executor(), **spec)
+    raise ValueError(f"unknown backend type {kind!r}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared-filesystem CV task queue")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    w = sub.add_parser("worker", help="run workers on this node")
+    w.add_argument("queue_dir")
+    w.add_argument("--procs", type=int, default=1, help="worker processes (one task each)")
+    w.add_argument("--idle-exit", type=float, default=None, help="exit after this many idle seconds")
+    w.add_argument("--poll", type=float, default=0.5)
+    s = sub.add_parser("status", help="count tasks per state")
+    s.add_argument("queue_dir")
+    st = sub.add_parser("stop", help="ask all workers of a queue to exit")
+    st.add_argument("queue_dir")
+    args = parser.parse_args()
+
+    if args.cmd == "worker":
+        run_workers(args.queue_dir, args.procs, poll_s=args.poll, idle_exit_s=args.idle_exit)
+    elif args.cmd == "status":
+        dirs = _queue_dirs(args.queue_dir)
+        for d in ("pending", "running", "done", "failed"):
+            print(f"{d:>8s}: {len(os.listdir(dirs[d]))}")
+    else:
+        open(os.path.join(args.queue_dir, "STOP"), "w").close()